@@ -0,0 +1,135 @@
+# Indian numbering (lakh/crore) amount-to-words conversion for money fields
+
+_ONES = (
+    '', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine', 'Ten',
+    'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 'Seventeen',
+    'Eighteen', 'Nineteen'
+)
+_TENS = ('', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety')
+
+# Words for 0-99, built once so every conversion is table lookups
+_BELOW_100 = tuple(
+    _ONES[n] if n < 20 else (_TENS[n // 10] + (' ' + _ONES[n % 10] if n % 10 else ''))
+    for n in range(100)
+)
+
+# Which amount field is spelled out into which words field, per form type
+AMOUNT_WORD_FIELDS = {
+    'deposit': (('total_amount', 'amount_in_words', 'Rupees'),),
+    'dd': (('amount', 'amount_in_words', 'Rupees'),),
+    'tax_challan': (('total_amount', 'total_words', 'Rupees'),),
+    'withdrawal': (('amount', 'amount_in_words', 'Only'),)
+}
+
+# Deposit slip denominations, in the order the forms list them
+DENOMINATIONS = ('2000', '500', '200', '100', '50', '20', '10', '5', '2', '1')
+
+
+def _below_1000(n):
+    hundreds, rest = divmod(n, 100)
+    parts = []
+    if hundreds:
+        parts.append(_ONES[hundreds] + ' Hundred')
+    if rest:
+        parts.append(_BELOW_100[rest])
+    return ' '.join(parts)
+
+
+def number_to_words(n):
+    """Whole number in Indian numbering words: 250000 -> 'Two Lakh Fifty Thousand'"""
+    if n < 0:
+        return 'Minus ' + number_to_words(-n)
+    if n == 0:
+        return 'Zero'
+
+    crores, n = divmod(n, 10000000)
+    lakhs, n = divmod(n, 100000)
+    thousands, n = divmod(n, 1000)
+
+    parts = []
+    if crores:
+        # Above 99 crore the crore count itself is spelled in Indian numbering
+        parts.append(number_to_words(crores) + ' Crore')
+    if lakhs:
+        parts.append(_BELOW_100[lakhs] + ' Lakh')
+    if thousands:
+        parts.append(_BELOW_100[thousands] + ' Thousand')
+    if n:
+        parts.append(_below_1000(n))
+    return ' '.join(parts)
+
+
+def parse_rupees(amount):
+    """'5,000' / '1500.50' / 2500 -> (rupees, paise); None if it isn't an amount"""
+    text = str(amount).replace(',', '').replace('₹', '').strip()
+    if text.lower().startswith('rs'):
+        text = text[2:].lstrip('. ')
+    if not text:
+        return None
+    whole, _, fraction = text.partition('.')
+    if not whole.isdigit() or (fraction and not fraction.isdigit()):
+        return None
+    paise = int((fraction + '00')[:2]) if fraction else 0
+    return int(whole), paise
+
+
+def amount_to_words(amount, suffix='Rupees'):
+    """Money amount in words: '5000' -> 'Five Thousand Rupees'.
+
+    suffix 'Only' gives the cheque/withdrawal style 'Five Thousand Only'.
+    Returns None when amount can't be parsed.
+    """
+    parsed = parse_rupees(amount)
+    if parsed is None:
+        return None
+    rupees, paise = parsed
+    words = number_to_words(rupees)
+    if suffix == 'Only':
+        if paise:
+            return f'{words} Rupees and {number_to_words(paise)} Paise Only'
+        return f'{words} Only'
+    if paise:
+        return f'{words} {suffix} and {number_to_words(paise)} Paise'
+    return f'{words} {suffix}'
+
+
+def amounts_to_words(amounts, suffix='Rupees'):
+    """amount_to_words() for each of amounts"""
+    return [amount_to_words(amount, suffix) for amount in amounts]
+
+
+def denomination_rows(quantities):
+    """Rows of a deposit denomination table.
+
+    quantities maps a denomination ('500', ..., 'coins') to a count or, for
+    'coins', a rupee value. Returns (rows, total) where each row is
+    (denomination, quantity, value) and total is the sum of the values.
+    """
+    rows = []
+    total = 0
+    for denom in DENOMINATIONS + ('coins',):
+        raw = quantities.get(denom)
+        if raw in (None, ''):
+            continue
+        try:
+            qty = int(str(raw).replace(',', ''))
+        except ValueError:
+            continue
+        value = qty if denom == 'coins' else qty * int(denom)
+        rows.append((denom, qty, value))
+        total += value
+    return rows, total
+
+
+def fill_amount_words(form_type, data):
+    """Set each words field of data from its amount field, in place.
+
+    Returns the list of words keys that were (re)computed.
+    """
+    filled = []
+    for amount_key, words_key, suffix in AMOUNT_WORD_FIELDS.get(form_type, ()):
+        words = amount_to_words(data[amount_key], suffix) if data.get(amount_key) else None
+        if words:
+            data[words_key] = words
+            filled.append(words_key)
+    return filled
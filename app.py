@@ -1,25 +1,67 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-import google.generativeai as genai
+from flask import Flask, Request, render_template, request, jsonify, redirect, url_for, Response, stream_with_context, g
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 from pathlib import Path
 import tempfile
 import time
-import base64
 import json
-import re
-import traceback
-from openai import OpenAI
-from groq import Groq
-from form_prompts import get_system_prompt  # Import form-specific prompts
+import asyncio
+import hmac
+import logging
+from functools import lru_cache
+from form_prompts import get_system_prompt, get_form_instruction, preload_prompts, estimate_tokens  # Import form-specific prompts
+from form_data_stream import FormDataStreamParser
+from form_data_parser import parse_response
+from provider_dispatch import ProviderAttempt, ProviderDispatcher, attempt_key
+from key_scheduler import KeyScheduler
+from intents import classify, skip_reply, confirmation_reply, CONFIRM, SKIP, REPLIES as INTENT_REPLIES
+from opening_cache import OpeningTurnCache, normalize_message, prefix_hash, LOOKUPS as OPENING_LOOKUPS
+from session_store import (create_session_store, SessionLocks, SessionBusy, replayed_reply, remember_reply,
+                           REPLAYS as SESSION_REPLAYS, BUSY as SESSION_BUSY)
+from providers import (openrouter_clients, groq_clients, gemini_model,
+                       async_openrouter_clients, async_groq_clients, GEMINI_MODEL)
+from prompt_cache import GeminiContextCache, record_openai_usage, record_gemini_usage, get_cache_stats
+from history_compactor import compact_history, record_compaction, get_compaction_stats, history_tokens
+from field_extractors import extract_fields, validation_reply, check_form_data
+from form_specs import FORM_SPECS, get_form_spec
+from static_pages import StaticPages
+from audio_ingest import (AudioRejected, TranscriptCache, ingest, audio_part, too_large, stream_factory,
+                          AUDIO_MAX_BYTES, FORM_OVERHEAD_BYTES)
+from audio_preprocess import preprocess
+from amount_words import fill_amount_words, denomination_rows
+from structured_log import configure_logging, start_request, current_request_id, get_log_stats
+from token_budget import (plan_budget, escalate, openrouter_params, groq_params, gemini_params,
+                          record_turn_usage, count_truncation, CONFIRMATION_QUESTION)
+from metrics import (stage, timed_request, observe_attempt, count_retry, form_label,
+                     STAGE_SECONDS, register_collector, gauge_lines, render_metrics)
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Levelled JSON logs on a background writer (LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE, LOG_REDACT)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+class UploadRequest(Request):
+    """Request whose file parts stream straight into an AudioSpool, so an
+    upload is copied out of the body once instead of once by werkzeug and
+    again by ingest()"""
+    # The other form fields are small; a body with more than this of them is refused
+    max_form_memory_size = FORM_OVERHEAD_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return stream_factory(total_content_length, content_type, filename, content_length)
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # Configure Flask app
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24).hex())
+# Bodies past the audio cap are refused while they are still being read
+app.config['MAX_CONTENT_LENGTH'] = AUDIO_MAX_BYTES + FORM_OVERHEAD_BYTES
 
 # API Keys from environment variables
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -28,121 +70,195 @@ OPENROUTER_API_KEY_2 = os.getenv('OPENROUTER_API_KEY_2')
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 GROQ_API_KEY_2 = os.getenv('GROQ_API_KEY_2')
 
-# Validate API keys
+# Validate API keys; the pages work without them, so a missing key is only
+# reported here and fails the calls that need it
 if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is not set!")
+    logger.warning("GEMINI_API_KEY not set: voice input and Gemini fallbacks will fail")
 if not OPENROUTER_API_KEY:
-    print("WARNING: Primary OPENROUTER_API_KEY not set!")
-
-# Initialize OpenRouter clients (primary and backup)
-openrouter_clients = []
-if OPENROUTER_API_KEY:
-    openrouter_clients.append(OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY
-    ))
-if OPENROUTER_API_KEY_2:
-    openrouter_clients.append(OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY_2
-    ))
-
-# Initialize Groq clients (fallback)
-groq_clients = []
-if GROQ_API_KEY:
-    groq_clients.append(Groq(api_key=GROQ_API_KEY))
-if GROQ_API_KEY_2:
-    groq_clients.append(Groq(api_key=GROQ_API_KEY_2))
-
-# Store conversation history and collected form data per session
-conversation_sessions = {}
-form_data_sessions = {}
+    logger.warning("Primary OPENROUTER_API_KEY not set!")
+
+# OpenRouter (primary and backup), Groq (fallback) and Gemini clients are
+# created once per worker in providers.py, on first use, and reuse
+# keep-alive connections; their SDKs are imported only then
+
+# Per-call timeouts (seconds) and hedging: if the current key has not answered
+# within HEDGE_AFTER_SECONDS the next key is fired too (0 disables hedging)
+OPENROUTER_TIMEOUT = float(os.getenv('OPENROUTER_TIMEOUT', '30'))
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', '20'))
+HEDGE_AFTER_SECONDS = float(os.getenv('HEDGE_AFTER_SECONDS', '0'))
+# A reply cut off by its token cap is retried with a larger cap only if at
+# least this much of the attempt's timeout is left; the retry gets what is left
+ESCALATE_MIN_SECONDS = float(os.getenv('ESCALATE_MIN_SECONDS', '2'))
+
+# Exchanges sent verbatim to the model; older ones are summarised (0 = send all)
+HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', '6'))
+
+# Validate account numbers, Aadhaar, PAN, dates etc. locally before calling a model
+LOCAL_VALIDATION = os.getenv('LOCAL_VALIDATION', '1') != '0'
+
+# Answer "yes" to the summary and "skip" for optional fields without a model call
+LOCAL_INTENTS = os.getenv('LOCAL_INTENTS', '1') != '0'
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Spreads calls over the keys by their per-minute request/token budgets
+key_scheduler = KeyScheduler()
+
+provider_dispatcher = ProviderDispatcher(
+    hedge_after=HEDGE_AFTER_SECONDS,
+    max_workers=int(os.getenv('PROVIDER_MAX_WORKERS', '8')),
+    scheduler=key_scheduler
+)
+
+# First replies of conversations ("hi" -> greeting + first question), per worker
+opening_cache = OpeningTurnCache()
+
+# Build every form's system prompt once per worker instead of on each request
+preload_prompts()
+
+# Server-side Gemini caches of each form's prompt prefix (GEMINI_CACHE_TTL_SECONDS=0 disables)
+gemini_context_cache = GeminiContextCache(GEMINI_MODEL)
+
+# Conversation history and collected form data per session, bounded by TTL,
+# LRU and size caps (SESSION_BACKEND=sqlite shares sessions across workers)
+session_store = create_session_store()
+# A session's turns run one at a time, so overlapping posts can't interleave
+session_locks = SessionLocks()
+
+BUSY_ERROR = 'Still answering your previous message, please try again'
+
+@app.before_request
+def begin_request_log():
+    """Give every log record of this request the caller's X-Request-ID (or a new one)"""
+    g.request_started = time.monotonic()
+    start_request(request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def end_request_log(response):
+    response.headers['X-Request-ID'] = current_request_id()
+    logger.info("%s %s %s", request.method, request.path, response.status_code, extra={'fields': {
+        'duration_ms': round((time.monotonic() - g.request_started) * 1000, 1)
+    }})
+    return response
+
+# Page templates rendered once per worker and served precompressed with ETags
+static_pages = StaticPages(render_template)
+PAGE_TEMPLATES = ('home.html', 'form.html', 'dd.html', 'tax_challan.html', 'acc_new.html', 'debit.html',
+                  'loan.html', 'withdrawl.html', 'Kyc.html', 'acc_close.html', 'Remittance.html')
+with app.app_context():
+    for template in PAGE_TEMPLATES:
+        static_pages.preload(template)
+    # The assistant page only varies with ?form=; other values render per request
+    for form_type in ('',) + tuple(FORM_SPECS):
+        static_pages.preload('assistant.html', form_type=form_type)
 
 @app.route('/')
 def index():
-    return render_template('home.html')
+    return static_pages.serve('home.html')
 
 @app.route('/assistant')
 def assistant():
     form_type = request.args.get('form', '')
-    return render_template('assistant.html', form_type=form_type)
+    return static_pages.serve('assistant.html', form_type=form_type)
 
 @app.route('/form')
 def form():
-    return render_template('form.html')
+    return static_pages.serve('form.html')
 
 @app.route('/dd')
 def dd_form():
-    return render_template('dd.html')
+    return static_pages.serve('dd.html')
 
 @app.route('/tax_challan')
 def tax_challan():
-    return render_template('tax_challan.html')
+    return static_pages.serve('tax_challan.html')
 
 @app.route('/account_opening')
 def account_opening():
-    return render_template('acc_new.html')
+    return static_pages.serve('acc_new.html')
 
 @app.route('/debit_card')
 def debit_card():
-    return render_template('debit.html')
+    return static_pages.serve('debit.html')
 
 @app.route('/loan_application')
 def loan_application():
-    return render_template('loan.html')
+    return static_pages.serve('loan.html')
 
 @app.route('/withdrawal')
 def withdrawal():
-    return render_template('withdrawl.html')
+    return static_pages.serve('withdrawl.html')
 
 @app.route('/kyc')
 def kyc():
-    return render_template('Kyc.html')
+    return static_pages.serve('Kyc.html')
 
 @app.route('/account_closure')
 def account_closure():
-    return render_template('acc_close.html')
+    return static_pages.serve('acc_close.html')
 
 @app.route('/remittance')
 def remittance():
-    return render_template('Remittance.html')
+    return static_pages.serve('Remittance.html')
+
+TRANSCRIBE_INSTRUCTION = "Please transcribe this audio accurately. Only provide the transcription text without any additional commentary."
+
+# Transcripts by audio content hash, so a re-sent recording isn't transcribed again
+transcript_cache = TranscriptCache()
+
+
+def transcription_contents(audio):
+    """Gemini request for transcribing one clip (a part from audio_part())"""
+    return [audio, TRANSCRIBE_INSTRUCTION]
+
+
+def receive_audio(route):
+    """The request's 'audio' file as an AudioUpload, or None if there is none.
+
+    Raises AudioRejected for uploads over the size or duration caps.
+    """
+    try:
+        audio_file = request.files.get('audio')
+    except RequestEntityTooLarge:
+        raise too_large(route)
+    if audio_file is None:
+        return None
+    return ingest(audio_file, route, request.form.get('duration'))
+
 
 @app.route('/transcribe', methods=['POST'])
 def transcribe():
     try:
-        if 'audio' not in request.files:
-            return jsonify({'success': False, 'error': 'No audio file provided'}), 400
-        
-        audio_file = request.files['audio']
-        
-        # Configure Gemini with API key for audio transcription
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Read audio data directly
-        audio_data = audio_file.read()
-        
-        try:
-            # Create model for audio transcription
-            model = genai.GenerativeModel('gemini-2.5-flash-lite')
-            
-            # Send audio data directly as base64
-            response = model.generate_content([
-                {
-                    'mime_type': 'audio/webm',
-                    'data': base64.b64encode(audio_data).decode('utf-8')
-                },
-                "Please transcribe this audio accurately. Only provide the transcription text without any additional commentary."
-            ])
+        with timed_request('transcribe') as labels:
+            try:
+                with stage('transcribe', 'read_upload'):
+                    upload = receive_audio('transcribe')
+            except AudioRejected as e:
+                labels['outcome'] = 'rejected'
+                return jsonify({'success': False, 'error': str(e)}), 413
+            if upload is None:
+                labels['outcome'] = 'rejected'
+                return jsonify({'success': False, 'error': 'No audio file provided'}), 400
             
-            transcription = response.text
+            with upload:
+                text = transcript_cache.get(upload.digest, 'transcribe')
+                if text is None:
+                    with stage('transcribe', 'preprocess'):
+                        clip = preprocess(upload, 'transcribe')
+                    # Shared, already configured model for audio transcription
+                    with clip, stage('transcribe', 'provider'):
+                        model = gemini_model()
+                        with audio_part(clip, 'transcribe') as audio:
+                            text = gemini_generate(model, transcription_contents(audio)).text
+                    transcript_cache.put(upload.digest, text)
             
-            return jsonify({
-                'success': True,
-                'text': transcription
-            })
-            
-        except Exception as e:
-            raise e
+            with stage('transcribe', 'serialize'):
+                return jsonify({
+                    'success': True,
+                    'text': text
+                })
             
     except Exception as e:
         return jsonify({
@@ -150,385 +266,889 @@ def transcribe():
             'error': str(e)
         }), 500
 
+@lru_cache(maxsize=64)
+def session_prefix(form_type):
+    """Opening messages every session of a form type starts with.
+    
+    These are rebuilt from the form type instead of being stored in each
+    session, which keeps stored history small. The result is cached so every
+    request for a form type starts with a byte-identical prefix, which is what
+    provider-side prompt caching keys on; treat it as read-only.
+    """
+    # Get form-specific system prompt (cached registry lookup)
+    system_prompt = get_system_prompt(form_type)
+    
+    # If form type is pre-selected, inform the model
+    if form_type:
+        instruction = f'Understood. {get_form_instruction(form_type)}'
+    else:
+        instruction = 'Understood. I will help users with banking forms, collecting information one question at a time.'
+    
+    return (
+        {'role': 'user', 'parts': [system_prompt]},
+        {'role': 'model', 'parts': [instruction]}
+    )
+
+
+@lru_cache(maxsize=64)
+def chat_prefix(form_type):
+    """session_prefix() as OpenAI-style chat messages, built once per form type"""
+    return tuple(to_chat_message(msg) for msg in session_prefix(form_type))
+
+
+@lru_cache(maxsize=64)
+def session_prefix_hash(form_type):
+    return prefix_hash(session_prefix(form_type))
+
+
+def to_chat_message(msg):
+    role = 'assistant' if msg['role'] == 'model' else 'user'
+    return {"role": role, "content": msg['parts'][0]}
+
+
+def collected_fields(state):
+    """Everything extracted for the session so far"""
+    fields = dict(state.get('fields', {}))
+    fields.update(state['form_data'])
+    return fields
+
+
+def compacted_history(state):
+    """The conversation after the session prefix, with older turns summarised"""
+    history, stats = compact_history(state['history'], collected_fields(state), HISTORY_KEEP_TURNS)
+    record_compaction(state['form_type'], stats)
+    if stats['compacted_messages']:
+        logger.debug("Compacted %d messages, ~%d -> ~%d history tokens",
+                     stats['compacted_messages'], stats['tokens_before'], stats['tokens_after'])
+    return history
+
+
+def model_history(state):
+    """Session prefix plus the compacted conversation, as sent to the model"""
+    return list(session_prefix(state['form_type'])) + compacted_history(state)
+
+
+def gemini_request(state):
+    """(model, contents) for a Gemini call on this session.
+    
+    When the form's prefix is held in a Gemini context cache only the
+    conversation is sent; otherwise the full prefix goes with every call.
+    """
+    form_type = state['form_type']
+    prefix = session_prefix(form_type)
+    tokens = sum(estimate_tokens(msg['parts'][0]) for msg in prefix)
+    model = gemini_context_cache.model(form_type, prefix, tokens)
+    if model is not None:
+        return model, compacted_history(state)
+    return gemini_model(), model_history(state)
+
+
+def gemini_generate(model, contents, **kwargs):
+    """model.generate_content() with latency and token accounting"""
+    started = time.monotonic()
+    try:
+        response = model.generate_content(contents, **kwargs)
+    except Exception:
+        observe_attempt('Gemini', 1, 'error', time.monotonic() - started)
+        raise
+    observe_attempt('Gemini', 1, 'success', time.monotonic() - started)
+    record_gemini_usage(response.usage_metadata)
+    return response
+
+
+async def gemini_generate_async(model, contents, **kwargs):
+    """gemini_generate() on the async Gemini client"""
+    started = time.monotonic()
+    try:
+        response = await model.generate_content_async(contents, **kwargs)
+    except Exception:
+        observe_attempt('Gemini', 1, 'error', time.monotonic() - started)
+        raise
+    observe_attempt('Gemini', 1, 'success', time.monotonic() - started)
+    record_gemini_usage(response.usage_metadata)
+    return response
+
+
+def load_session(session_id, form_type):
+    """Stored session state, or a fresh one for new sessions"""
+    state = session_store.get(session_id)
+    if state is None:
+        state = {'form_type': form_type, 'history': [], 'fields': {}, 'form_data': {}}
+    return state
+
+
+def add_user_turn(session_id, state, user_message, is_from_audio, route='chat'):
+    """Append the user's message to the session and describe the turn"""
+    # Add user message to history
+    state['history'].append({
+        'role': 'user',
+        'parts': [user_message]
+    })
+    
+    return {
+        'session_id': session_id,
+        'user_message': user_message,
+        'is_from_audio': is_from_audio,
+        'state': state,
+        'route': route          # metrics label for the endpoint serving the turn
+    }
+
+
+def start_turn(data, route='chat'):
+    """Read a /chat request body, load the session and add the user's message.
+    
+    The session is only written back by finish_turn(), so a failed provider
+    call leaves no dangling user turn behind. Call with the session's lock
+    held. If the body's idempotency_key belongs to a turn that already
+    finished, the turn carries that turn's payload as 'replay' instead.
+    """
+    user_message = data.get('message', '')
+    session_id = data.get('session_id', 'default')
+    form_type = data.get('form_type', '')  # Get pre-selected form type
+    is_from_audio = data.get('is_from_audio', False)  # Check if input is from audio
+    
+    logger.debug("Turn started", extra={'fields': {
+        'session_id': session_id, 'form_type': form_type, 'is_from_audio': is_from_audio
+    }})
+    
+    with stage(route, 'load_session', form_type):
+        state = load_session(session_id, form_type)
+    key = data.get('idempotency_key') or None
+    replay = replayed_reply(state, key)
+    if replay is not None:
+        # A retry of a turn that already finished: no new model call
+        SESSION_REPLAYS.inc(route=route)
+        return {'session_id': session_id, 'state': state, 'route': route, 'replay': dict(replay, replayed=True)}
+    turn = add_user_turn(session_id, state, user_message, is_from_audio, route)
+    turn['idempotency_key'] = key
+    return turn
+
+
+def last_question(state):
+    """The assistant's most recent message before the current user turn"""
+    for msg in reversed(state['history'][:-1]):
+        if msg['role'] == 'model':
+            return msg['parts'][0]
+    return session_prefix(state['form_type'])[-1]['parts'][0]
+
+
+def check_locally(turn):
+    """Extract machine-checkable fields from the user's message into the session.
+    
+    Returns a reply asking the user to correct an invalid value (wrong account
+    number length, failed Aadhaar checksum, impossible date...), in which case
+    no model call is needed for this turn. Returns None otherwise.
+    """
+    if not LOCAL_VALIDATION:
+        return None
+    state = turn['state']
+    fields, problems = extract_fields(turn['user_message'], state['form_type'], last_question(state))
+    if fields:
+        state.setdefault('fields', {}).update(fields)
+        fill_amount_words(state['form_type'], state['fields'])
+        logger.debug("Locally extracted fields", extra={'fields': {'keys': list(fields)}})
+    if problems:
+        return validation_reply(problems)
+    return None
+
+
+def build_chat_messages(state):
+    """Convert the session history into OpenAI-style chat messages.
+    
+    The prefix comes first and is identical for every session of a form type,
+    so OpenAI-style automatic prefix caching can reuse it across sessions.
+    """
+    messages = list(chat_prefix(state['form_type']))
+    messages.extend(to_chat_message(msg) for msg in compacted_history(state))
+    return messages
+
+
+def openrouter_request(messages, budget):
+    """Keyword arguments for an OpenRouter chat completion"""
+    return {
+        'model': "openai/gpt-oss-120b:free",
+        'messages': messages,
+        **openrouter_params(budget)
+    }
+
+
+def groq_request(messages, budget):
+    """Keyword arguments for a Groq chat completion"""
+    return {
+        'model': "openai/gpt-oss-120b",
+        'messages': messages,
+        'temperature': 1,
+        'top_p': 1,
+        **groq_params(budget)
+    }
+
+
+def attempt_cost(budget):
+    """Tokens reserved against a key's per-minute limit for one call"""
+    return budget.input_tokens + budget.max_output_tokens
+
+
+def usage_tokens(usage):
+    """Prompt plus completion tokens of an OpenAI-style usage object, or None"""
+    if usage is None:
+        return None
+    return (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+
+
+def create_chat(completions, key, request_kwargs, timeout, **kwargs):
+    """completions.create() that feeds the response's rate-limit headers to the key scheduler"""
+    raw = completions.with_raw_response.create(**request_kwargs, timeout=timeout, **kwargs)
+    key_scheduler.observe(key, raw.headers)
+    return raw.parse()
+
+
+async def create_chat_async(completions, key, request_kwargs, timeout):
+    raw = await completions.with_raw_response.create(**request_kwargs, timeout=timeout)
+    key_scheduler.observe(key, raw.headers)
+    return raw.parse()
+
+
+def complete_chat(completions, build_request, provider, index, messages, budget, timeout):
+    """One chat completion under a token budget; a reply cut off by its cap
+    is retried once with the next phase's larger one, within the same timeout.
+    Returns (text, usage)"""
+    key = f"{provider}#{index}"
+    started = time.monotonic()
+    response = create_chat(completions, key, build_request(messages, budget), timeout)
+    key_scheduler.settle(key, attempt_cost(budget), usage_tokens(response.usage))
+    if response.choices[0].finish_reason == 'length':
+        wider = escalate(budget)
+        remaining = timeout - (time.monotonic() - started)
+        if wider is not None and remaining >= ESCALATE_MIN_SECONDS:
+            count_truncation(provider, budget)
+            record_openai_usage(provider, response.usage)
+            budget = wider
+            key_scheduler.reserve(key, attempt_cost(budget))
+            response = create_chat(completions, key, build_request(messages, budget), remaining)
+            key_scheduler.settle(key, attempt_cost(budget), usage_tokens(response.usage))
+    record_openai_usage(provider, response.usage)
+    return response.choices[0].message.content, record_turn_usage(provider, budget, response.usage)
+
+
+async def complete_chat_async(completions, build_request, provider, index, messages, budget, timeout):
+    """complete_chat() on an async client"""
+    key = f"{provider}#{index}"
+    started = time.monotonic()
+    response = await create_chat_async(completions, key, build_request(messages, budget), timeout)
+    key_scheduler.settle(key, attempt_cost(budget), usage_tokens(response.usage))
+    if response.choices[0].finish_reason == 'length':
+        wider = escalate(budget)
+        remaining = timeout - (time.monotonic() - started)
+        if wider is not None and remaining >= ESCALATE_MIN_SECONDS:
+            count_truncation(provider, budget)
+            record_openai_usage(provider, response.usage)
+            budget = wider
+            key_scheduler.reserve(key, attempt_cost(budget))
+            response = await create_chat_async(completions, key, build_request(messages, budget), remaining)
+            key_scheduler.settle(key, attempt_cost(budget), usage_tokens(response.usage))
+    record_openai_usage(provider, response.usage)
+    return response.choices[0].message.content, record_turn_usage(provider, budget, response.usage)
+
+
+def chat_attempts(messages, budget, usage, stream=False):
+    """OpenRouter keys first, then Groq keys, as dispatcher attempts.
+    
+    Each attempt stores its token usage report in usage under its
+    attempt_key(), so the caller can pick the winner's.
+    """
+    cost = attempt_cost(budget)
+    attempts = []
+    for i, client in enumerate(openrouter_clients(), 1):
+        def call(timeout, client=client, i=i):
+            if stream:
+                return create_chat(client.chat.completions, f"OpenRouter#{i}",
+                                   openrouter_request(messages, budget), timeout, stream=True)
+            text, usage[f"OpenRouter#{i}"] = complete_chat(
+                client.chat.completions, openrouter_request, 'OpenRouter', i, messages, budget, timeout
+            )
+            return text
+        attempts.append(ProviderAttempt('OpenRouter', i, OPENROUTER_TIMEOUT, call, cost))
+    for i, groq_client in enumerate(groq_clients(), 1):
+        def call(timeout, groq_client=groq_client, i=i):
+            if stream:
+                return create_chat(groq_client.chat.completions, f"Groq#{i}",
+                                   groq_request(messages, budget), timeout, stream=True)
+            text, usage[f"Groq#{i}"] = complete_chat(
+                groq_client.chat.completions, groq_request, 'Groq', i, messages, budget, timeout
+            )
+            return text
+        attempts.append(ProviderAttempt('Groq', i, GROQ_TIMEOUT, call, cost))
+    return attempts
+
+
+def chat_attempts_async(messages, budget, usage):
+    """Async counterpart of chat_attempts() for the ASGI server"""
+    cost = attempt_cost(budget)
+    attempts = []
+    for i, client in enumerate(async_openrouter_clients(), 1):
+        async def call(timeout, client=client, i=i):
+            text, usage[f"OpenRouter#{i}"] = await complete_chat_async(
+                client.chat.completions, openrouter_request, 'OpenRouter', i, messages, budget, timeout
+            )
+            return text
+        attempts.append(ProviderAttempt('OpenRouter', i, OPENROUTER_TIMEOUT, call, cost))
+    for i, groq_client in enumerate(async_groq_clients(), 1):
+        async def call(timeout, groq_client=groq_client, i=i):
+            text, usage[f"Groq#{i}"] = await complete_chat_async(
+                groq_client.chat.completions, groq_request, 'Groq', i, messages, budget, timeout
+            )
+            return text
+        attempts.append(ProviderAttempt('Groq', i, GROQ_TIMEOUT, call, cost))
+    return attempts
+
+
+def normalize_form_data(extracted_data):
+    """Flatten denomination tables and fill derived totals, in place"""
+    # Process denomination breakdown if present
+    if 'denomination_breakdown' in extracted_data:
+        denom = extracted_data['denomination_breakdown']
+        for key, value in denom.items():
+            if key == 'coins':
+                extracted_data['denom_coins_qty'] = str(value)
+            else:
+                extracted_data[f'denom_{key}_qty'] = str(value)
+        del extracted_data['denomination_breakdown']
+    
+    # Ensure all denomination fields exist
+    for denom in ['2000', '500', '200', '100', '50', '20', '10', '5', 'coins']:
+        if f'denom_{denom}_qty' not in extracted_data:
+            extracted_data[f'denom_{denom}_qty'] = '0'
+    
+    # A cash deposit's total follows from its denominations when missing
+    if not extracted_data.get('total_amount') and extracted_data.get('form_type') == 'DEPOSIT':
+        rows, total = denomination_rows({
+            key[len('denom_'):-len('_qty')]: value
+            for key, value in extracted_data.items()
+            if key.startswith('denom_') and key.endswith('_qty')
+        })
+        if total:
+            extracted_data['total_amount'] = str(total)
+    
+    return extracted_data
+
+
+def parse_form_data(response_text):
+    """Find and decode the FORM_DATA JSON in a model response; returns a dict or None"""
+    parsed = parse_response(response_text)
+    if parsed.error:
+        logger.warning("Could not parse FORM_DATA: %s", parsed.error)
+    if parsed.form_data is None:
+        return None
+    return normalize_form_data(parsed.form_data)
+
+
+def add_amount_words_to_summary(response_text, state):
+    """Add the locally computed amount in words to the confirmation summary"""
+    pos = response_text.find(CONFIRMATION_QUESTION)
+    if pos == -1:
+        return response_text
+    fields = collected_fields(state)
+    words = [
+        fields[key] for key in ('amount_in_words', 'total_words')
+        if fields.get(key) and fields[key] not in response_text
+    ]
+    if not words:
+        return response_text
+    line_start = response_text.rfind('\n', 0, pos) + 1
+    lines = ''.join(f'✓ Amount in words: {w}\n' for w in words)
+    return response_text[:line_start] + lines + '\n' + response_text[line_start:]
+
+
+def finish_turn(turn, response_text):
+    """Record the assistant reply, extract any form data and build the /chat payload"""
+    session_id = turn['session_id']
+    state = turn['state']
+    
+    response_text = add_amount_words_to_summary(response_text, state)
+    
+    # Add assistant response to history
+    state['history'].append({
+        'role': 'model',
+        'parts': [response_text]
+    })
+    
+    # Extract form data if present; one pass also yields the cleaned text
+    form_complete = False
+    extracted_form_data = {}
+    
+    with stage(turn['route'], 'parse', state['form_type']):
+        parsed = parse_response(response_text)
+        if parsed.error:
+            logger.warning("Could not parse FORM_DATA: %s", parsed.error)
+        if turn.get('opening_key') and parsed.form_data is None and parsed.text:
+            opening_cache.put(turn['opening_key'], response_text)
+        if parsed.form_data is not None:
+            extracted_data = normalize_form_data(parsed.form_data)
+            form_complete = True
+            # Amount in words is computed locally rather than trusted from the model
+            form_key = state['form_type'] or str(extracted_data.get('form_type', '')).lower()
+            fill_amount_words(form_key, extracted_data)
+            # Defaults and locally validated values fill gaps the model left
+            problems = check_form_data(form_key, extracted_data, state.get('fields'))
+            if problems:
+                logger.warning("FORM_DATA does not match the %s spec: %s", form_key, problems)
+            state['form_data'].update(extracted_data)
+            extracted_form_data = extracted_data
+            # Keys only: the values are account numbers, PANs, Aadhaar numbers...
+            logger.info("Form data extracted", extra={'fields': {
+                'form_type': extracted_form_data.get('form_type'), 'keys': sorted(extracted_form_data)
+            }})
+    
+    clean_response = parsed.text
+    
+    logger.debug("Turn finished", extra={'fields': {
+        'reply_chars': len(clean_response), 'form_complete': form_complete
+    }})
+    
+    payload = {
+        'success': True,
+        'response': clean_response,
+        'session_id': session_id,
+        'form_complete': form_complete,
+        'form_data': extracted_form_data if form_complete else {},
+        # Token counts of the model call behind this reply (None for local replies)
+        'usage': turn.get('usage')
+    }
+    if 'transcript' in turn:
+        payload['transcript'] = turn['transcript']
+    # Saved with the session, so a retry with the same key gets this payload back
+    remember_reply(state, turn.get('idempotency_key'), payload)
+    
+    with stage(turn['route'], 'save_session', state['form_type']):
+        session_store.save(session_id, state)
+    return payload
+
+
+def cached_opening(turn):
+    """A cached reply to the first message of a conversation, else None.
+    
+    Cacheable turns that miss are marked with 'opening_key' so finish_turn()
+    stores the model's reply for the next conversation.
+    """
+    state = turn['state']
+    if not opening_cache.enabled or turn['is_from_audio'] or len(state['history']) != 1:
+        return None
+    form_type = state['form_type']
+    message = normalize_message(turn['user_message'])
+    # Anything extracted from the message would make a canned reply wrong
+    if message is None or state.get('fields'):
+        OPENING_LOOKUPS.inc(form_type=form_label(form_type), result='skipped')
+        return None
+    key = (form_type, session_prefix_hash(form_type), message)
+    reply, result = opening_cache.lookup(key)
+    OPENING_LOOKUPS.inc(form_type=form_label(form_type), result=result)
+    if reply is None:
+        turn['opening_key'] = key
+    return reply
+
+
+def intent_reply(turn):
+    """Reply to a bare confirmation or skip, built from the form spec and
+    the session's fields, else None"""
+    state = turn['state']
+    spec = get_form_spec(state['form_type'])
+    if not LOCAL_INTENTS or spec is None or turn['is_from_audio'] or len(state['history']) < 2:
+        return None
+    intent = classify(turn['user_message'])
+    if intent is None:
+        return None
+    question = last_question(state)
+    fields = state.setdefault('fields', {})
+    reply = None
+    if intent == CONFIRM and CONFIRMATION_QUESTION in question:
+        reply = confirmation_reply(spec, question, fields)
+    elif intent == SKIP and CONFIRMATION_QUESTION not in question:
+        skipped = skip_reply(spec, question, fields)
+        if skipped:
+            key, value, reply = skipped
+            fields[key] = value
+    INTENT_REPLIES.inc(form_type=form_label(state['form_type']), intent=intent,
+                       outcome='answered' if reply else 'model')
+    return reply
+
+
+def local_reply(turn):
+    """Reply text for turns that need no model call, else None"""
+    with stage(turn['route'], 'local_check', turn['state']['form_type']):
+        # Invalid account numbers, PANs etc. are answered without a model call
+        reply = check_locally(turn)
+        if reply is None:
+            reply = cached_opening(turn)
+        if reply is None:
+            reply = intent_reply(turn)
+        return reply
+
+
+def generate_reply(turn):
+    """Get the assistant's reply text from OpenRouter/Groq (text) or Gemini (audio)"""
+    route, form_type = turn['route'], turn['state']['form_type']
+    history = turn['state']['history']
+    if turn['is_from_audio']:
+        # Use Gemini for audio input; the history already ends with the
+        # user's message, so it goes straight to generate_content
+        with stage(route, 'prompt', form_type):
+            model, contents = gemini_request(turn['state'])
+            budget = plan_budget(form_type, history, input_tokens=history_tokens(contents))
+        with stage(route, 'provider', form_type):
+            response = gemini_generate(model, contents, generation_config=gemini_params(budget))
+        turn['usage'] = record_turn_usage('Gemini', budget, response.usage_metadata)
+        return response.text
+    
+    # Use OpenRouter with fallback to Groq for text input, skipping
+    # unhealthy keys and hedging slow ones
+    with stage(route, 'prompt', form_type):
+        messages = build_chat_messages(turn['state'])
+        budget = plan_budget(form_type, history, messages)
+    usage = {}
+    with stage(route, 'provider', form_type):
+        response_text, attempt = provider_dispatcher.call(chat_attempts(messages, budget, usage))
+    turn['usage'] = usage.get(attempt_key(attempt))
+    return response_text
+
+
+async def generate_reply_async(turn):
+    """generate_reply() on the async provider clients"""
+    route, form_type = turn['route'], turn['state']['form_type']
+    history = turn['state']['history']
+    if turn['is_from_audio']:
+        with stage(route, 'prompt', form_type):
+            # Creating a Gemini context cache is a blocking API call
+            model, contents = await asyncio.to_thread(gemini_request, turn['state'])
+            budget = plan_budget(form_type, history, input_tokens=history_tokens(contents))
+        with stage(route, 'provider', form_type):
+            response = await gemini_generate_async(model, contents, generation_config=gemini_params(budget))
+        turn['usage'] = record_turn_usage('Gemini', budget, response.usage_metadata)
+        return response.text
+    
+    with stage(route, 'prompt', form_type):
+        messages = build_chat_messages(turn['state'])
+        budget = plan_budget(form_type, history, messages)
+    usage = {}
+    with stage(route, 'provider', form_type):
+        response_text, attempt = await provider_dispatcher.call_async(chat_attempts_async(messages, budget, usage))
+    turn['usage'] = usage.get(attempt_key(attempt))
+    return response_text
+
+
+def chat_turn(data):
+    """Handle one /chat request body and return the response payload"""
+    with session_locks.hold(data.get('session_id', 'default')):
+        turn = start_turn(data)
+        if 'replay' in turn:
+            return turn['replay']
+        reply = local_reply(turn)
+        if reply is None:
+            reply = generate_reply(turn)
+        return finish_turn(turn, reply)
+
+
+async def chat_turn_async(data):
+    """chat_turn() for the ASGI server: provider calls are awaited, and
+    session store reads/writes run in a thread so they never block the loop"""
+    async with session_locks.hold_async(data.get('session_id', 'default')):
+        turn = await asyncio.to_thread(start_turn, data)
+        if 'replay' in turn:
+            return turn['replay']
+        reply = local_reply(turn)
+        if reply is None:
+            reply = await generate_reply_async(turn)
+        return await asyncio.to_thread(finish_turn, turn, reply)
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
-        data = request.get_json()
-        user_message = data.get('message', '')
-        session_id = data.get('session_id', 'default')
-        form_type = data.get('form_type', '')  # Get pre-selected form type
-        is_from_audio = data.get('is_from_audio', False)  # Check if input is from audio
-        
-        # Use Gemini ONLY for audio, OpenRouter/Groq for text
-        use_gemini = is_from_audio
+        with timed_request('chat') as labels:
+            data = request.get_json()
+            labels['form_type'] = data.get('form_type', '')
+            try:
+                payload = chat_turn(data)
+            except SessionBusy:
+                labels['outcome'] = 'busy'
+                SESSION_BUSY.inc(route='chat')
+                return jsonify({'success': False, 'error': BUSY_ERROR}), 409
+            with stage('chat', 'serialize', labels['form_type']):
+                return jsonify(payload)
         
-        # Debug logging
-        print(f"DEBUG: form_type={form_type}, is_from_audio={is_from_audio}, use_gemini={use_gemini}")
-        
-        # Initialize conversation history for new sessions
-        if session_id not in conversation_sessions:
-            conversation_sessions[session_id] = []
-            form_data_sessions[session_id] = {}
+    except Exception as e:
+        logger.exception("Error in chat")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+AUDIO_CHAT_INSTRUCTION = (
+    "The user answered by voice in the attached audio. Transcribe it accurately, then reply to it "
+    "as the assistant, following all the instructions above. Respond with JSON only: "
+    '{"transcript": "<exact words the user said>", "reply": "<your reply to the user>"}'
+)
+
+
+def chat_audio_turn(upload, session_id, form_type, idempotency_key=None):
+    """Transcribe and answer a clip in one Gemini call; returns the payload"""
+    with session_locks.hold(session_id):
+        with stage('chat_audio', 'load_session', form_type):
+            state = load_session(session_id, form_type)
+        replay = replayed_reply(state, idempotency_key)
+        if replay is not None:
+            SESSION_REPLAYS.inc(route='chat_audio')
+            return dict(replay, replayed=True)
+        with stage('chat_audio', 'prompt', form_type):
+            model, contents = gemini_request(state)
+            budget = plan_budget(form_type, state['history'], input_tokens=history_tokens(contents))
         
-        # Get form-specific system prompt (much smaller than before!)
-        system_prompt = get_system_prompt(form_type)
+        with stage('chat_audio', 'preprocess', form_type):
+            clip = preprocess(upload, 'chat_audio')
+        with clip, stage('chat_audio', 'provider', form_type):
+            with audio_part(clip, 'chat_audio') as audio:
+                contents = contents + [{
+                    'role': 'user',
+                    'parts': [audio, AUDIO_CHAT_INSTRUCTION]
+                }]
+                response = gemini_generate(
+                    model, contents,
+                    generation_config={'response_mime_type': 'application/json', **gemini_params(budget)}
+                )
         
-        # Add system prompt for first message
-        if len(conversation_sessions[session_id]) == 0:
-            conversation_sessions[session_id].append({
-                'role': 'user',
-                'parts': [system_prompt]
-            })
-            
-            # If form type is pre-selected, inform the model
-            if form_type:
-                if form_type == 'deposit':
-                    form_instruction = "The user has selected DEPOSIT SLIP. Start by greeting them and asking for the branch name."
-                elif form_type == 'dd':
-                    form_instruction = "The user has selected DEMAND DRAFT. Start by greeting them and asking for the branch name."
-                elif form_type == 'tax_challan':
-                    form_instruction = "The user has selected TAX CHALLAN ITNS-280. Start by greeting them and asking for their PAN number."
-                elif form_type == 'account_opening':
-                    form_instruction = """The user has selected ACCOUNT OPENING FORM for State Bank of India (Indian bank - INR currency, Indian citizenship assumed).
-                    
-                    IMPORTANT COLLECTION STRATEGY - ASK BY SECTIONS TO REDUCE API CALLS:
-                    
-                    1. START: Ask for branch, account type (Savings/Current/Salary), and debit card requirement together
-                    2. PERSONAL DETAILS: "Let me get your personal details. Title (Mr/Mrs/Ms), full name (first, middle, last), date of birth (DD/MM/YYYY), and place of birth"
-                    3. DOCUMENT SECTION: "For identity verification - which identity document type would you like to use (Aadhaar Card/Passport/Voter ID/Driving License)? Also provide your Aadhaar number (12 digits), PAN number (10 characters), the selected document's number, and expiry date if applicable"
-                    4. CONTACT SECTION: "Your contact details: complete residential address, city, state (select from: Andhra Pradesh, Tamil Nadu, Karnataka, Kerala, Maharashtra, Gujarat, Rajasthan, Delhi, West Bengal, Uttar Pradesh, Other), PIN code (6 digits), mobile number (with +91), and email"
-                    5. EMPLOYMENT SECTION: "Employment details: employer/company name, position/designation, monthly gross salary in rupees, and are you self-employed (yes/no)?"
-                    6. ADDITIONAL INFO: "Additional information: marital status (single/married/divorced), number of dependents, purpose of account opening (you can select multiple: Salary Credit/Savings/Business Transactions/Investments/Others - if others, please specify), and card delivery preference (Collect from Branch/Home Delivery)"
-                    
-                    DEFAULT VALUES: Nationality = Indian (pre-filled, don't ask), Currency = INR (don't mention)
-                    
-                    Start by greeting and asking for branch, account type, and debit card requirement together."""
-                elif form_type == 'debit_card':
-                    form_instruction = """The user has selected DEBIT CARD APPLICATION for AXIS BANK (NRE Account holders with POA/LOA).
-                    
-                    COLLECTION STRATEGY - ASK BY SECTIONS:
-                    
-                    1. ACCOUNT DETAILS: "Let me help you with your debit card application. I need your NRE account number (up to 20 digits), customer ID, and the full name of the POA/LOA holder (Power of Attorney or Letter of Authority holder)"
-                    2. PERSONAL INFO: "Now some personal details: mother's maiden name, date of birth, and the name you want printed on the card (max 18 characters, should not be a nickname)"
-                    3. IMAGE CARD: "Would you like an image card? If yes, please provide the desired image code"
-                    4. CARD TYPE: "Why are you applying? Is this for: New Card, Lost Card, Damaged Card, or Others? Also, is this a First or Joint application?"
-                    5. OPTIONAL FIELDS: "If you have a Cross Self ID or BIN Number, please provide them. Otherwise we can skip these"
-                    
-                    IMPORTANT: DO NOT ask for Verifying Authority Details or Office Use section - those are filled by bank staff only.
-                    
-                    Start by greeting and asking for their NRE account number, customer ID, and POA/LOA holder name."""
-                elif form_type == 'loan_application':
-                    form_instruction = """The user has selected LOAN APPLICATION FORM for State Bank of India.
-                    
-                    COLLECTION STRATEGY - ASK QUESTIONS IN SMALL, EASY GROUPS:
-                    
-                    1. BASIC: "Account number and full name"
-                    2. ADDRESS: "Complete home address with PIN code"
-                    3. PREVIOUS ADDRESS: "Have you lived at your current address for less than 3 years? If yes, provide previous address. If no, we can skip this"
-                    4. CONTACT: "Mobile number (with +91) and personal email. Do you also have a landline? (optional - can skip)"
-                    5. DOB: "Date of birth (DD/MM/YYYY)"
-                    6. MARITAL: "Marital status and number of dependents (excluding children)"
-                    7. EMPLOYER: "Employer name and your designation/grade"
-                    8. WORK LOCATION: "Employer's address and PIN code"
-                    9. EMPLOYMENT: "Is your employment Temporary or Permanent? And how long have you been working there? (e.g., 5 years 3 months)"
-                    10. WORK CONTACT: "Work email and work phone number (work phone is optional - can skip)"
-                    11. LOAN BASICS: "How much loan amount do you need (in rupees) and what's the purpose? (Home/Vehicle/Personal/Education/Business/Other)"
-                    12. REPAYMENT: "Repayment period in months and preferred method (Weekly/Fortnightly/Monthly)"
-                    13. FINANCIAL 1: "Do you have any existing CSCJ loan? If yes, what's the repayment amount? If no, just say 0 or none"
-                    14. FINANCIAL 2: "Shares amount and loan account amount (enter 0 if none for each)"
-                    15. FINANCIAL 3: "Net loan amount and total monthly salary deduction"
-                    
-                    IMPORTANT RULES:
-                    - Ask ONLY 1-3 related fields per question
-                    - DO NOT list all remaining fields when user provides partial information
-                    - Move to next question immediately after receiving current answer
-                    - DO NOT ask for Office Use Only section
-                    
-                    Start by greeting and asking for account number and full name only."""
-                elif form_type == 'withdrawal':
-                    form_instruction = """The user has selected SAVINGS BANK WITHDRAWAL FORM for State Bank of India.
-                    
-                    COLLECTION STRATEGY - Simple and Quick:
-                    
-                    This is a simple form with only 7 fields. Ask in these groups:
-                    
-                    1. ACCOUNT INFO: "Branch name, account holder name (full name as per bank records), and account number (MUST be 14 digits)"
-                    2. AMOUNT: "How much do you want to withdraw (in numbers)? Also provide the amount in words (e.g., Five Thousand Only)"
-                    3. CONTACT: "Your phone or mobile number (10 digits)"
-                    4. DATE: "Withdrawal date (DD/MM/YYYY) - or I can use today's date if you prefer"
-                    
-                    IMPORTANT: 
-                    - Account number MUST be exactly 14 digits for withdrawal forms
-                    - DO NOT ask for Office Use section - that's for bank staff.
-                    
-                    Start by greeting and asking for branch name, account holder name, and account number (14 digits) together."""
-                elif form_type == 'kyc':
-                    form_instruction = """The user has selected KYC UPDATE FORM for existing customers.
-                    
-                    COLLECTION STRATEGY - Simple and Conversational:
-                    
-                    This form updates KYC information with 12 fields. Ask in these groups:
-                    
-                    1. BASIC INFO: "Branch name (or I'll use Main Branch), your full name, and account number"
-                    2. PERSONAL: "Date of birth (DD/MM/YYYY format)"
-                    3. ADDRESS: "Complete address, village, post office, state, and PIN code (6 digits)"
-                    4. FAMILY: "Father's or husband's name, and mother's name"
-                    5. CONTACT: "Mobile number (10 digits)"
-                    
-                    IMPORTANT:
-                    - If branch not mentioned, auto-fill with "Main Branch"
-                    - Keep the conversation natural and friendly
-                    - This is for updating existing customer records
-                    
-                    Start by greeting warmly and asking for customer name and account number."""
-                elif form_type == 'account_closure':
-                    form_instruction = """The user has selected ACCOUNT CLOSURE REQUEST FORM for IDFC First Bank.
-                    
-                    COLLECTION STRATEGY - Balance-Aware and Professional:
-                    
-                    1. ACCOUNT INFO: "Customer ID (10 digits), account number to be closed (12 digits), and your full name"
-                    
-                    2. PURPOSE: "What is the reason for closing this account?"
-                    
-                    3. BALANCE CHECK: "Is there any balance remaining in your account? If yes, approximately how much?"
-                    
-                    4. IF BALANCE EXISTS, ask how they want to receive it:
-                       - If balance > ₹20,000: Offer electronic transfer, demand draft, or IDFC account (NO CASH)
-                       - If balance ≤ ₹20,000: Offer all options including cash
-                    
-                    5. BASED ON THEIR CHOICE:
-                       • Electronic Transfer: Collect beneficiary account, holder name, account type, bank name, branch/city, IFSC
-                       • Demand Draft: Just confirm (bank will prepare)
-                       • IDFC Account: Collect IDFC account number, city, holder name
-                       • Cash: Just confirm (only if < ₹20,000)
-                    
-                    6. DATE: Auto-use today's date
-                    
-                    IMPORTANT:
-                    - ALWAYS ask about balance BEFORE asking transfer details
-                    - Validate cash option based on balance amount
-                    - Customer ID must be 10 digits, Account number 12 digits
-                    
-                    Start by greeting professionally and asking for customer ID, account number, and customer name."""
-                elif form_type == 'remittance':
-                    form_instruction = """The user has selected REMITTANCE ABROAD FORM (Form A2).
-                    
-                    COLLECTION STRATEGY - Simple and Clear:
-                    
-                    This form is for sending money abroad. Collect in these groups:
-                    
-                    1. BASIC INFO: "Form number (if you have one, otherwise skip), which currency (USD, EUR, GBP, etc.), and the amount you want to send"
-                    
-                    2. YOUR DETAILS: "Your full name, complete address, and bank account number"
-                    
-                    3. REMITTANCE METHOD: "How would you like to send the money? Choose one:
-                       • Issue a Draft (DD) - Requires beneficiary name and address
-                       • Direct Bank Transfer - Requires beneficiary name, bank name/address, and account number
-                       • Travellers Cheques - Just mention this option
-                       • Foreign Currency Notes - Just mention this option"
-                    
-                    4. BASED ON METHOD:
-                       If Draft: "Beneficiary's name and complete address"
-                       If Direct Transfer: "Beneficiary's name, bank name and address, beneficiary's account number"
-                       If Travellers Cheques or Notes: Just confirm the choice
-                    
-                    5. DATE: Auto-use today's date for declaration
-                    
-                    IMPORTANT:
-                    - Currency examples: USD, EUR, GBP, AUD, CAD, JPY
-                    - AD Code and Equivalent Rs. are filled by bank (don't ask)
-                    - Only ONE remittance method can be selected
-                    
-                    Start by greeting and asking for the currency, amount, and form number (optional)."""
-                else:
-                    form_instruction = "Greet the user and ask which form they'd like to fill."
-                
-                conversation_sessions[session_id].append({
-                    'role': 'model',
-                    'parts': [f'Understood. {form_instruction}']
-                })
-            else:
-                conversation_sessions[session_id].append({
-                    'role': 'model',
-                    'parts': ['Understood. I will help users with banking forms, collecting information one question at a time.']
-                })
+        try:
+            result = json.loads(response.text)
+            transcript = str(result.get('transcript', '')).strip()
+            reply = str(result.get('reply', '')).strip()
+        except (ValueError, AttributeError):
+            # Not valid JSON: keep the reply, the transcript is unknown
+            transcript, reply = '', response.text
+        if not reply:
+            raise Exception("Empty reply from Gemini")
+        # A /transcribe fallback or a retry with the same recording reuses it
+        transcript_cache.put(upload.digest, transcript)
         
-        # Add user message to history
-        conversation_sessions[session_id].append({
-            'role': 'user',
-            'parts': [user_message]
-        })
+        turn = add_user_turn(session_id, state, transcript, True, 'chat_audio')
+        turn['idempotency_key'] = idempotency_key
+        turn['transcript'] = transcript
+        turn['usage'] = record_turn_usage('Gemini', budget, response.usage_metadata)
+        # Keep the field state in step; the reply itself already exists
+        with stage('chat_audio', 'local_check', form_type):
+            check_locally(turn)
         
-        # Generate response using OpenRouter (for text) or Gemini (for audio)
-        if use_gemini:
-            # Use Gemini for audio input
-            genai.configure(api_key=GEMINI_API_KEY)
-            model = genai.GenerativeModel('gemini-2.5-flash-lite')
-            chat = model.start_chat(history=conversation_sessions[session_id][:-1])
-            response = chat.send_message(user_message)
-            response_text = response.text
-        else:
-            # Use OpenRouter with fallback to Groq for text input
-            messages = []
-            for msg in conversation_sessions[session_id]:
-                if msg['role'] == 'user':
-                    messages.append({"role": "user", "content": msg['parts'][0]})
-                elif msg['role'] == 'model':
-                    messages.append({"role": "assistant", "content": msg['parts'][0]})
-            
-            response_text = None
-            last_error = None
+        return finish_turn(turn, reply)
+
+
+@app.route('/chat/audio', methods=['POST'])
+def chat_audio():
+    """Transcribe a voice message and answer it with a single Gemini call.
+    
+    Takes multipart form data (audio, session_id, form_type and optionally
+    duration and idempotency_key) and returns the /chat payload plus a
+    'transcript' field.
+    """
+    try:
+        with timed_request('chat_audio') as labels:
+            # The upload is checked first: reading any form field parses the whole body
+            try:
+                with stage('chat_audio', 'read_upload'):
+                    upload = receive_audio('chat_audio')
+            except AudioRejected as e:
+                labels['outcome'] = 'rejected'
+                return jsonify({'success': False, 'error': str(e)}), 413
+            session_id = request.form.get('session_id', 'default')
+            form_type = labels['form_type'] = request.form.get('form_type', '')
+            idempotency_key = request.form.get('idempotency_key')
+            if upload is None:
+                labels['outcome'] = 'rejected'
+                return jsonify({'success': False, 'error': 'No audio file provided'}), 400
             
-            # Try OpenRouter clients (primary and backup)
-            for i, client in enumerate(openrouter_clients, 1):
+            with upload:
+                transcript = transcript_cache.get(upload.digest, 'chat_audio')
                 try:
-                    print(f"DEBUG: Attempting OpenRouter API call (key #{i})...")
-                    response = client.chat.completions.create(
-                        model="openai/gpt-oss-120b:free",
-                        messages=messages,
-                        extra_body={"reasoning": {"enabled": True}}
-                    )
-                    response_text = response.choices[0].message.content
-                    print(f"DEBUG: OpenRouter key #{i} - Success!")
-                    break
-                except Exception as e:
-                    last_error = str(e)
-                    print(f"DEBUG: OpenRouter key #{i} failed: {last_error}")
-                    continue
-            
-            # If all OpenRouter keys failed, try Groq as fallback
-            if not response_text:
-                print(f"DEBUG: All OpenRouter keys failed. Trying Groq fallback...")
-                for i, groq_client in enumerate(groq_clients, 1):
-                    try:
-                        print(f"DEBUG: Attempting Groq API call (key #{i})...")
-                        completion = groq_client.chat.completions.create(
-                            model="openai/gpt-oss-120b",
-                            messages=messages,
-                            temperature=1,
-                            max_completion_tokens=8192,
-                            top_p=1,
-                            stream=False
-                        )
-                        response_text = completion.choices[0].message.content
-                        print(f"DEBUG: Groq key #{i} - Success!")
-                        break
-                    except Exception as e:
-                        last_error = str(e)
-                        print(f"DEBUG: Groq key #{i} failed: {last_error}")
-                        continue
-            
-            # If all APIs failed, raise error
-            if not response_text:
-                raise Exception(f"All API keys failed. Last error: {last_error}")
-        
-        # Add assistant response to history
-        conversation_sessions[session_id].append({
-            'role': 'model',
-            'parts': [response_text]
-        })
-        
-        # Extract form data if present
-        form_complete = False
-        extracted_form_data = {}
-        
-        print(f"\n=== DEBUG: Response from AI ===")
-        print(f"Response text: {response_text[:500]}...")  # First 500 chars
-        print(f"Contains FORM_DATA: {'{FORM_DATA:' in response_text or 'FORM_DATA' in response_text}")
-        
-        if '{FORM_DATA:' in response_text or 'FORM_DATA' in response_text:
-            form_complete = True
-            
-            # Try to find JSON data - handle both single and double curly braces
-            # Pattern 1: {{FORM_DATA: {{...}}}} (double braces)
-            match = re.search(r'\{\{FORM_DATA:\s*(\{\{.*?\}\})\}\}', response_text, re.DOTALL)
-            if match:
-                # Remove double braces from the JSON
-                json_str = match.group(1).replace('{{', '{').replace('}}', '}')
-            else:
-                # Pattern 2: {FORM_DATA: {...}} (single braces)
-                match = re.search(r'\{FORM_DATA:\s*(\{.*?\})\}', response_text, re.DOTALL)
-                if match:
-                    json_str = match.group(1)
-                else:
-                    # Pattern 3: JSON code block
-                    match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
-                    if match:
-                        json_str = match.group(1)
+                    if transcript is not None:
+                        # Heard this recording before: answer its transcript as text
+                        payload = chat_turn({'message': transcript, 'session_id': session_id,
+                                             'form_type': form_type, 'is_from_audio': True,
+                                             'idempotency_key': idempotency_key})
+                        payload['transcript'] = transcript
                     else:
-                        # Pattern 4: Direct JSON with branch_name
-                        match = re.search(r'(\{[^{}]*"branch_name"[^{}]*\})', response_text, re.DOTALL)
-                        json_str = match.group(1) if match else None
-            
-            if match and json_str:
-                try:
-                    print(f"JSON string attempted: {json_str[:200]}...")
-                    extracted_data = json.loads(json_str)
-                    
-                    # Process denomination breakdown if present
-                    if 'denomination_breakdown' in extracted_data:
-                        denom = extracted_data['denomination_breakdown']
-                        for key, value in denom.items():
-                            if key == 'coins':
-                                extracted_data['denom_coins_qty'] = str(value)
-                            else:
-                                extracted_data[f'denom_{key}_qty'] = str(value)
-                        del extracted_data['denomination_breakdown']
-                    
-                    # Ensure all denomination fields exist
-                    for denom in ['2000', '500', '200', '100', '50', '20', '10', '5', 'coins']:
-                        if f'denom_{denom}_qty' not in extracted_data:
-                            extracted_data[f'denom_{denom}_qty'] = '0'
-                    
-                    form_data_sessions[session_id].update(extracted_data)
-                    extracted_form_data = extracted_data
-                    print(f"✓ Successfully extracted form data: {extracted_form_data}")
-                    print(f"✓ Form type in data: {extracted_form_data.get('form_type', 'NOT FOUND')}")
-                except Exception as e:
-                    print(f"✗ Error parsing form data: {e}")
-                    print(f"JSON string attempted: {json_str}")
-                    form_complete = False
-            else:
-                print(f"✗ No JSON match found in response")
-                form_complete = False
-        
-        # Clean response text
-        clean_response = response_text
-        if '{FORM_DATA:' in clean_response:
-            clean_response = re.sub(r'\{FORM_DATA:.*?\}', '', clean_response, flags=re.DOTALL)
-        clean_response = re.sub(r'```json.*?```', '', clean_response, flags=re.DOTALL)
-        clean_response = clean_response.strip()
-        
-        print(f"\n=== RETURNING TO FRONTEND ===")
-        print(f"form_complete: {form_complete}")
-        print(f"form_data keys: {list(extracted_form_data.keys()) if extracted_form_data else 'EMPTY'}")
-        
-        return jsonify({
-            'success': True,
-            'response': clean_response,
-            'session_id': session_id,
-            'form_complete': form_complete,
-            'form_data': extracted_form_data if form_complete else {}
-        })
+                        payload = chat_audio_turn(upload, session_id, form_type, idempotency_key)
+                except SessionBusy:
+                    labels['outcome'] = 'busy'
+                    SESSION_BUSY.inc(route='chat_audio')
+                    return jsonify({'success': False, 'error': BUSY_ERROR}), 409
+            with stage('chat_audio', 'serialize', form_type):
+                return jsonify(payload)
         
     except Exception as e:
-        print(f"Error in chat: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error in chat audio")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+
+def stream_provider_text(turn):
+    """Yield response text deltas from the first provider that starts streaming"""
+    route, form_type = turn['route'], turn['state']['form_type']
+    history = turn['state']['history']
+    if turn['is_from_audio']:
+        with stage(route, 'prompt', form_type):
+            model, contents = gemini_request(turn['state'])
+            budget = plan_budget(form_type, history, input_tokens=history_tokens(contents))
+        started_at = time.monotonic()
+        usage = None
+        try:
+            for chunk in model.generate_content(contents, stream=True,
+                                                generation_config=gemini_params(budget)):
+                usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    yield chunk.text
+        except Exception:
+            observe_attempt('Gemini', 1, 'error', time.monotonic() - started_at)
+            raise
+        observe_attempt('Gemini', 1, 'success', time.monotonic() - started_at)
+        record_gemini_usage(usage)
+        turn['usage'] = record_turn_usage('Gemini', budget, usage)
+        return
+    
+    with stage(route, 'prompt', form_type):
+        messages = build_chat_messages(turn['state'])
+        budget = plan_budget(form_type, history, messages)
+        # Streams can't be retried once tokens reach the client, so they
+        # never get less room than a summary needs
+        if budget.phase == 'question':
+            budget = escalate(budget)
+    last_error = None
+    for number, attempt in enumerate(provider_dispatcher.order(chat_attempts(messages, budget, {}, stream=True))):
+        key = attempt_key(attempt)
+        started_at = time.monotonic()
+        started = False
+        if number:
+            count_retry(attempt.provider, attempt.index, 'fallback')
+        delay = provider_dispatcher.reserve(attempt)
+        if delay:
+            time.sleep(delay)
+        try:
+            logger.debug("Attempting %s streaming call", key)
+            for chunk in attempt.call(attempt.timeout):
+                # Providers that report usage on a stream send it on the last chunk
+                if getattr(chunk, 'usage', None):
+                    record_openai_usage(attempt.provider, chunk.usage)
+                    key_scheduler.settle(key, attempt.tokens, usage_tokens(chunk.usage))
+                    turn['usage'] = record_turn_usage(attempt.provider, budget, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    started = True
+                    yield delta
+            if started:
+                observe_attempt(attempt.provider, attempt.index, 'success', time.monotonic() - started_at)
+                provider_dispatcher.record_success(key, time.monotonic() - started_at)
+                logger.debug("%s streaming call succeeded", key)
+                return
+            raise Exception('Empty response')
+        except Exception as e:
+            observe_attempt(attempt.provider, attempt.index, 'error', time.monotonic() - started_at)
+            provider_dispatcher.record_failure(key, e)
+            # Once tokens reached the client we cannot switch providers mid-reply
+            if started:
+                raise
+            last_error = str(e)
+            logger.warning("%s failed: %s", key, last_error)
+    
+    raise Exception(f"All API keys failed. Last error: {last_error}")
+
+
+def sse_event(event, payload):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /chat but streams the reply as Server-Sent Events.
+    
+    Events: 'token' ({text}) for visible text as it arrives, 'form_data'
+    ({form_data}) once a complete FORM_DATA block has been parsed, 'done'
+    with the same payload /chat returns, and 'error' on failure.
+    """
+    request_started = time.perf_counter()
+    data = request.get_json()
+    # Held until the response is closed, i.e. for the whole stream
+    try:
+        release = session_locks.acquire(data.get('session_id', 'default'))
+    except SessionBusy:
+        SESSION_BUSY.inc(route='chat_stream')
+        return jsonify({'success': False, 'error': BUSY_ERROR}), 409
+    try:
+        turn = start_turn(data, 'chat_stream')
+        reply = None if 'replay' in turn else local_reply(turn)
+    except BaseException:
+        release()
+        raise
+    form_type = turn['state']['form_type']
+    
+    def generate():
+        parser = FormDataStreamParser()
+        chunks = []
+        with timed_request('chat_stream', request_started) as labels:
+            labels['form_type'] = form_type
+            try:
+                if 'replay' in turn:
+                    yield sse_event('token', {'text': turn['replay']['response']})
+                    yield sse_event('done', turn['replay'])
+                    return
+                if reply is not None:
+                    yield sse_event('token', {'text': reply})
+                    yield sse_event('done', finish_turn(turn, reply))
+                    return
+                
+                for delta in stream_provider_text(turn):
+                    if not chunks:
+                        # Time to first token, the latency the user actually feels
+                        STAGE_SECONDS.observe(time.perf_counter() - request_started, route='chat_stream',
+                                              stage='first_token', form_type=form_label(form_type))
+                    chunks.append(delta)
+                    for kind, text in parser.feed(delta):
+                        if kind == 'text':
+                            yield sse_event('token', {'text': text})
+                        else:
+                            form_data = parse_form_data(text)
+                            if form_data is not None:
+                                yield sse_event('form_data', {'form_data': form_data})
+                for kind, text in parser.close():
+                    yield sse_event('token', {'text': text})
+                
+                yield sse_event('done', finish_turn(turn, ''.join(chunks)))
+            except Exception as e:
+                labels['outcome'] = 'error'
+                logger.exception("Error in chat stream")
+                yield sse_event('error', {'success': False, 'error': str(e)})
+            finally:
+                release()
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Covers a client that disconnects before the stream starts
+    response.call_on_close(release)
+    return response
+
 @app.route('/get_form_data', methods=['POST'])
 def get_form_data():
     try:
         data = request.get_json()
         session_id = data.get('session_id', 'default')
         
-        if session_id in form_data_sessions:
+        state = session_store.get(session_id)
+        if state is not None:
             return jsonify({
                 'success': True,
-                'form_data': form_data_sessions[session_id]
+                'form_data': state['form_data']
             })
         else:
             return jsonify({
@@ -548,10 +1168,7 @@ def reset_conversation():
         data = request.get_json()
         session_id = data.get('session_id', 'default')
         
-        if session_id in conversation_sessions:
-            del conversation_sessions[session_id]
-        if session_id in form_data_sessions:
-            del form_data_sessions[session_id]
+        session_store.delete(session_id)
         
         return jsonify({
             'success': True,
@@ -564,6 +1181,62 @@ def reset_conversation():
             'error': str(e)
         }), 500
 
+def runtime_metrics():
+    """Values computed at scrape time: key health and rate limits, token totals, compaction and logging"""
+    health = provider_dispatcher.health_report()
+    keys = [(dict(zip(('provider', 'key_index'), key.split('#'))), h) for key, h in health.items()]
+    lines = gauge_lines('mrv_provider_key_score', 'EWMA success rate of each API key',
+                        [(labels, h['score']) for labels, h in keys])
+    lines += gauge_lines('mrv_provider_key_latency_seconds', 'EWMA latency of successful calls per API key',
+                         [(labels, h['latency']) for labels, h in keys if h['latency'] is not None])
+    lines += gauge_lines('mrv_provider_key_cooling_down', '1 while an API key is skipped after failures',
+                         [(labels, int(h['cooling_down'])) for labels, h in keys])
+    limits = [(dict(zip(('provider', 'key_index'), key.split('#'))), s)
+              for key, s in key_scheduler.snapshot().items()]
+    lines += gauge_lines('mrv_key_requests_available', 'Requests left in each API key\'s per-minute bucket',
+                         [(labels, s['requests_available']) for labels, s in limits
+                          if s['requests_available'] is not None])
+    lines += gauge_lines('mrv_key_tokens_available', 'Tokens left in each API key\'s per-minute bucket',
+                         [(labels, s['tokens_available']) for labels, s in limits
+                          if s['tokens_available'] is not None])
+    
+    usage = get_cache_stats()
+    for field, name, description in (
+        ('requests', 'mrv_provider_responses_total', 'Provider responses that reported token usage'),
+        ('prompt_tokens', 'mrv_prompt_tokens_total', 'Prompt tokens sent to each provider'),
+        ('cached_tokens', 'mrv_cached_prompt_tokens_total', 'Prompt tokens served from provider prompt caches'),
+        ('completion_tokens', 'mrv_completion_tokens_total', 'Tokens generated by each provider')
+    ):
+        lines += gauge_lines(name, description,
+                             [({'provider': p}, totals[field]) for p, totals in usage.items()], kind='counter')
+    
+    compaction = get_compaction_stats()
+    for field, name, description in (
+        ('tokens_before', 'mrv_history_tokens_before_total', 'Estimated history tokens before compaction'),
+        ('tokens_after', 'mrv_history_tokens_after_total', 'Estimated history tokens sent after compaction')
+    ):
+        lines += gauge_lines(name, description,
+                             [({'form_type': f}, totals[field]) for f, totals in compaction.items()], kind='counter')
+    
+    log = get_log_stats()
+    lines += gauge_lines('mrv_log_records_dropped_total', 'Log records dropped because the log queue was full',
+                         [({}, log['dropped'])], kind='counter')
+    lines += gauge_lines('mrv_log_queue_depth', 'Log records waiting for the writer thread', [({}, log['queued'])])
+    return lines
+
+
+register_collector(runtime_metrics)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, stage and provider metrics in the Prometheus text format"""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                 f'Bearer {METRICS_TOKEN}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 if __name__ == '__main__':
     # Get port from environment variable (Render sets PORT automatically)
     port = int(os.getenv('PORT', 5000))
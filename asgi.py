@@ -0,0 +1,254 @@
+# Async (ASGI) serving mode
+#
+# /chat, /transcribe, /get_form_data and /reset_conversation run as async
+# handlers on the async OpenAI/Groq/Gemini clients, so one worker process can
+# hold many in-flight LLM calls. Every other route (pages, /chat/stream,
+# /chat/audio) is served by the Flask app through a WSGI adapter, on a pool
+# of WSGI_FALLBACK_THREADS threads so slow requests don't queue behind each other.
+#
+# Production:
+#   uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+# or
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+import asyncio
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+
+import providers
+from structured_log import start_request, current_request_id
+from app import (app as flask_app, chat_turn_async, gemini_generate_async, session_store,
+                 transcription_contents, transcript_cache, BUSY_ERROR)
+from audio_ingest import (AudioRejected, ingest, audio_part_async, stream_factory, too_large,
+                          AUDIO_MAX_BYTES, AUDIO_SPOOL_BYTES, FORM_OVERHEAD_BYTES)
+from audio_preprocess import preprocess
+from metrics import stage, timed_request
+from session_store import SessionBusy, BUSY as SESSION_BUSY
+
+# Largest request body read by the async JSON handlers
+MAX_BODY_BYTES = 25 * 1024 * 1024
+# Audio uploads are spooled to a temp file as they arrive and capped at the
+# audio size limit
+UPLOAD_BODY_BYTES = AUDIO_MAX_BYTES + FORM_OVERHEAD_BYTES
+# Flask requests (streams, voice chat, pages) that can run at once
+WSGI_FALLBACK_THREADS = int(os.getenv('WSGI_FALLBACK_THREADS', '32'))
+
+# Threads start on first use, so forked workers don't inherit any
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_FALLBACK_THREADS, thread_name_prefix='wsgi')
+
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    """WsgiToAsgiInstance that runs the app on wsgi_executor. The stock one is
+    thread-sensitive: every request shares one thread and waits its turn."""
+
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                 executor=wsgi_executor)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+wsgi_fallback = PooledWsgiToAsgi(flask_app)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its request body arrived in full"""
+
+
+async def read_body(receive, limit=MAX_BODY_BYTES, file=None):
+    """The request body as bytes, or written into `file` (and rewound) when one is given"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            raise RequestTooLarge()
+        if file is None:
+            chunks.append(chunk)
+        else:
+            file.write(chunk)
+        if not message.get('more_body'):
+            break
+    if file is not None:
+        file.seek(0)
+        return file
+    return b''.join(chunks)
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+            (b'x-request-id', (current_request_id() or '').encode('ascii'))
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def request_header(scope, name):
+    for key, value in scope['headers']:
+        if key.decode('latin-1').lower() == name:
+            return value.decode('latin-1')
+    return ''
+
+
+async def chat(scope, body):
+    with timed_request('chat') as labels:
+        data = json.loads(body or b'{}')
+        labels['form_type'] = data.get('form_type', '')
+        try:
+            return 200, await chat_turn_async(data)
+        except SessionBusy:
+            labels['outcome'] = 'busy'
+            SESSION_BUSY.inc(route='chat')
+            return 409, {'success': False, 'error': BUSY_ERROR}
+
+
+def receive_audio(scope, body):
+    """Parse the spooled multipart body and ingest its 'audio' file (or None)"""
+    body.seek(0, io.SEEK_END)
+    # Reuse werkzeug's multipart parser on the buffered body
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': request_header(scope, 'content-type'),
+        'CONTENT_LENGTH': str(body.tell()),
+        'wsgi.input': body
+    }
+    body.seek(0)
+    try:
+        _, form, files = parse_form_data(environ, stream_factory=stream_factory,
+                                         max_form_memory_size=FORM_OVERHEAD_BYTES)
+    except RequestEntityTooLarge:
+        raise too_large('transcribe')
+    if 'audio' not in files:
+        return None
+    return ingest(files['audio'], 'transcribe', form.get('duration'))
+
+
+async def transcribe(scope, body):
+    with timed_request('transcribe') as labels:
+        try:
+            with stage('transcribe', 'read_upload'):
+                upload = await asyncio.to_thread(receive_audio, scope, body)
+        except AudioRejected as e:
+            labels['outcome'] = 'rejected'
+            return 413, {'success': False, 'error': str(e)}
+        if upload is None:
+            labels['outcome'] = 'rejected'
+            return 400, {'success': False, 'error': 'No audio file provided'}
+        with upload:
+            text = transcript_cache.get(upload.digest, 'transcribe')
+            if text is None:
+                with stage('transcribe', 'preprocess'):
+                    clip = await asyncio.to_thread(preprocess, upload, 'transcribe')
+                with clip, stage('transcribe', 'provider'):
+                    model = providers.gemini_model()
+                    async with audio_part_async(clip, 'transcribe') as audio:
+                        response = await gemini_generate_async(model, transcription_contents(audio))
+                text = response.text
+                transcript_cache.put(upload.digest, text)
+        return 200, {'success': True, 'text': text}
+
+
+async def get_form_data(scope, body):
+    data = json.loads(body or b'{}')
+    state = await asyncio.to_thread(session_store.get, data.get('session_id', 'default'))
+    if state is None:
+        return 200, {'success': False, 'error': 'No form data found for this session'}
+    return 200, {'success': True, 'form_data': state['form_data']}
+
+
+async def reset_conversation(scope, body):
+    data = json.loads(body or b'{}')
+    await asyncio.to_thread(session_store.delete, data.get('session_id', 'default'))
+    return 200, {'success': True, 'message': 'Conversation and form data reset successfully'}
+
+
+ASYNC_ROUTES = {
+    '/chat': chat,
+    '/transcribe': transcribe,
+    '/get_form_data': get_form_data,
+    '/reset_conversation': reset_conversation
+}
+
+# Handlers that take their body as a spooled file instead of bytes
+UPLOAD_ROUTES = (transcribe,)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                # Build the async clients before the first request
+                providers.async_openrouter_clients()
+                providers.async_groq_clients()
+                providers.gemini_model()
+            except Exception as e:
+                logger.warning("Provider warm-up failed: %s", e)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    handler = ASYNC_ROUTES.get(scope.get('path')) if scope['type'] == 'http' else None
+    if handler is None or scope['method'] != 'POST':
+        await wsgi_fallback(scope, receive, send)
+        return
+
+    # Each ASGI request runs in its own task, so the ID stays with this request
+    started = time.monotonic()
+    start_request(request_header(scope, 'x-request-id'))
+    try:
+        if handler in UPLOAD_ROUTES:
+            with tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_BYTES) as body:
+                await read_body(receive, UPLOAD_BODY_BYTES, body)
+                status, payload = await handler(scope, body)
+        else:
+            body = await read_body(receive)
+            status, payload = await handler(scope, body)
+    except ClientDisconnected:
+        # Nobody is left to answer, and a truncated body must not be handled
+        logger.info("POST %s dropped: client disconnected", scope['path'])
+        return
+    except RequestTooLarge:
+        status, payload = 413, {'success': False, 'error': 'Request too large'}
+    except Exception as e:
+        logger.exception("Error in %s", scope['path'])
+        status, payload = 500, {'success': False, 'error': str(e)}
+    await send_json(send, status, payload)
+    logger.info("POST %s %s", scope['path'], status, extra={'fields': {
+        'duration_ms': round((time.monotonic() - started) * 1000, 1)
+    }})
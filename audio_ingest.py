@@ -0,0 +1,297 @@
+# Bounded audio uploads: the multipart parser writes a clip out of the request
+# body once (stream_factory), hashed on the way and spooled to a temp file once
+# it outgrows AUDIO_SPOOL_BYTES, so a voice request never holds more than that
+# much audio in memory. Clips over AUDIO_INLINE_MAX_BYTES reach Gemini through
+# the File API instead of inline in the request body.
+#
+# Transcripts are cached by the clip's SHA-256, so a client that re-sends the
+# same recording (assistant.html falls back from /chat/audio to /transcribe
+# with the same blob) doesn't pay for a second transcription.
+
+import asyncio
+import hashlib
+import io
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import Counter, Histogram
+from providers import gemini_sdk
+
+# Largest clip accepted; larger uploads get a 413
+AUDIO_MAX_BYTES = int(os.getenv('AUDIO_MAX_BYTES', str(10 * 1024 * 1024)))
+# Longest recording accepted, when its length is known (WAV header or the
+# client's 'duration' field)
+AUDIO_MAX_SECONDS = float(os.getenv('AUDIO_MAX_SECONDS', '120'))
+# Clips up to this size stay in memory; larger ones go to a temp file
+AUDIO_SPOOL_BYTES = int(os.getenv('AUDIO_SPOOL_BYTES', str(1024 * 1024)))
+# Clips over this size are uploaded with the Gemini File API
+AUDIO_INLINE_MAX_BYTES = int(os.getenv('AUDIO_INLINE_MAX_BYTES', str(4 * 1024 * 1024)))
+TRANSCRIPT_CACHE_TTL_SECONDS = float(os.getenv('TRANSCRIPT_CACHE_TTL_SECONDS', '900'))
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv('TRANSCRIPT_CACHE_MAX_ENTRIES', '256'))
+
+CHUNK_BYTES = 64 * 1024
+# Multipart boundaries and the other form fields of an audio request
+FORM_OVERHEAD_BYTES = 64 * 1024
+# How long an uploaded file may stay in PROCESSING before we give up
+FILE_ACTIVE_TIMEOUT_SECONDS = 30
+
+AUDIO_BYTES = Histogram(
+    'mrv_audio_upload_bytes', 'Size of accepted audio clips, by how they were sent to Gemini',
+    ('route', 'delivery'), buckets=(16384, 65536, 262144, 1048576, 4194304, 10485760))
+REJECTED = Counter(
+    'mrv_audio_rejected_total', 'Audio uploads refused for being too large or too long',
+    ('route', 'reason'))
+TRANSCRIPT_LOOKUPS = Counter(
+    'mrv_transcript_cache_lookups_total', 'Transcript cache lookups by result (hit, miss)',
+    ('route', 'result'))
+
+
+class AudioRejected(Exception):
+    """An upload over the size or duration cap (answered with a 413)"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class AudioUpload:
+    """A received clip: its spool file, size, SHA-256 and MIME type"""
+
+    def __init__(self, file, size, digest, mime_type):
+        self.file = file
+        self.size = size
+        self.digest = digest
+        self.mime_type = mime_type
+
+    @property
+    def path(self):
+        """Path of the temp file, or None while the clip is in memory"""
+        return getattr(self.file, 'name', None)
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def too_large(route):
+    """The AudioRejected to raise for an upload over AUDIO_MAX_BYTES"""
+    REJECTED.inc(route=route, reason='size')
+    return AudioRejected(f'Recording is larger than {AUDIO_MAX_BYTES // (1024 * 1024)} MB', 'size')
+
+
+class AudioSpool:
+    """Where a clip is written as it arrives: hashed and counted on the way,
+    in memory up to spool_bytes and in a temp file after that. Bytes past
+    max_bytes are dropped and mark the clip as too large.
+
+    It is also the file werkzeug's multipart parser streams upload parts into
+    (see stream_factory), so a clip is copied out of the request only once.
+    """
+
+    def __init__(self, max_bytes=AUDIO_MAX_BYTES, spool_bytes=AUDIO_SPOOL_BYTES):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.file = io.BytesIO()
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    @property
+    def too_large(self):
+        return self.size > self.max_bytes
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.too_large:
+            return len(chunk)
+        self.digest.update(chunk)
+        if self.size > self.spool_bytes and isinstance(self.file, io.BytesIO):
+            spooled = tempfile.NamedTemporaryFile(prefix='mrv-audio-')
+            spooled.write(self.file.getvalue())
+            self.file = spooled
+        return self.file.write(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+    def upload(self, mime_type, route):
+        """The clip as an AudioUpload that takes over the spool's file;
+        raises AudioRejected (and closes the file) if it passed max_bytes"""
+        if self.too_large:
+            self.close()
+            raise too_large(route)
+        return AudioUpload(self.file, self.size, self.digest.hexdigest(), mime_type or 'audio/webm')
+
+
+def stream_factory(total_content_length=None, content_type=None, filename=None, content_length=None):
+    """werkzeug stream factory that spools every file part into an AudioSpool"""
+    return AudioSpool()
+
+
+def read_upload(stream, mime_type, route, max_bytes=AUDIO_MAX_BYTES, spool_bytes=AUDIO_SPOOL_BYTES):
+    """Copy a clip from a file-like stream into an AudioUpload, raising
+    AudioRejected as soon as it passes max_bytes"""
+    spool = AudioSpool(max_bytes, spool_bytes)
+    try:
+        while not spool.too_large:
+            chunk = stream.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return spool.upload(mime_type, route)
+
+
+def ingest(audio_file, route, client_seconds=None):
+    """read_upload() and check_duration() for an uploaded (werkzeug) file.
+    A file parsed with stream_factory is already spooled and isn't copied again."""
+    if isinstance(audio_file.stream, AudioSpool):
+        upload = audio_file.stream.upload(audio_file.mimetype, route)
+    else:
+        upload = read_upload(audio_file.stream, audio_file.mimetype, route)
+    try:
+        check_duration(upload, route, client_seconds)
+    except AudioRejected:
+        upload.close()
+        raise
+    return upload
+
+
+def _wav_seconds(upload):
+    upload.file.seek(0)
+    header = upload.file.read(44)
+    if len(header) < 44 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+    byte_rate = struct.unpack_from('<I', header, 28)[0]
+    return (upload.size - 44) / byte_rate if byte_rate else None
+
+
+def check_duration(upload, route, client_seconds=None, max_seconds=AUDIO_MAX_SECONDS):
+    """Raise AudioRejected for a recording longer than max_seconds.
+
+    The length comes from a WAV header, else from the client's own count;
+    compressed recordings without one are bounded by size alone.
+    """
+    seconds = _wav_seconds(upload)
+    if seconds is None:
+        try:
+            seconds = float(client_seconds) if client_seconds not in (None, '') else None
+        except (TypeError, ValueError):
+            seconds = None
+    if max_seconds > 0 and seconds is not None and seconds > max_seconds:
+        REJECTED.inc(route=route, reason='duration')
+        raise AudioRejected(f'Recording is longer than {max_seconds:g} seconds', 'duration')
+
+
+def _wait_until_active(file):
+    deadline = time.monotonic() + FILE_ACTIVE_TIMEOUT_SECONDS
+    while file.state.name == 'PROCESSING':
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Gemini file {file.name} is still processing')
+        time.sleep(0.5)
+        file = gemini_sdk().get_file(file.name)
+    if file.state.name != 'ACTIVE':
+        raise RuntimeError(f'Gemini could not process file {file.name}: {file.state.name}')
+    return file
+
+
+def _delete_file(name):
+    try:
+        gemini_sdk().delete_file(name)
+    except Exception:
+        pass    # uploads expire on their own after 48 hours
+
+
+@contextmanager
+def audio_part(upload, route):
+    """The Gemini content part for a clip: inline bytes for small clips, an
+    uploaded File (deleted again on exit) for large ones"""
+    if upload.size <= AUDIO_INLINE_MAX_BYTES or upload.path is None:
+        AUDIO_BYTES.observe(upload.size, route=route, delivery='inline')
+        yield {'mime_type': upload.mime_type, 'data': upload.read()}
+        return
+    AUDIO_BYTES.observe(upload.size, route=route, delivery='file')
+    upload.file.flush()
+    file = gemini_sdk().upload_file(upload.path, mime_type=upload.mime_type)
+    try:
+        yield _wait_until_active(file)
+    finally:
+        _delete_file(file.name)
+
+
+@asynccontextmanager
+async def audio_part_async(upload, route):
+    """audio_part() with the blocking File API calls run in a thread"""
+    manager = audio_part(upload, route)
+    part = await asyncio.to_thread(manager.__enter__)
+    try:
+        yield part
+    finally:
+        await asyncio.to_thread(manager.__exit__, None, None, None)
+
+
+class TranscriptCache:
+    """Bounded (TTL + LRU) map from audio content hashes to transcripts"""
+
+    def __init__(self, ttl=TRANSCRIPT_CACHE_TTL_SECONDS, max_entries=TRANSCRIPT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()   # digest -> (expires_at, transcript)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, digest, route):
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._data.get(digest)
+            if item is not None and item[0] <= time.monotonic():
+                del self._data[digest]
+                item = None
+            if item is not None:
+                self._data.move_to_end(digest)
+        TRANSCRIPT_LOOKUPS.inc(route=route, result='miss' if item is None else 'hit')
+        return None if item is None else item[1]
+
+    def put(self, digest, transcript):
+        if not self.enabled or not transcript:
+            return
+        with self._lock:
+            self._data.pop(digest, None)
+            self._data[digest] = (time.monotonic() + self.ttl, transcript)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
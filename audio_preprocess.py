@@ -0,0 +1,180 @@
+# Optional clean-up of voice recordings before transcription: the clip is
+# decoded with ffmpeg, leading/trailing silence is cut and long pauses are
+# shortened with an energy-based voice activity detector (NumPy), and the
+# result is re-encoded as 16 kHz mono Opus. Gemini bills audio by duration,
+# so the pauses users leave while thinking cost nothing once they're gone.
+#
+# Needs the ffmpeg binary on PATH and numpy; without either (or with
+# AUDIO_PREPROCESS=0) clips are sent as recorded. Any failure also falls
+# back to the original clip. numpy is imported on first use, not at start-up.
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+
+from audio_ingest import AudioUpload
+from metrics import Counter, Histogram
+
+AUDIO_PREPROCESS = os.getenv('AUDIO_PREPROCESS', '0') == '1'
+# Silences longer than this inside a recording are shortened to it
+AUDIO_MAX_PAUSE_SECONDS = float(os.getenv('AUDIO_MAX_PAUSE_SECONDS', '0.8'))
+# Frames this far above the recording's noise floor count as speech
+AUDIO_VAD_MARGIN_DB = float(os.getenv('AUDIO_VAD_MARGIN_DB', '12'))
+AUDIO_OPUS_BITRATE = os.getenv('AUDIO_OPUS_BITRATE', '24k')
+AUDIO_PREPROCESS_TIMEOUT_SECONDS = float(os.getenv('AUDIO_PREPROCESS_TIMEOUT_SECONDS', '10'))
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+# Speech kept on either side of a voiced stretch, so word edges aren't clipped
+PAD_SECONDS = 0.2
+# Frames quieter than this are silence whatever the noise floor
+MIN_SPEECH_DB = -50.0
+# Shorter recordings aren't worth a decode/encode round trip
+MIN_CLIP_SECONDS = 1.5
+OUTPUT_MIME_TYPE = 'audio/ogg'
+
+SAVED_SECONDS = Counter(
+    'mrv_audio_trimmed_seconds_total', 'Seconds of silence removed from recordings before transcription',
+    ('route',))
+SAVED_BYTES = Counter(
+    'mrv_audio_saved_bytes_total', 'Bytes saved by re-encoding recordings before transcription',
+    ('route',))
+RESULTS = Counter(
+    'mrv_audio_preprocess_total', 'Recordings by preprocessing result (trimmed, unchanged, silent, failed)',
+    ('route', 'result'))
+KEPT_RATIO = Histogram(
+    'mrv_audio_kept_ratio', 'Share of a recording left after silence trimming',
+    ('route',), buckets=(0.1, 0.25, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+
+logger = logging.getLogger(__name__)
+
+_FFMPEG = shutil.which('ffmpeg')
+_np = None
+
+
+def _numpy():
+    """numpy, imported on first use (it adds ~100 ms to start-up), or None"""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+        except ImportError:     # optional: without it clips are sent as recorded
+            numpy = False
+        _np = numpy
+    return _np or None
+
+
+def available():
+    return AUDIO_PREPROCESS and _FFMPEG is not None and _numpy() is not None
+
+
+def _ffmpeg(args, data):
+    result = subprocess.run(
+        [_FFMPEG, '-nostdin', '-hide_banner', '-loglevel', 'error'] + args,
+        input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        timeout=AUDIO_PREPROCESS_TIMEOUT_SECONDS, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip() or 'ffmpeg failed')
+    return result.stdout
+
+
+def decode(upload):
+    """16 kHz mono float samples of a clip"""
+    np = _numpy()
+    if upload.path is not None:
+        upload.file.flush()
+        source, data = upload.path, None
+    else:
+        source, data = 'pipe:0', upload.read()
+    pcm = _ffmpeg(['-i', source, '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1'], data)
+    return np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def encode(samples):
+    """Opus-in-Ogg bytes for 16 kHz mono float samples"""
+    np = _numpy()
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+    return _ffmpeg(['-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-i', 'pipe:0',
+                    '-c:a', 'libopus', '-b:a', AUDIO_OPUS_BITRATE, '-application', 'voip',
+                    '-f', 'ogg', 'pipe:1'], pcm)
+
+
+def speech_frames(samples, frame=int(SAMPLE_RATE * FRAME_SECONDS)):
+    """Boolean per frame: True where the frame's energy says speech"""
+    np = _numpy()
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    # Background noise: the quieter end of the recording, but never above
+    # MIN_SPEECH_DB, or a clip that is speech almost throughout (whose 10th
+    # percentile is speech too) would count as silent
+    floor = min(np.percentile(db, 10), MIN_SPEECH_DB)
+    return db > max(floor + AUDIO_VAD_MARGIN_DB, MIN_SPEECH_DB)
+
+
+def keep_mask(speech, pad_frames, max_pause_frames):
+    """Frames to keep: speech plus padding, with leading and trailing
+    silence dropped and inner pauses cut down to max_pause_frames"""
+    np = _numpy()
+    if pad_frames:
+        speech = np.convolve(speech.astype(np.float32), np.ones(2 * pad_frames + 1), mode='same') > 0
+    keep = speech.copy()
+    voiced = np.flatnonzero(speech)
+    if len(voiced) == 0:
+        return keep
+    # Runs of silence between the first and last voiced frame
+    gaps = np.flatnonzero(np.diff(voiced) > 1)
+    half = max_pause_frames // 2
+    for i in gaps:
+        start, end = voiced[i] + 1, voiced[i + 1]
+        if end - start > max_pause_frames:
+            keep[start:start + half] = True
+            keep[end - (max_pause_frames - half):end] = True
+        else:
+            keep[start:end] = True
+    return keep
+
+
+def trim_silence(samples):
+    """Samples with silences trimmed, or None if no speech was found"""
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    speech = speech_frames(samples, frame)
+    if not speech.any():
+        return None
+    keep = keep_mask(speech, int(PAD_SECONDS / FRAME_SECONDS), int(AUDIO_MAX_PAUSE_SECONDS / FRAME_SECONDS))
+    return samples[:len(keep) * frame].reshape(len(keep), frame)[keep].reshape(-1)
+
+
+def preprocess(upload, route):
+    """A trimmed, re-encoded copy of the clip, or the clip itself when
+    preprocessing is off, fails or wouldn't make it smaller"""
+    if not available():
+        return upload
+    try:
+        samples = decode(upload)
+        seconds = len(samples) / SAMPLE_RATE
+        if seconds < MIN_CLIP_SECONDS:
+            RESULTS.inc(route=route, result='unchanged')
+            return upload
+        trimmed = trim_silence(samples)
+        if trimmed is None:
+            # Let the model decide what a silent clip says
+            RESULTS.inc(route=route, result='silent')
+            return upload
+        data = encode(trimmed)
+    except Exception as e:
+        logger.warning("Audio preprocessing failed, sending the clip as recorded: %s", e)
+        RESULTS.inc(route=route, result='failed')
+        return upload
+    if len(data) >= upload.size:
+        RESULTS.inc(route=route, result='unchanged')
+        return upload
+    kept = len(trimmed) / SAMPLE_RATE
+    RESULTS.inc(route=route, result='trimmed')
+    SAVED_SECONDS.inc(seconds - kept, route=route)
+    SAVED_BYTES.inc(upload.size - len(data), route=route)
+    KEPT_RATIO.observe(kept / seconds, route=route)
+    return AudioUpload(io.BytesIO(data), len(data), upload.digest, OUTPUT_MIME_TYPE)
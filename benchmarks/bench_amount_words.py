@@ -0,0 +1,27 @@
+# Micro-benchmark for amount_words (correctness is covered by
+# tests/test_amount_words.py)
+#
+# Run from the project root:  python benchmarks/bench_amount_words.py
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amount_words import amount_to_words, amounts_to_words  # noqa: E402
+
+
+def benchmark(count=10000, repeat=5):
+    rng = random.Random(42)
+    # Realistic spread: any rupee amount up to ten crore
+    amounts = [str(rng.randrange(1, 10 ** 8)) for _ in range(count)]
+    single = min(timeit.repeat(lambda: [amount_to_words(a) for a in amounts], number=1, repeat=repeat))
+    batch = min(timeit.repeat(lambda: amounts_to_words(amounts), number=1, repeat=repeat))
+    print(f'{count} amounts: amount_to_words {single * 1000:.1f} ms ({single / count * 1e6:.2f} us/amount), '
+          f'amounts_to_words {batch * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,86 @@
+# Benchmark for form_data_parser against the regex cascade it replaced
+#
+# Run from the project root:  python benchmarks/bench_form_data_parser.py
+#
+# Only inputs both parsers decode to the same result are timed: payloads
+# with nested objects or braces inside strings defeat the cascade, so they
+# are covered by tests/test_form_data_parser.py instead of timed here.
+
+import json
+import os
+import random
+import re
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from form_data_parser import parse_response  # noqa: E402
+
+
+def legacy_parse(response_text):
+    """The regex cascade parse_response replaced, kept for timing comparison"""
+    match = re.search(r'\{\{FORM_DATA:\s*(\{\{.*?\}\})\}\}', response_text, re.DOTALL)
+    if match:
+        json_str = match.group(1).replace('{{', '{').replace('}}', '}')
+    else:
+        match = re.search(r'\{FORM_DATA:\s*(\{.*?\})\}', response_text, re.DOTALL)
+        if match:
+            json_str = match.group(1)
+        else:
+            match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+            if match:
+                json_str = match.group(1)
+            else:
+                match = re.search(r'(\{[^{}]*"branch_name"[^{}]*\})', response_text, re.DOTALL)
+                json_str = match.group(1) if match else None
+    try:
+        data = json.loads(json_str) if json_str else None
+    except ValueError:
+        data = None
+    clean = re.sub(r'\{FORM_DATA:.*?\}', '', response_text, flags=re.DOTALL)
+    clean = re.sub(r'```json.*?```', '', clean, flags=re.DOTALL)
+    return clean.strip(), data
+
+
+def random_text(rng, length):
+    alphabet = string.ascii_letters + string.digits + ' "\\:,₹'
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def escaped_block(data):
+    """{{FORM_DATA: {{...}}}} for a flat object without braces in its values"""
+    return '{{FORM_DATA: {' + json.dumps(data, ensure_ascii=False) + '}}}'
+
+
+def benchmark():
+    rng = random.Random(3)
+    form = {
+        'form_type': 'DEPOSIT', 'branch_name': 'Main Branch', 'account_number': '123456789012',
+        'account_holder_name': 'Rajesh Sharma', 'total_amount': '1000', 'amount_in_words': 'One Thousand Only',
+    }
+    filler = ' '.join(random_text(rng, 8) for _ in range(20000))
+    flat = {f'field_{i}': random_text(rng, 12) for i in range(3000)}
+    payload = json.dumps(flat, ensure_ascii=False)
+    responses = {
+        'typical reply': 'Perfect! Your form is ready.\n' + escaped_block(form) + '\nAnything else?',
+        'long text + block': filler + '\n' + escaped_block(form),
+        'large {{ }} block': 'Ready.\n' + escaped_block(flat),
+        'large { } block': 'Ready.\n{FORM_DATA: ' + payload + '}',
+        'large ```json block': 'Ready.\n```json\n' + payload + '\n```',
+        'no block': filler,
+    }
+    for name, text in responses.items():
+        expected = legacy_parse(text)[1]
+        if parse_response(text).form_data != expected:
+            raise SystemExit(f'{name}: the parsers disagree, not a like-for-like timing')
+        number = 2000 if len(text) < 1024 else 20
+        new = timeit.timeit(lambda: parse_response(text), number=number) / number
+        old = timeit.timeit(lambda: legacy_parse(text), number=number) / number
+        print(f'{name:20s} {len(text) / 1024:7.1f} KB  single-pass {new * 1000:7.3f} ms  '
+              f'regex cascade {old * 1000:7.3f} ms')
+
+
+if __name__ == '__main__':
+    benchmark()
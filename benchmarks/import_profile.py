@@ -0,0 +1,112 @@
+# Start-up profile: how long `import app` (or asgi) takes in a fresh
+# interpreter, which modules account for it, and whether any provider SDK was
+# loaded at import time. It shouldn't be (see providers.py): the script exits
+# with status 1 when one was, so it can gate CI.
+#
+# Run from the project root:
+#   python benchmarks/import_profile.py
+#   python benchmarks/import_profile.py --module asgi --repeat 5 --top 25
+#   python benchmarks/import_profile.py --json      # one line, for tracking over time
+#
+# Uses `python -X importtime`, so the numbers are import time only; the wall
+# time also includes interpreter start-up and the module's top-level code
+# (template pre-rendering, prompt preloading).
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SDK_MODULES = ('openai', 'groq', 'google.generativeai', 'httpx', 'numpy')
+
+# Placeholder keys, so missing-key warnings don't clutter the output
+PLACEHOLDER_ENV = {
+    'GEMINI_API_KEY': 'import-profile',
+    'OPENROUTER_API_KEY': 'import-profile',
+    'LOG_LEVEL': 'ERROR'
+}
+
+PROBE = (
+    "import importlib, json, sys\n"
+    "importlib.import_module(sys.argv[1])\n"
+    "print(json.dumps([m for m in sys.argv[2:] if m in sys.modules]))\n"
+)
+
+
+def run_once(module):
+    """(wall seconds, importtime rows, SDKs loaded) for one fresh interpreter"""
+    env = dict(os.environ, **{k: v for k, v in PLACEHOLDER_ENV.items() if k not in os.environ})
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, module, *SDK_MODULES],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return wall, rows, loaded
+
+
+def summarize(module, runs, top):
+    walls = [wall for wall, _, _ in runs]
+    # Totals per run: the top-level imports' cumulative times
+    totals = [sum(c for _, _, c, depth in rows if depth == 0) / 1e6 for _, rows, _ in runs]
+    # Module breakdown from the fastest run (the least disturbed by noise)
+    _, rows, loaded = min(runs, key=lambda run: run[0])
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+    return {
+        'module': module,
+        'runs': len(runs),
+        'wall_seconds': round(statistics.median(walls), 4),
+        'import_seconds': round(statistics.median(totals), 4),
+        'modules_imported': len(rows),
+        'sdks_loaded': loaded,
+        'slowest': [{'module': name, 'self_ms': round(s / 1000, 2), 'cumulative_ms': round(c / 1000, 2)}
+                    for name, s, c, _ in slowest]
+    }
+
+
+def print_report(report):
+    print(f"import {report['module']}: {report['import_seconds'] * 1000:.0f} ms importing, "
+          f"{report['wall_seconds'] * 1000:.0f} ms wall (median of {report['runs']}), "
+          f"{report['modules_imported']} modules")
+    print(f"provider SDKs loaded at import: {', '.join(report['sdks_loaded']) or 'none'}")
+    print()
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for row in report['slowest']:
+        print(f"{row['cumulative_ms']:>14.1f} {row['self_ms']:>9.1f}  {row['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default='app', help='module to import (app or asgi)')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters to time')
+    parser.add_argument('--top', type=int, default=20, help='slowest modules to list')
+    parser.add_argument('--json', action='store_true', help='print the report as one JSON line')
+    args = parser.parse_args()
+
+    runs = [run_once(args.module) for _ in range(max(args.repeat, 1))]
+    report = summarize(args.module, runs, args.top)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+    if report['sdks_loaded']:
+        sys.exit(f"{', '.join(report['sdks_loaded'])} imported at start-up; import them lazily")
+
+
+if __name__ == '__main__':
+    main()
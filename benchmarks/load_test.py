@@ -0,0 +1,381 @@
+# Offline load test: drives the Flask app with scripted conversations for
+# every form type against fake OpenRouter, Groq and Gemini clients, so the
+# hot path can be measured without spending API quota.
+#
+# Run from the project root:
+#   python benchmarks/load_test.py
+#   python benchmarks/load_test.py --users 16 --conversations 5 --primary-429 0.3
+#   python benchmarks/load_test.py --time-scale 0      # no simulated model latency
+#
+# The fake models answer like the real assistant: they ask for each field of
+# the selected form in turn and finish with a summary and a FORM_DATA block
+# built from the form spec. Latency is log-normal per provider; failures are
+# raised as 429 errors so the dispatcher's fallback and cooldown logic runs.
+# Reports p50/p95/p99 latency per endpoint, throughput and RSS growth.
+
+import argparse
+import io
+import json
+import math
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Placeholder keys keep the app's start-up warnings quiet, and real Gemini
+# context caches must not be created. Keep request logging quiet.
+os.environ.setdefault('GEMINI_API_KEY', 'load-test')
+os.environ.setdefault('OPENROUTER_API_KEY', 'load-test')
+os.environ.setdefault('OPENROUTER_API_KEY_2', 'load-test')
+os.environ.setdefault('GROQ_API_KEY', 'load-test')
+os.environ.setdefault('GEMINI_CACHE_TTL_SECONDS', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+# Free-tier per-key limits would throttle the test itself; set them to
+# measure the key scheduler instead
+for limit in ('OPENROUTER_RPM', 'GROQ_RPM', 'GROQ_TPM'):
+    os.environ.setdefault(limit, '0')
+
+import app as service  # noqa: E402
+from field_extractors import check_form_data, extract_fields, verhoeff_valid  # noqa: E402
+from form_specs import FORM_SPECS  # noqa: E402
+from metrics import PROVIDER_RETRIES  # noqa: E402
+from key_scheduler import THROTTLES  # noqa: E402
+
+SPEC_MARKER = '**SELECTED FORM: '
+QUESTION = 'Now, please tell me your '
+CONFIRMATION = 'Yes, all the details are correct.'
+
+
+class FakeRateLimit(Exception):
+    """Stands in for the SDKs' RateLimitError (HTTP 429)"""
+
+    status_code = 429
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f'Error code: 429 - {provider} rate limit exceeded (fake)')
+        self.response = SimpleNamespace(status_code=429, headers={'retry-after': f'{retry_after:.3f}'})
+
+
+def questions(spec):
+    """Fields the assistant asks the user for, in order"""
+    return [f for f in spec.fields if f.label and not f.auto and not f.when]
+
+
+AADHAAR = next('23456789012' + d for d in '0123456789' if verhoeff_valid('23456789012' + d))
+
+
+def answer_for(field):
+    """A value the local validators accept for this field"""
+    # The scripted identity document is an Aadhaar card, so its number is one
+    if field.kind == 'aadhaar' or field.key == 'document_number':
+        return AADHAAR
+    if field.kind in ('dob', 'date') or field.example == 'DD/MM/YYYY':
+        return '15/08/1960'
+    return str(field.example)
+
+
+def check_answers(forms):
+    """Problems the app's validators find in the scripted answers; any would
+    stop a conversation from completing"""
+    problems = []
+    for form_type in forms:
+        spec = FORM_SPECS[form_type]
+        for field in questions(spec):
+            _, found = extract_fields(answer_for(field), form_type, f'{QUESTION}{field.label}.')
+            problems += [f'{form_type}.{field.key}: {problem}' for problem in found]
+        data = {field.key: answer_for(field) for field in spec.fields}
+        problems += [f'{form_type}: {problem}' for problem in check_form_data(form_type, data)]
+    return problems
+
+
+def form_data_block(spec):
+    data = {'form_type': spec.code}
+    for field in spec.fields:
+        data[field.key] = answer_for(field)
+    return '{{FORM_DATA: ' + json.dumps(data).replace('{', '{{').replace('}', '}}') + '}}'
+
+
+def scripted_reply(system_prompt, last_question, last_user):
+    """What the assistant would say next: the question after the one the user
+    just answered, and finally the summary with the FORM_DATA block"""
+    start = system_prompt.find(SPEC_MARKER)
+    title = system_prompt[start + len(SPEC_MARKER):system_prompt.find('**', start + len(SPEC_MARKER))]
+    spec = next((s for s in FORM_SPECS.values() if s.title == title), None)
+    if spec is None:
+        return 'Which form would you like to fill today?'
+    asked = questions(spec)
+    if last_user == CONFIRMATION:
+        return 'Thank you! Your form is ready to print.'
+    answered = next((i for i, f in enumerate(asked) if f'{QUESTION}{f.label}.' in last_question), -1)
+    if answered + 1 < len(asked):
+        return f'Thank you. {QUESTION}{asked[answered + 1].label}.'
+    summary = ''.join(f'✓ {f.label}: {answer_for(f)}\n' for f in asked)
+    return f'Here is a summary:\n{summary}\nAre all these details correct?\n\n{form_data_block(spec)}'
+
+
+def message_text(part):
+    return part if isinstance(part, str) else ''
+
+
+class FakeProvider:
+    """Latency and failure model shared by one provider's fake clients"""
+
+    def __init__(self, name, median, sigma, failure_rate, time_scale, rng):
+        self.name = name
+        self.median = median
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.time_scale = time_scale
+        self.rng = rng
+        self.lock = threading.Lock()
+
+    def wait(self, failure_rate=None):
+        with self.lock:
+            delay = self.rng.lognormvariate(math.log(self.median), self.sigma) if self.median > 0 else 0
+            fails = self.rng.random() < (self.failure_rate if failure_rate is None else failure_rate)
+        if self.time_scale > 0:
+            time.sleep(delay * self.time_scale)
+        if fails:
+            raise FakeRateLimit(self.name, self.time_scale)
+
+
+def usage(prompt, completion):
+    return SimpleNamespace(
+        prompt_tokens=len(prompt) // 4, completion_tokens=len(completion) // 4,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=0)
+    )
+
+
+class FakeChatClient:
+    """Enough of the OpenAI / Groq client for chat.completions.create() and
+    its with_raw_response variant"""
+
+    def __init__(self, provider, failure_rate=None):
+        self.provider = provider
+        self.failure_rate = failure_rate
+        self.base_url = f'https://{provider.name.lower()}.invalid'
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self.create,
+            with_raw_response=SimpleNamespace(create=self.create_raw)
+        ))
+
+    def create_raw(self, **kwargs):
+        response = self.create(**kwargs)
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+    def create(self, messages, stream=False, **kwargs):
+        self.provider.wait(self.failure_rate)
+        text = scripted_reply(messages[0]['content'], messages[-2]['content'], messages[-1]['content'])
+        prompt = ''.join(m['content'] for m in messages)
+        if not stream:
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason='stop')],
+                usage=usage(prompt, text)
+            )
+        return self._stream(text, prompt)
+
+    def _stream(self, text, prompt):
+        for i in range(0, len(text), 16):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + 16]))],
+                                  usage=None)
+        yield SimpleNamespace(choices=[], usage=usage(prompt, text))
+
+
+class FakeGeminiModel:
+    """Enough of genai.GenerativeModel for chat turns and transcription.
+
+    Audio "recordings" sent by the load test are the UTF-8 text of what
+    the user says, so transcription just decodes them.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    def generate_content(self, contents, stream=False, generation_config=None):
+        self.provider.wait()
+        text = self._reply(contents)
+        meta = SimpleNamespace(prompt_token_count=len(str(contents)) // 4, cached_content_token_count=0,
+                               candidates_token_count=len(text) // 4)
+        if stream:
+            return [SimpleNamespace(text=text[i:i + 16], usage_metadata=None) for i in range(0, len(text), 16)] + \
+                [SimpleNamespace(text='', usage_metadata=meta)]
+        return SimpleNamespace(text=text, usage_metadata=meta)
+
+    def _reply(self, contents):
+        if contents and isinstance(contents[0], dict) and 'mime_type' in contents[0]:
+            return contents[0]['data'].decode('utf-8')
+        last = contents[-1]['parts']
+        audio = next((p for p in last if isinstance(p, dict) and 'mime_type' in p), None)
+        if audio is not None:
+            # /chat/audio: transcribe and answer in one JSON reply
+            transcript = audio['data'].decode('utf-8')
+            reply = scripted_reply(message_text(contents[0]['parts'][0]),
+                                   message_text(contents[-2]['parts'][0]), transcript)
+            return json.dumps({'transcript': transcript, 'reply': reply})
+        return scripted_reply(message_text(contents[0]['parts'][0]), message_text(contents[-2]['parts'][0]),
+                              message_text(last[0]))
+
+
+def install_fakes(args):
+    rng = random.Random(args.seed)
+    openrouter = FakeProvider('OpenRouter', args.openrouter_latency, args.sigma, args.openrouter_fail,
+                              args.time_scale, rng)
+    groq = FakeProvider('Groq', args.groq_latency, args.sigma, args.groq_fail, args.time_scale, rng)
+    gemini = FakeProvider('Gemini', args.gemini_latency, args.sigma, args.gemini_fail, args.time_scale, rng)
+
+    # The primary key gets its own 429 rate to exercise the fallback path
+    openrouter_clients = [FakeChatClient(openrouter, args.primary_429), FakeChatClient(openrouter)]
+    groq_clients = [FakeChatClient(groq)]
+    gemini_model = FakeGeminiModel(gemini)
+
+    service.openrouter_clients = lambda: openrouter_clients
+    service.groq_clients = lambda: groq_clients
+    service.gemini_model = lambda name=None: gemini_model
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.incomplete = set()   # form types with a conversation that didn't finish
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+def timed(recorder, endpoint, call):
+    started = time.perf_counter()
+    response = call()
+    ok = response.status_code < 400 and response.get_json(silent=True) is not None \
+        and response.get_json().get('success', False)
+    recorder.add(endpoint, time.perf_counter() - started, ok)
+    return response
+
+
+def run_conversation(form_type, args, recorder, rng):
+    """One user filling one form: greeting, every field, confirmation, fetch"""
+    client = service.app.test_client()
+    spec = FORM_SPECS[form_type]
+    session_id = uuid.uuid4().hex
+    messages = ['Hello'] + [answer_for(f) for f in questions(spec)] + [CONFIRMATION]
+    for message in messages:
+        is_from_audio = rng.random() < args.audio_ratio
+        if is_from_audio:
+            response = timed(recorder, '/transcribe', lambda: client.post(
+                '/transcribe', data={'audio': (io.BytesIO(message.encode('utf-8')), 'speech.webm', 'audio/webm')},
+                content_type='multipart/form-data'
+            ))
+            message = response.get_json().get('text', message) if response.status_code == 200 else message
+        body = {'message': message, 'session_id': session_id, 'form_type': form_type,
+                'is_from_audio': is_from_audio}
+        timed(recorder, '/chat', lambda: client.post('/chat', json=body))
+    response = timed(recorder, '/get_form_data', lambda: client.post('/get_form_data', json={'session_id': session_id}))
+    form_data = (response.get_json() or {}).get('form_data') or {}
+    if form_data.get('form_type') != spec.code:
+        recorder.add('form_complete', 0.0, False)
+        recorder.incomplete.add(form_type)
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+def report(recorder, elapsed, rss_before, rss_after, conversations):
+    total = sum(len(v) for k, v in recorder.samples.items() if k != 'form_complete')
+    print(f'\n{conversations} conversations, {total} requests in {elapsed:.2f}s '
+          f'({total / elapsed:.1f} req/s, {conversations / elapsed:.2f} conversations/s)')
+    print(f'{"endpoint":16s} {"count":>7s} {"errors":>7s} {"p50 ms":>9s} {"p95 ms":>9s} {"p99 ms":>9s} {"max ms":>9s}')
+    for endpoint, values in sorted(recorder.samples.items()):
+        if endpoint == 'form_complete':
+            continue
+        values = sorted(values)
+        print(f'{endpoint:16s} {len(values):7d} {recorder.errors.get(endpoint, 0):7d} '
+              + ' '.join(f'{percentile(values, p) * 1000:9.1f}' for p in (50, 95, 99))
+              + f' {values[-1] * 1000:9.1f}')
+    incomplete = recorder.errors.get('form_complete', 0)
+    print(f'forms completed: {conversations - incomplete}/{conversations}'
+          + (f" (incomplete: {', '.join(sorted(recorder.incomplete))})" if incomplete else ''))
+    retries = {' '.join(key): value for key, value in PROVIDER_RETRIES._values.items()}
+    if retries:
+        print('provider retries: ' + ', '.join(f'{k}={v}' for k, v in sorted(retries.items())))
+    throttles = {' '.join(key): value for key, value in THROTTLES._values.items()}
+    if throttles:
+        print('key throttles: ' + ', '.join(f'{k}={v}' for k, v in sorted(throttles.items())))
+    print(f'RSS: {rss_before:.1f} MB -> {rss_after:.1f} MB ({rss_after - rss_before:+.1f} MB)')
+    return incomplete
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=8, help='concurrent simulated users')
+    parser.add_argument('--conversations', type=int, default=3, help='conversations per form type')
+    parser.add_argument('--forms', default=','.join(FORM_SPECS), help='comma-separated form types')
+    parser.add_argument('--audio-ratio', type=float, default=0.2,
+                        help='share of turns spoken (sent through /transcribe and Gemini)')
+    parser.add_argument('--time-scale', type=float, default=0.05,
+                        help='multiplier on simulated model latency (1 = realistic, 0 = none)')
+    parser.add_argument('--openrouter-latency', type=float, default=2.0, help='median seconds')
+    parser.add_argument('--groq-latency', type=float, default=0.8, help='median seconds')
+    parser.add_argument('--gemini-latency', type=float, default=1.2, help='median seconds')
+    parser.add_argument('--sigma', type=float, default=0.5, help='log-normal spread of latencies')
+    parser.add_argument('--primary-429', type=float, default=0.0,
+                        help='share of calls to the primary OpenRouter key failing with 429')
+    parser.add_argument('--openrouter-fail', type=float, default=0.0)
+    parser.add_argument('--groq-fail', type=float, default=0.0)
+    parser.add_argument('--gemini-fail', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    install_fakes(args)
+    forms = [f for f in args.forms.split(',') if f]
+    problems = check_answers(forms)
+    if problems:
+        sys.exit('scripted answers fail validation:\n' + '\n'.join(problems))
+    jobs = [form for form in forms for _ in range(args.conversations)]
+    random.Random(args.seed).shuffle(jobs)
+    recorder = Recorder()
+
+    # One warm-up conversation so imports and prompt caches aren't measured
+    run_conversation(forms[0], args, Recorder(), random.Random(0))
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [pool.submit(run_conversation, form, args, recorder, random.Random(args.seed + i))
+                   for i, form in enumerate(jobs)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    if report(recorder, elapsed, rss_before, rss_mb(), len(jobs)):
+        # A scripted form that doesn't complete is a regression, not noise
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
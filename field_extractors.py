@@ -0,0 +1,335 @@
+# Deterministic extraction and validation of machine-checkable form fields
+
+import re
+from datetime import date
+
+from form_specs import FORM_SPECS, FIELD_KEYS
+
+# Compiled once per worker
+PAN_RE = re.compile(r'\b([A-Z]{5}[0-9]{4}[A-Z])\b', re.IGNORECASE)
+IFSC_RE = re.compile(r'\b([A-Z]{4}0[A-Z0-9]{6})\b', re.IGNORECASE)
+DATE_RE = re.compile(r'(?<!\d)(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})(?!\d)')
+ASSESSMENT_YEAR_RE = re.compile(r'\b(20\d{2})\s*[-/]\s*(\d{2})\b')
+AMOUNT_RE = re.compile(
+    r'(?:(?:₹|\brs\.?|\binr)\s*(\d[\d,]*(?:\.\d{1,2})?)(?:\s*(lakhs?|lacs?|crores?|thousand))?'
+    r'|(\d[\d,]*(?:\.\d{1,2})?)\s*(lakhs?|lacs?|crores?|thousand|rupees|rs\b|/-))',
+    re.IGNORECASE
+)
+CURRENCY_RE = re.compile(r'\b(USD|EUR|GBP|AUD|CAD|JPY|SGD|AED|CHF|NZD|SAR|QAR|KWD|MYR|HKD)\b', re.IGNORECASE)
+CURRENCY_NAMES = {
+    'us dollar': 'USD', 'dollar': 'USD', 'euro': 'EUR', 'pound': 'GBP', 'sterling': 'GBP',
+    'australian dollar': 'AUD', 'canadian dollar': 'CAD', 'yen': 'JPY', 'dirham': 'AED',
+    'singapore dollar': 'SGD', 'swiss franc': 'CHF', 'riyal': 'SAR'
+}
+CURRENCY_NAME_RE = re.compile(
+    r'\b(' + '|'.join(sorted(CURRENCY_NAMES, key=len, reverse=True)) + r')s?\b', re.IGNORECASE
+)
+# Digit groups: spaced Aadhaar/account style, an STD-prefixed landline
+# (022-98765432, (0124) 2345678), spaced mobile style, any other hyphenated
+# number, or a plain run
+DIGITS_RE = re.compile(
+    r'(\+91[\s-]?)?(?<!\d)(\d{4}[ -]\d{4}[ -]\d{4}(?:[ -]\d{2,4})?'
+    r'|(?P<landline>\(0\d{2,4}\)\s?\d{6,8}|0\d{2,4}[ -]\d{6,8})'
+    r'|\d{5}[ -]\d{5}|\d+(?:-\d+)+|\d+)(?!\d)'
+)
+
+ACCOUNT_CUE_RE = re.compile(r'\baccount\b|\ba/c\b|\bacc(?:ount)?\s*(?:no|number)\b', re.IGNORECASE)
+OTHER_ACCOUNT_CUE_RE = re.compile(r'beneficiary|idfc account|other bank|transfer to', re.IGNORECASE)
+AADHAAR_CUE_RE = re.compile(r'aadh?aa?r|\buid\b', re.IGNORECASE)
+CUSTOMER_ID_CUE_RE = re.compile(r'customer\s*id|cust(?:omer)?\s*id', re.IGNORECASE)
+MOBILE_CUE_RE = re.compile(r'mobile|phone|contact number|\btel\b', re.IGNORECASE)
+PAN_CUE_RE = re.compile(r'\bpan\b', re.IGNORECASE)
+BIRTH_CUE_RE = re.compile(r'birth|\bdob\b|born', re.IGNORECASE)
+AMOUNT_CUE_RE = re.compile(r'amount|withdraw|deposit|send|remit|rupees|₹|\brs\b|how much', re.IGNORECASE)
+BALANCE_CUE_RE = re.compile(r'balance', re.IGNORECASE)
+# Numbers the forms take as typed (landlines, ID document numbers). When the
+# question asks for one of these a digit run is ambiguous, so it's never
+# refused locally; only values that validate as another field are taken
+UNCHECKED_NUMBER_CUE_RE = re.compile(
+    r'landline|work\s*(?:phone|tel)|office\s*(?:phone|number)|home\s*number|\bstd\b'
+    r"|document'?s?\s*number|passport|voter\s*id|driving\s*licen[cs]e",
+    re.IGNORECASE
+)
+
+# Which kinds of field each form accepts, mapped to its FORM_DATA key
+FORM_FIELD_KEYS = FIELD_KEYS
+
+# Exact account number lengths the form specs insist on
+ACCOUNT_NUMBER_LENGTHS = {spec.form_type: spec.account_length for spec in FORM_SPECS.values() if spec.account_length}
+CUSTOMER_ID_LENGTH = 10
+
+# Verhoeff checksum tables (used by Aadhaar)
+_VERHOEFF_D = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 2, 3, 4, 0, 6, 7, 8, 9, 5),
+    (2, 3, 4, 0, 1, 7, 8, 9, 5, 6), (3, 4, 0, 1, 2, 8, 9, 5, 6, 7),
+    (4, 0, 1, 2, 3, 9, 5, 6, 7, 8), (5, 9, 8, 7, 6, 0, 4, 3, 2, 1),
+    (6, 5, 9, 8, 7, 1, 0, 4, 3, 2), (7, 6, 5, 9, 8, 2, 1, 0, 4, 3),
+    (8, 7, 6, 5, 9, 3, 2, 1, 0, 4), (9, 8, 7, 6, 5, 4, 3, 2, 1, 0)
+)
+_VERHOEFF_P = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8, 9), (1, 5, 7, 6, 2, 8, 3, 0, 9, 4),
+    (5, 8, 0, 3, 7, 9, 6, 1, 4, 2), (8, 9, 1, 6, 0, 4, 3, 5, 2, 7),
+    (9, 4, 5, 3, 1, 2, 6, 8, 7, 0), (4, 2, 8, 6, 5, 7, 3, 9, 0, 1),
+    (2, 7, 9, 3, 8, 0, 6, 4, 1, 5), (7, 0, 4, 6, 9, 1, 3, 2, 5, 8)
+)
+
+_DAYS_IN_MONTH = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+_AMOUNT_MULTIPLIERS = {'thousand': 1000, 'lakh': 100000, 'lac': 100000, 'crore': 10000000}
+
+
+def verhoeff_valid(number):
+    """True if the digit string passes the Verhoeff checksum"""
+    check = 0
+    for i, digit in enumerate(reversed(number)):
+        check = _VERHOEFF_D[check][_VERHOEFF_P[i % 8][int(digit)]]
+    return check == 0
+
+
+def is_valid_aadhaar(number):
+    """12 digits, not starting with 0 or 1, with a valid Verhoeff check digit"""
+    return len(number) == 12 and number.isdigit() and number[0] not in '01' and verhoeff_valid(number)
+
+
+def is_valid_date(day, month, year):
+    if not (1 <= month <= 12 and 1900 <= year <= 2100 and day >= 1):
+        return False
+    if month == 2 and day == 29:
+        return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    return day <= _DAYS_IN_MONTH[month - 1]
+
+
+def parse_amount(number, unit=None):
+    """'5,000' / ('2.5', 'lakh') -> '5000' / '250000' (rupees, as a string)"""
+    value = float(number.replace(',', ''))
+    if unit:
+        unit = unit.lower().rstrip('s')
+        value *= _AMOUNT_MULTIPLIERS.get(unit, 1)
+    if value == int(value):
+        return str(int(value))
+    return f'{value:.2f}'
+
+
+def _digit_kind(digits, has_plus91, kinds, context, form_type, mobile_asked):
+    """Decide what a run of digits is for this form; returns (kind, problem).
+
+    A number is only taken as a mobile when the question asked for one.
+    """
+    n = len(digits)
+    account_len = ACCOUNT_NUMBER_LENGTHS.get(form_type)
+    mobile_like = (n == 10 and digits[0] in '6789') or has_plus91
+
+    if 'customer_id' in kinds and CUSTOMER_ID_CUE_RE.search(context) and n != 12:
+        if n == CUSTOMER_ID_LENGTH:
+            return 'customer_id', None
+        return None, f"The customer ID you entered has {n} digits, but it should be exactly {CUSTOMER_ID_LENGTH} digits. Could you please check it and type it again?"
+    if mobile_asked and mobile_like and (n == 10 or has_plus91):
+        if n == 10:
+            return 'mobile', None
+        return None, f"The mobile number you entered has {n} digits. Indian mobile numbers have 10 digits after +91. Could you please check it?"
+    if 'aadhaar' in kinds and n == 12 and ('account_number' not in kinds or AADHAAR_CUE_RE.search(context)):
+        if is_valid_aadhaar(digits):
+            return 'aadhaar', None
+        if not AADHAAR_CUE_RE.search(context):
+            # Twelve digits nobody called an Aadhaar: some other number
+            return None, None
+        return None, "That Aadhaar number doesn't look right - one of the digits may have been mistyped. Could you please check your Aadhaar card and type the 12 digits again?"
+    if 'pin' in kinds and n == 6 and digits[0] != '0':
+        return 'pin', None
+    if 'customer_id' in kinds and n == CUSTOMER_ID_LENGTH:
+        return 'customer_id', None
+    if 'account_number' in kinds and n >= 9 and ACCOUNT_CUE_RE.search(context):
+        if account_len and n != account_len:
+            return None, (f"The account number you entered has {n} digits, but this form needs exactly "
+                          f"{account_len} digits. Could you please check your passbook and type the full number again?")
+        if n <= 20:
+            return 'account_number', None
+    if 'mobile' in kinds and n not in (6, 10) and 8 <= n <= 13 and MOBILE_CUE_RE.search(context) \
+            and not ACCOUNT_CUE_RE.search(context):
+        return None, f"The phone number you entered has {n} digits. Mobile numbers have 10 digits. Could you please check it?"
+    return None, None
+
+
+def extract_fields(message, form_type, last_question=''):
+    """Pull well-formed field values out of a user message.
+
+    last_question is the assistant's previous message; its wording is used as
+    context to tell apart fields that look alike (account vs Aadhaar number).
+    Returns (fields, problems): fields maps FORM_DATA keys to values, and
+    problems lists friendly messages for values that are clearly invalid.
+    Landline numbers, any number given when the question asks for a landline
+    or ID document number, and mobile-like numbers the question didn't ask
+    for are left to the model.
+    """
+    kinds = FORM_FIELD_KEYS.get(form_type)
+    if not kinds or not message:
+        return {}, []
+
+    context = f'{last_question}\n{message}'
+    found = {}      # kind -> list of values
+    problems = []
+    rest = message
+
+    def add(kind, value):
+        found.setdefault(kind, []).append(value)
+
+    if 'pan' in kinds:
+        for m in PAN_RE.finditer(rest):
+            add('pan', m.group(1).upper())
+        if 'pan' not in found and PAN_CUE_RE.search(message) and re.search(r'\b[A-Za-z0-9]{8,12}\b', message):
+            problems.append("A PAN number has 10 characters: 5 letters, 4 numbers and 1 letter (like ABCDE1234F). Could you please check it?")
+
+    if 'ifsc' in kinds:
+        for m in IFSC_RE.finditer(rest):
+            add('ifsc', m.group(1).upper())
+
+    if 'currency' in kinds:
+        for m in CURRENCY_RE.finditer(rest):
+            add('currency', m.group(1).upper())
+        if 'currency' not in found:
+            for m in CURRENCY_NAME_RE.finditer(rest):
+                add('currency', CURRENCY_NAMES[m.group(1).lower()])
+
+    if 'assessment_year' in kinds:
+        for m in ASSESSMENT_YEAR_RE.finditer(rest):
+            if int(m.group(2)) == (int(m.group(1)) + 1) % 100:
+                add('assessment_year', f'{m.group(1)}-{m.group(2)}')
+        rest = ASSESSMENT_YEAR_RE.sub(' ', rest)
+
+    for m in DATE_RE.finditer(rest):
+        day, month, year = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        if not is_valid_date(day, month, year):
+            problems.append(f"The date {m.group(0)} doesn't look like a real date. Could you please give it as DD/MM/YYYY?")
+        elif 'dob' in kinds and BIRTH_CUE_RE.search(context):
+            add('dob', f'{day:02d}/{month:02d}/{year}')
+        elif 'date' in kinds:
+            add('date', f'{day:02d}/{month:02d}/{year}')
+    rest = DATE_RE.sub(' ', rest)
+
+    amount_kind = 'amount' if 'amount' in kinds else ('balance' if 'balance' in kinds else None)
+    for m in AMOUNT_RE.finditer(rest):
+        if amount_kind == 'amount' or (amount_kind == 'balance' and BALANCE_CUE_RE.search(context)):
+            if m.group(1):
+                add(amount_kind, parse_amount(m.group(1), m.group(2)))
+            else:
+                unit = m.group(4) if m.group(4).lower().rstrip('s') in _AMOUNT_MULTIPLIERS else None
+                add(amount_kind, parse_amount(m.group(3), unit))
+    rest = AMOUNT_RE.sub(' ', rest)
+
+    unchecked = UNCHECKED_NUMBER_CUE_RE.search(last_question)
+    mobile_asked = 'mobile' in kinds and bool(MOBILE_CUE_RE.search(last_question))
+    for m in DIGITS_RE.finditer(rest):
+        if m.group('landline') and not m.group(1):
+            continue
+        digits = re.sub(r'\D', '', m.group(2))
+        if mobile_asked and not m.group(1) and len(digits) == 11 and digits[0] == '0' and digits[1] in '6789':
+            # A leading 0 is the trunk prefix, dropped like +91
+            digits = digits[1:]
+        kind, problem = _digit_kind(digits, bool(m.group(1)), kinds, context, form_type, mobile_asked)
+        if problem:
+            if not unchecked:
+                problems.append(problem)
+        elif kind:
+            add(kind, digits)
+        elif amount_kind and len(digits) <= 9 and \
+                (BALANCE_CUE_RE if amount_kind == 'balance' else AMOUNT_CUE_RE).search(context):
+            add(amount_kind, str(int(digits)))
+
+    # A second account-like number usually belongs to a beneficiary field the
+    # model handles; only take account numbers when the question is about ours
+    if 'account_number' in found and OTHER_ACCOUNT_CUE_RE.search(last_question):
+        del found['account_number']
+
+    # Two different values for the same field is ambiguous: leave it to the model
+    fields = {}
+    for kind, values in found.items():
+        if len(set(values)) == 1:
+            fields[kinds[kind]] = values[0]
+
+    return fields, problems
+
+
+def validation_reply(problems):
+    """Assistant reply for values that failed local validation"""
+    if len(problems) == 1:
+        return problems[0]
+    return "I noticed a couple of things that need checking:\n" + '\n'.join(f'- {p}' for p in problems)
+
+
+def _digits(value):
+    return re.sub(r'[\s-]', '', value)
+
+
+def _valid_value(kind, value, form_type):
+    """True if a FORM_DATA value is well-formed for its field kind"""
+    if kind == 'account_number':
+        digits = _digits(value)
+        length = ACCOUNT_NUMBER_LENGTHS.get(form_type)
+        return digits.isdigit() and (len(digits) == length if length else 9 <= len(digits) <= 20)
+    if kind == 'customer_id':
+        return _digits(value).isdigit() and len(_digits(value)) == CUSTOMER_ID_LENGTH
+    if kind == 'aadhaar':
+        return is_valid_aadhaar(_digits(value))
+    if kind == 'pan':
+        return PAN_RE.fullmatch(value.upper()) is not None
+    if kind == 'ifsc':
+        return IFSC_RE.fullmatch(value.upper()) is not None
+    if kind == 'mobile':
+        digits = _digits(value)
+        if digits.startswith('+91'):
+            digits = digits[3:]
+        elif len(digits) == 11 and digits[0] == '0':
+            digits = digits[1:]
+        return len(digits) == 10 and digits.isdigit() and digits[0] in '6789'
+    if kind == 'pin':
+        return len(value) == 6 and value.isdigit() and value[0] != '0'
+    if kind in ('dob', 'date'):
+        try:
+            if re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+                date.fromisoformat(value)
+                return True
+            day, month, year = (int(part) for part in re.split(r'[/.-]', value))
+        except ValueError:
+            return False
+        return is_valid_date(day, month, year)
+    if kind in ('amount', 'balance', 'money'):
+        return re.fullmatch(r'(?:₹\s*)?\d[\d,]*(?:\.\d{1,2})?', value) is not None
+    if kind == 'count':
+        return value.isdigit()
+    if kind == 'currency':
+        return re.fullmatch(r'[A-Z]{3}', value) is not None
+    if kind == 'assessment_year':
+        return re.fullmatch(r'20\d{2}-\d{2}', value) is not None
+    return True
+
+
+def check_form_data(form_type, data, known=None):
+    """Check a decoded FORM_DATA block against the form's spec, in place.
+
+    Missing values get the spec's defaults, and values that fail their field's
+    validator are replaced by the locally validated value in known (the
+    session's extracted fields) when there is one. Returns a list of problems
+    that remain (missing required fields, malformed values), for logging.
+    """
+    spec = FORM_SPECS.get(form_type)
+    if spec is None:
+        return []
+    known = known or {}
+    problems = []
+    data.setdefault('form_type', spec.code)
+    for field in spec.fields:
+        value = data.get(field.key)
+        if value in (None, ''):
+            if field.default is not None:
+                data[field.key] = field.default
+            elif field.key in known:
+                data[field.key] = known[field.key]
+            elif field.label and not (field.optional or field.auto or field.when):
+                problems.append(f'{field.key}: missing')
+            continue
+        if field.kind and not _valid_value(field.kind, str(value).strip(), form_type):
+            if field.key in known:
+                data[field.key] = known[field.key]
+            else:
+                problems.append(f'{field.key}: invalid {field.kind} {value!r}')
+    return problems
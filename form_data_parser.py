@@ -0,0 +1,278 @@
+# Single-pass FORM_DATA extraction: finds every FORM_DATA / ```json block in a
+# model response, decodes the first usable one and returns the visible text
+
+import json
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import accumulate
+
+# Markers that open a block which must never reach the visible text
+BLOCK_MARKERS = ('{{FORM_DATA', '{FORM_DATA', '```json')
+FENCE = '```'
+FENCED_MARKER = '```json'
+
+# Brace matching never looks inside strings; the regexes below skip whole
+# string bodies without a Python loop
+# Rest of a JSON string up to and including its closing quote
+_STRING_TAIL_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Rest of a string that doesn't close in this chunk; group 1 is a dangling backslash
+_STRING_PARTIAL_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*(\\?)', re.DOTALL)
+# Complete JSON strings, for text that can't be split on masked quotes
+_STRING_SPLIT_RE = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")', re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+_BRACE_SPLIT_RE = re.compile(r'([{}])')
+_BRACE_STEP = {'{': 1, '}': -1}
+# Same-length placeholders for escaped backslashes and quotes: with those
+# hidden, every quote left in the text opens or closes a JSON string
+_QUOTE_MASK = '\x02\x02'
+_ESCAPE_MASKS = (('\\\\', '\x01\x01'), ('\\"', _QUOTE_MASK))
+# Text that already has these can't be masked and unmasked safely
+_UNSAFE_FOR_MASKS = '\0\x01\x02'
+
+# A FORM_DATA wrapper at the start of a fenced block
+_WRAPPER_RE = re.compile(r'\s*\{\{?FORM_DATA')
+
+_decoder = json.JSONDecoder()
+
+# text: the response with every block removed; form_data: the first block
+# that decoded to an object (None if there was none); raw: that block's text;
+# error: why a block that was found could not be used (None on success)
+ParsedResponse = namedtuple('ParsedResponse', ['text', 'form_data', 'raw', 'error'])
+
+
+class BraceScanner:
+    """Incremental brace matcher that ignores braces inside JSON strings.
+
+    Feed it text starting at an opening brace, in one piece or as a stream of
+    chunks; feed() returns the index just past the brace that closes the
+    outermost object, or -1 if that hasn't arrived yet.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False     # the next character is escaped (chunk ended on a backslash)
+
+    def feed(self, text, start=0):
+        pos = start
+        if self.in_string:
+            if self.escaped:
+                if pos >= len(text):
+                    return -1
+                pos += 1
+                self.escaped = False
+            m = _STRING_TAIL_RE.match(text, pos)
+            if m is None:
+                # The string continues in the next chunk
+                self.escaped = bool(_STRING_PARTIAL_RE.match(text, pos).group(1))
+                return -1
+            pos = m.end()
+            self.in_string = False
+        # The text between complete strings is joined and counted in one go,
+        # so a long payload costs a handful of C calls rather than a loop
+        parts = _split_strings(text[pos:])
+        tail = parts[-1]
+        quote = tail.find('"')
+        if quote != -1:
+            parts[-1] = tail[:quote]
+        outside = ''.join(parts[::2])
+        closes = outside.count('}')
+        if closes and closes >= self.depth:
+            # The outermost object may close in this chunk: depth after each brace
+            pieces = _BRACE_SPLIT_RE.split(outside)
+            depths = list(accumulate(map(_BRACE_STEP.__getitem__, pieces[1::2]), initial=self.depth))
+            try:
+                brace = depths.index(0, 1)
+            except ValueError:
+                self.depth = depths[-1]
+            else:
+                index = sum(map(len, pieces[:2 * brace - 1]))
+                return pos + _outside_offset(parts, index) + 1
+        else:
+            self.depth += outside.count('{') - closes
+        if quote != -1:
+            # A string that doesn't close in this chunk
+            self.in_string = True
+            self.escaped = bool(_STRING_PARTIAL_RE.match(tail, quote + 1).group(1))
+        return -1
+
+
+def _mask_escapes(text):
+    for escape, mask in _ESCAPE_MASKS:
+        text = text.replace(escape, mask)
+    return text
+
+
+def _unmask_escapes(text):
+    for escape, mask in _ESCAPE_MASKS:
+        text = text.replace(mask, escape)
+    return text
+
+
+def _split_strings(text):
+    """Split text on its JSON strings: the text between them lands at the even
+    indexes and the string bodies at the odd ones, and '"'.join(parts) gives
+    the text back with its escapes masked. A string that doesn't close stays
+    in the last part, opening quote included.
+    """
+    masked = _mask_escapes(text)
+    parts = masked.split('"')
+    if len(parts) % 2 == 0:
+        parts[-2:] = ['"'.join(parts[-2:])]
+    if _QUOTE_MASK in masked:
+        outside = parts[::2]
+        outside[-1] = outside[-1].partition('"')[0]
+        if _QUOTE_MASK in ''.join(outside):
+            # A backslash before a quote outside any string escapes nothing
+            parts = _STRING_SPLIT_RE.split(text)
+            parts[1::2] = [string[1:-1] for string in parts[1::2]]
+    return parts
+
+
+def _outside_offset(parts, index):
+    """Map an index into ''.join(parts[::2]) to one into '"'.join(parts)"""
+    outside_starts = [0, *accumulate(map(len, parts[::2]))]
+    part = bisect_right(outside_starts, index) - 1
+    return sum(map(len, parts[:2 * part])) + 2 * part + index - outside_starts[part]
+
+
+def _outside_strings(text, fix):
+    if any(ch in text for ch in _UNSAFE_FOR_MASKS):
+        parts = _STRING_SPLIT_RE.split(text)
+        parts[::2] = [fix(part) for part in parts[::2]]
+        return ''.join(parts)
+    # One fix() over all the text between strings, NUL-separated so a repair
+    # can't join two neighbouring parts
+    parts = _split_strings(text)
+    parts[::2] = fix('\0'.join(parts[::2])).split('\0')
+    return _unmask_escapes('"'.join(parts))
+
+
+def _halve_braces(part):
+    return part.replace('{{', '{').replace('}}', '}')
+
+
+def _unescape_braces(text):
+    """'{{' -> '{' and '}}' -> '}' outside JSON strings (prompt-style escaping)"""
+    return _outside_strings(text, _halve_braces)
+
+
+def _drop_trailing_commas(text):
+    return _outside_strings(text, lambda part: _TRAILING_COMMA_RE.sub(r'\1', part))
+
+
+def _with_repairs(candidates):
+    tried = []
+    for candidate in candidates:
+        tried.append(candidate)
+        yield candidate
+    for candidate in tried:
+        yield _drop_trailing_commas(candidate)
+
+
+def _candidates(text):
+    # Unescaping is only paid for when a candidate needs it
+    if text.startswith('{{'):
+        # Prompt-style escaping is the common case; try it first
+        yield _unescape_braces(text)
+        yield text
+    else:
+        yield text
+        yield _unescape_braces(text)
+
+
+def decode_payload(body):
+    """Decode the JSON object at the start of a block body.
+
+    Tries the text as is, then with {{ }} escaping undone, then each of those
+    without trailing commas. Returns (object, None) or (None, error message).
+    """
+    wrapper = _WRAPPER_RE.match(body)
+    start = body.find('{', wrapper.end() if wrapper else 0)
+    if start == -1:
+        return None, 'no JSON object in block'
+    error = None
+    for candidate in _with_repairs(_candidates(body[start:])):
+        try:
+            data, _ = _decoder.raw_decode(candidate)
+        except ValueError as e:
+            error = error or str(e)
+            continue
+        if isinstance(data, dict):
+            return data, None
+        error = f'FORM_DATA is a {type(data).__name__}, not an object'
+    return None, error
+
+
+def _bare_object(text):
+    """Last resort for replies without any marker: a plain object with branch_name"""
+    key = text.find('"branch_name"')
+    if key == -1:
+        return None, None
+    start = text.rfind('{', 0, key)
+    if start == -1:
+        return None, None
+    try:
+        data, end = _decoder.raw_decode(text, start)
+    except ValueError:
+        return None, None
+    return (data, text[start:end]) if isinstance(data, dict) else (None, None)
+
+
+def _next_marker(text, pos):
+    """(start, end) of the first block marker at or after pos, or None"""
+    while True:
+        data = text.find('FORM_DATA', pos)
+        fence = text.find(FENCED_MARKER, pos)
+        if data != -1 and (fence == -1 or data < fence):
+            if data and text[data - 1] == '{':
+                start = data - 2 if data > 1 and text[data - 2] == '{' else data - 1
+                if fence == -1 or start < fence:
+                    return start, data + len('FORM_DATA')
+            pos = data + 1
+            continue
+        if fence != -1:
+            return fence, fence + len(FENCED_MARKER)
+        return None
+
+
+def parse_response(text):
+    """Find, decode and strip every FORM_DATA / ```json block in one pass.
+
+    Brace-delimited blocks end at the brace that balances their opening one
+    (braces inside strings don't count, so nested objects are safe); fenced
+    blocks end at the closing ```. An unterminated block runs to the end of
+    the text and is removed from the visible text all the same.
+    """
+    visible = []
+    form_data = raw = error = None
+    found = False
+    pos = 0
+    while True:
+        marker = _next_marker(text, pos)
+        if marker is None:
+            break
+        found = True
+        start, body_start = marker
+        visible.append(text[pos:start])
+        if text[start] == '`':
+            close = text.find(FENCE, body_start)
+            end = len(text) if close == -1 else close + len(FENCE)
+            body = text[body_start:close if close != -1 else end]
+        else:
+            close = BraceScanner().feed(text, start)
+            end = len(text) if close == -1 else close
+            body = text[body_start:end]
+        if form_data is None:
+            data, problem = decode_payload(body)
+            if data is not None:
+                form_data, raw, error = data, text[start:end], None
+            elif error is None:
+                error = problem
+        pos = end
+    visible.append(text[pos:])
+
+    if not found:
+        form_data, raw = _bare_object(text)
+    return ParsedResponse(''.join(visible).strip(), form_data, raw, error)
@@ -0,0 +1,102 @@
+# Incremental FORM_DATA detection for streamed model responses
+
+from form_data_parser import BLOCK_MARKERS, FENCE, BraceScanner
+
+
+class FormDataStreamParser:
+    """Split a stream of text deltas into visible text and FORM_DATA blocks.
+
+    feed() returns a list of (kind, text) events where kind is 'text' for
+    text that is safe to show and 'form_data' for a complete FORM_DATA or
+    ```json block. Text that could be the start of a marker is held back
+    until the next delta decides it.
+    """
+
+    def __init__(self):
+        self._pending = ''       # visible text not yet emitted (possible marker prefix)
+        self._block = None       # raw text of the block being captured
+        self._block_fenced = False
+        self._scanner = None
+
+    def feed(self, delta):
+        """Consume one text delta and return the events it completes"""
+        events = []
+        text = delta
+        while text:
+            if self._block is not None:
+                text = self._feed_block(text, events)
+            else:
+                text = self._feed_visible(text, events)
+        return events
+
+    def close(self):
+        """Flush whatever is left at the end of the stream"""
+        events = []
+        if self._block is None and self._pending:
+            events.append(('text', self._pending))
+        # An unterminated block is dropped from the visible text on purpose
+        self._pending = ''
+        self._block = None
+        return events
+
+    def _feed_visible(self, text, events):
+        buf = self._pending + text
+        self._pending = ''
+
+        # Earliest complete marker in the buffer
+        start = -1
+        for marker in BLOCK_MARKERS:
+            pos = buf.find(marker)
+            if pos != -1 and (start == -1 or pos < start):
+                start = pos
+
+        if start != -1:
+            if start:
+                events.append(('text', buf[:start]))
+            self._begin_block(buf.startswith(FENCE, start))
+            return buf[start:]
+
+        # Hold back a tail that could still grow into a marker
+        hold = 0
+        for marker in BLOCK_MARKERS:
+            for size in range(min(len(marker) - 1, len(buf)), 0, -1):
+                if buf.endswith(marker[:size]):
+                    hold = max(hold, size)
+                    break
+        if hold:
+            self._pending = buf[-hold:]
+            buf = buf[:-hold]
+        if buf:
+            events.append(('text', buf))
+        return ''
+
+    def _begin_block(self, fenced):
+        self._block = ''
+        self._block_fenced = fenced
+        self._scanner = None if fenced else BraceScanner()
+
+    def _feed_block(self, text, events):
+        if self._block_fenced:
+            # Fenced blocks end at the closing ``` after the opening one
+            combined = self._block + text
+            end = combined.find(FENCE, len(FENCE))
+            if end == -1:
+                self._block = combined
+                return ''
+            consumed = end + len(FENCE) - len(self._block)
+            self._block = combined[:end + len(FENCE)]
+            self._end_block(events)
+            return text[consumed:]
+
+        # Brace-balanced block, ignoring braces inside JSON strings
+        end = self._scanner.feed(text)
+        if end == -1:
+            self._block += text
+            return ''
+        self._block += text[:end]
+        self._end_block(events)
+        return text[end:]
+
+    def _end_block(self, events):
+        events.append(('form_data', self._block))
+        self._block = None
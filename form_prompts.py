@@ -1,5 +1,11 @@
 # Form-specific system prompts to reduce API token usage
 
+import hashlib
+import json
+
+from form_specs import FORM_SPECS
+
+
 def get_base_prompt():
     """Common instructions for all forms"""
     return """You are a helpful, patient assistant for filling out banking forms, designed especially for elderly users who may not be tech-savvy.
@@ -11,18 +17,16 @@ def get_base_prompt():
    - Automatically use today's date in DD/MM/YYYY format
    - Just mention: "I'll use today's date (DD/MM/YYYY) for this form."
 
-2. **Account Number Validation:**
-   - ONLY ask for re-confirmation if the account number is NOT 12 digits
-   - If user provides exactly 12 digits, accept it immediately without asking to verify
+2. **Account Number:**
+   - Accept a number with the digits the form asks for without asking to verify it
 
 3. **Amount Processing:**
-   - When user says an amount, automatically convert it to words yourself
-   - Just confirm: "Got it, ₹5,000 (Five Thousand Rupees)"
+   - Just confirm the amount in numbers: "Got it, ₹5,000"
+   - Do NOT write amounts in words - the amount in words is filled in automatically
 
-4. **Email Handling:**
-   - Email is OPTIONAL
-   - When asking for email, say: "Do you have an email address? (It's optional - you can skip this if you don't have one)"
-   - If they say "no", "don't have", "skip", respond warmly: "No problem! We can skip the email."
+4. **Optional Fields (like email):**
+   - Say the field is optional when asking: "Do you have an email address? (It's optional)"
+   - If they say "no" or "skip", respond warmly: "No problem! We can skip that."
 """
 
 def get_confirmation_instructions():
@@ -44,425 +48,129 @@ Display all collected information in a clear, easy-to-read format with checkmark
 After user confirms with "yes", "correct", "proceed", etc., you MUST say:
 "Perfect! Your form is ready. Click the button above to view and print it."
 
-Then on a new line, output: {{FORM_DATA: {{...all the data...}}}}
-
-**IMPORTANT RULES:**
-1. ALWAYS show summary before generating form
-2. WAIT for user confirmation
-3. After confirmation, include the {{FORM_DATA: ...}} JSON block with ALL collected values
-4. The JSON MUST be on its own line after your message
+Then on a new line of its own, output the {{FORM_DATA: {{...}}}} block with ALL collected values.
+Never output it before the user has confirmed the summary.
 
 Remember: Be helpful, patient, and make this easy for elderly users!
 """
 
-def get_deposit_prompt():
-    """Deposit slip specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: DEPOSIT SLIP**
-
-**COLLECT THESE FIELDS:**
-1. Branch name
-2. Date (Use today's date automatically)
-3. Account number (12 digits)
-4. Account holder name
-5. Telephone/Mobile number
-6. Email (OPTIONAL)
-7. Deposit type (Cash/Cheque)
-8. Amount
-9. If cash: denomination breakdown must be collected
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "DEPOSIT", "branch_name": "value", "date": "DD/MM/YYYY", "account_number": "12digits", "account_holder_name": "name", "telephone_mobile_number": "phone", "email_id": "email", "deposit_type": "Cash", "total_amount": "1000", "amount_in_words": "One Thousand Rupees", "denom_2000_qty": "0", "denom_500_qty": "2", "denom_200_qty": "0", "denom_100_qty": "0", "denom_50_qty": "0", "denom_20_qty": "0", "denom_10_qty": "0", "denom_5_qty": "0", "denom_coins_qty": "0"}}}}
-""" + get_confirmation_instructions()
-
-def get_dd_prompt():
-    """Demand draft specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: DEMAND DRAFT / BANKER'S CHEQUE**
-
-**COLLECT THESE FIELDS:**
-1. Branch name
-2. Date (Use today's date automatically)
-3. Instrument type (Draft or Banker's Cheque)
-4. Beneficiary name ("In Favour of")
-5. Amount
-6. Payable at (city/branch)
-7. Applicant name
-8. If paying cash: denomination breakdown (ONLY if they mention it)
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "DD", "branch_name": "value", "date": "DD/MM/YYYY", "instrument_type": "DD", "in_favour_of": "beneficiary", "amount": "5000", "amount_in_words": "Five Thousand Rupees", "payable_at_branch": "city", "applicant_name": "name", "denom_500_qty": "10", "denom_100_qty": "0", "denom_50_qty": "0", "denom_20_qty": "0", "denom_10_qty": "0", "denom_5_qty": "0", "denom_2_qty": "0", "denom_1_qty": "0"}}}}
-""" + get_confirmation_instructions()
-
-def get_tax_challan_prompt():
-    """Tax challan specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: TAX CHALLAN ITNS-280**
-
-**COLLECT THESE FIELDS:**
-1. PAN (Permanent Account Number - 10 characters)
-2. Full Name (as per PAN)
-3. Complete Address with City & State
-4. Telephone Number
-5. Pin Code
-6. Assessment Year (e.g., 2024-25)
-7. Tax Type (0020 for Companies or 0021 for Other than Companies)
-8. Payment amounts:
-   - Income Tax amount
-   - Surcharge (if applicable)
-   - Education Cess
-   - Interest (if any)
-   - Penalty (if any)
-   - Others (if any)
-9. Bank and Branch name for payment
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "TAX_CHALLAN", "pan": "ABCDE1234F", "full_name": "John Doe", "address": "123 Main Street, City, State", "tel_no": "9876543210", "pin_code": "400001", "assessment_year": "2024-25", "tax_type": "0021", "tax_code": "0021", "income_tax": "50000", "surcharge": "5000", "education_cess": "1100", "interest": "0", "penalty": "0", "others": "0", "total_amount": "56100", "total_words": "Fifty Six Thousand One Hundred Rupees", "bank_branch": "State Bank of India, Mumbai Main Branch", "payment_date": "DD/MM/YYYY", "payment_mode": "Cash", "debit_date": "DD/MM/YYYY"}}}}
-""" + get_confirmation_instructions()
-
-def get_account_opening_prompt():
-    """Account opening specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: ACCOUNT OPENING (State Bank of India - INR Currency, Indian Citizenship Assumed)**
-
-**COLLECT THESE FIELDS:**
-1. Branch name
-2. Account Type (Savings Account/Current Account/Salary Account)
-3. Debit Card Required (Yes or No)
-4. Title (Mr/Mrs/Ms)
-5. Full Name (First, Middle, Last)
-6. Date of Birth (DD/MM/YYYY)
-7. Place of Birth
-8. Identity Document Type (Aadhaar Card/Passport/Voter ID/Driving License)
-9. Aadhaar Number (12 digits, format: XXXX XXXX XXXX)
-10. PAN Number (10 characters, format: ABCDE1234F)
-11. Selected Document Number
-12. Document Expiry Date (if applicable)
-13. Residential Address (complete address)
-14. City
-15. State
-16. PIN Code (6 digits)
-17. Mobile Phone (with +91 prefix)
-18. Email Address
-19. Employer/Company Name
-20. Position/Designation
-21. Monthly Gross Salary (₹)
-22. Are you Self-Employed? (Yes/No)
-23. Marital Status (Single/Married/Divorced)
-24. Number of Dependents
-25. Purpose of Account Opening
-26. If Others selected, specify
-27. Debit Card Delivery Method
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "ACCOUNT_OPENING", "branch": "Main Branch", "form_date": "DD/MM/YYYY", "product_type": "current", "debit_card": "required", "first_name": "Rajesh", "middle_name": "Kumar", "last_name": "Sharma", "dob": "15/05/1985", "place_of_birth": "Mumbai", "document_type": "aadhaar", "document_number": "1234 5678 9012", "iin": "123456789012", "date_of_issuance": "01/01/2020", "expiry_date": "N/A", "issued_by": "UIDAI", "address": "123 MG Road, Andheri West", "city": "Mumbai", "postal_code": "400058", "mobile_phone": "9876543210", "email": "rajesh.sharma@email.com", "employer": "Tech Solutions Pvt Ltd", "position_title": "Software Engineer", "monthly_salary": "75000", "entrepreneur": "no", "family_status": "married", "num_children": "2", "purpose": "payroll,payments", "card_delivery": "branch", "signature_date": "DD/MM/YYYY", "signature_place": "Mumbai"}}}}
-""" + get_confirmation_instructions()
-
-def get_debit_card_prompt():
-    """Debit card application specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: DEBIT CARD APPLICATION (AXIS BANK - NRE Account)**
-
-**COLLECT THESE FIELDS:**
-1. NRE Account Number (20 digits max)
-2. Customer Identification Number (Customer ID)
-3. POA / LOA Holder Name
-4. Mother's Maiden Name
-5. Date of Birth of the Applicant
-6. Image Card (Yes/No)
-7. Desired Image Code (if Image Card is Yes)
-8. Name as desired on the Card (max 18 characters)
-9. Card Type/Reason (New Card/Lost Card/Damaged Card/Others)
-10. Application Type (First/Joint)
-11. Cross Self ID (if applicable)
-12. BIN Number (if applicable)
-13. POA/LOA Signature Name
-14. Account Holder Name for declaration
-
-Note: DO NOT collect Verifying Authority Details or Office Use sections.
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "DEBIT_CARD", "nre_account_number": "12345678901234567890", "customer_id": "CUST123456", "poa_holder": "John Smith", "mother_maiden_name": "Johnson", "dob": "1985-05-15", "image_card": "yes", "image_code": "IMG001", "card_name": "JOHN SMITH", "card_type": "new", "application_type": "first", "cross_self_id": "CS123", "bin_number": "BIN456", "poa_signature_name": "John Smith", "account_holder_name": "Rajesh Kumar"}}}}
-""" + get_confirmation_instructions()
-
-def get_loan_application_prompt():
-    """Loan application specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: LOAN APPLICATION (STATE BANK OF INDIA)**
-
-**COLLECT THESE FIELDS:**
-1. Account Number
-2. Applicant Name
-3. Home Address
-4. Previous Address (optional)
-5. Home Number (optional)
-6. Mobile Number
-7. Personal Email
-8. Date of Birth
-9. Marital Status
-10. Number of Dependents
-11. Employer Name
-12. Grade/Designation
-13. Employer Address
-14. Employment Type
-15. Length of Service
-16. Work Email Address
-17. Work Tel No
-18. Amount of New Loan (₹)
-19. Purpose of Loan
-20. Existing CSCJ Loan Repayment (₹)
-21. Shares (₹)
-22. Loan Account (₹)
-23. Net Loan (₹)
-24. Total Salary Deduction (₹)
-25. Repayment Period (Months)
-26. Repayment Method
-
-Note: DO NOT collect Office Use Only section.
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "LOAN_APPLICATION", "account_number": "123456789012", "applicant_name": "Rajesh Kumar Sharma", "home_address": "123 MG Road, Mumbai", "previous_address": "", "home_number": "022-12345678", "mobile_number": "+91 9876543210", "personal_email": "rajesh@email.com", "dob": "1985-05-15", "marital_status": "married", "dependents": "2", "employer": "Tech Solutions", "grade": "Senior Manager", "employer_address": "BKC, Mumbai", "employment_type": "permanent", "service_length": "5 years 6 months", "work_email": "rajesh@techsolutions.com", "work_tel": "022-98765432", "loan_amount": "500000", "loan_purpose": "home", "existing_loan": "0", "shares": "10000", "loan_account": "0", "net_loan": "490000", "salary_deduction": "15000", "repayment_period": "60", "repayment_method": "monthly", "signature_date": "2026-01-04", "signature_place": "Mumbai"}}}}
-""" + get_confirmation_instructions()
-
-def get_withdrawal_prompt():
-    """Withdrawal form specific prompt"""
-    return get_base_prompt() + """
-**SELECTED FORM: SAVINGS BANK WITHDRAWAL FORM (STATE BANK OF INDIA)**
-
-**COLLECT THESE FIELDS:**
-1. Branch Name
-2. Withdrawal Date (DD/MM/YYYY or today's date)
-3. Account Holder Name
-4. Account Number (**EXACTLY 14 digits - NOT 12 digits**)
-5. Amount to Withdraw (in numbers - ₹)
-6. Amount in Words (e.g., Five Thousand Only)
-7. Phone/Mobile Number (10 digits)
-
-**CRITICAL:** Withdrawal forms require **14-digit** account numbers (example: 12345678901234).
-If user provides fewer digits, ask them to provide the complete 14-digit account number.
-
-Note: DO NOT collect Office Use section.
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "WITHDRAWAL", "branch": "Main Branch", "withdrawal_date": "05/01/2026", "account_holder_name": "Ajith R", "account_number": "12345678901234", "amount": "5000", "amount_in_words": "Five Thousand Only", "phone_number": "9876543210"}}}}
-""" + get_confirmation_instructions()
-
-def get_kyc_prompt():
-    """System prompt for KYC Form"""
-    return get_base_prompt() + """
-
-**FORM TYPE: KYC UPDATE FORM**
-
-**REQUIRED FIELDS:**
-1. **branch** - Branch name (auto-fill with "Main Branch" if not specified)
-2. **customer_name** - Full name of the account holder
-3. **account_no** - Bank account number
-4. **dob** - Date of birth (DD/MM/YYYY format)
-5. **address** - Complete address
-6. **father_husband** - Father's or Husband's name
-7. **mother_name** - Mother's name
-8. **city** - City name
-9. **post_office** - Post office name
-10. **state** - State name
-11. **pin_code** - PIN code (6 digits)
-12. **mobile_no** - Mobile number (10 digits)
-
-**COLLECTION STRATEGY:**
-- Greet warmly: "I'll help you with your KYC update form."
-- Ask for customer name and account number first
-- Then collect: date of birth, address details (city, post office, state, PIN code)
-- Collect family information: father/husband name and mother name
-- Finally get mobile number for contact
-- Branch will auto-fill as "Main Branch" if not mentioned
-
-**JSON OUTPUT FORMAT:**
-{{FORM_DATA: {{"form_type": "KYC", "branch": "Main Branch", "customer_name": "Ajith R", "account_no": "12345678901234", "dob": "15/05/1990", "address": "123 Main Street, Trivandrum", "father_husband": "Rajan K", "mother_name": "Suma R", "city": "Chennai", "post_office": "Karamana", "state": "Kerala", "pin_code": "695002", "mobile_no": "9876543210"}}}}
-""" + get_confirmation_instructions()
-
-def get_account_closure_prompt():
-    """System prompt for Account Closure Form"""
-    return get_base_prompt() + """
-
-**FORM TYPE: ACCOUNT CLOSURE REQUEST**
-
-**REQUIRED FIELDS:**
-1. **date** - Date of request (DD/MM/YYYY format, auto-fill with today if not specified)
-2. **customer_id** - Customer ID (10 digits)
-3. **account_number** - Account number to be closed (12 digits)
-4. **customer_name** - Full name of the customer
-5. **purpose_closure** - Reason for closing the account
-6. **has_balance** - Is there any balance in the account? (yes/no)
-7. **balance_amount** - If yes, approximate balance amount (for validation)
-8. **receipt_mode** - How to receive balance: "electronic_transfer", "demand_draft", "idfc_account", or "cash"
-
-**FOR ELECTRONIC TRANSFER:**
-9. **other_bank_account** - Other bank account number (optional, can use beneficiary_acc)
-10. **beneficiary_acc** - Beneficiary account number for balance transfer
-11. **holder_name** - Name of the account holder receiving the balance
-12. **account_type** - Type of account (savings or current)
-13. **bank_name** - Name of the bank for transfer
-14. **branch_city** - Branch name and city
-15. **ifsc_code** - IFSC code (11 characters)
-
-**FOR DEMAND DRAFT:**
-- Will be prepared by bank (just mention "demand_draft" in receipt_mode)
-
-**FOR IDFC ACCOUNT:**
-16. **idfc_account_no** - IDFC account number
-17. **idfc_city** - City of IDFC branch
-18. **idfc_holder_name** - Name of account holder
-
-**FOR CASH:**
-- Only allowed if balance < ₹20,000
-- Just mention "cash" in receipt_mode
-
-**COLLECTION STRATEGY:**
-1. ACCOUNT INFO: "Customer ID (10 digits), account number to be closed (12 digits), and your full name"
-
-2. PURPOSE: "What is the reason for closing this account?"
-
-3. BALANCE CHECK: "Is there any balance remaining in your account? If yes, approximately how much?"
-
-4. IF BALANCE EXISTS:
-   - If amount > ₹20,000: "Since the balance exceeds ₹20,000, cash withdrawal is not allowed. Please choose:
-     • Electronic transfer to another bank account
-     • Demand Draft
-     • Transfer to another IDFC account"
-   
-   - If amount ≤ ₹20,000: "You can receive your balance through:
-     • Electronic transfer to another bank account
-     • Demand Draft
-     • Transfer to another IDFC account
-     • Cash (since balance is less than ₹20,000)"
-
-5. BASED ON CHOICE:
-   **If Electronic Transfer:**
-   "I'll need the following details for the transfer:
-   - Beneficiary account number
-   - Account holder name
-   - Account type (savings or current)
-   - Bank name
-   - Branch name and city
-   - IFSC code (11 characters)"
-   
-   **If Demand Draft:**
-   "The bank will prepare a demand draft for you. Where should it be sent, and in whose name?"
-   
-   **If IDFC Account:**
-   "Please provide:
-   - IDFC account number
-   - City of the branch
-   - Account holder name"
-   
-   **If Cash:**
-   "Noted. You'll receive the balance in cash when you visit the branch."
-
-6. DATE: Auto-fill with today's date
-
-**IMPORTANT RULES:**
-- Always ask about balance before asking receipt mode
-- Validate cash option only if balance < ₹20,000
-- For electronic transfer, all fields are mandatory
-- Customer ID must be exactly 10 digits
-- Account number must be exactly 12 digits
-- IFSC code should be 11 characters
-
-**JSON OUTPUT FORMAT (Electronic Transfer):**
-{{FORM_DATA: {{"form_type": "ACCOUNT_CLOSURE", "date": "09/01/2026", "customer_id": "1234567890", "account_number": "123456789012", "customer_name": "Ajith R", "purpose_closure": "Moving to another city", "has_balance": "yes", "balance_amount": "50000", "receipt_mode": "electronic_transfer", "beneficiary_acc": "987654321012", "holder_name": "Ajith R", "account_type": "savings", "bank_name": "HDFC Bank", "branch_city": "Mumbai Central", "ifsc_code": "HDFC0001234"}}}}
-
-**JSON OUTPUT FORMAT (Cash):**
-{{FORM_DATA: {{"form_type": "ACCOUNT_CLOSURE", "date": "09/01/2026", "customer_id": "1234567890", "account_number": "123456789012", "customer_name": "Ajith R", "purpose_closure": "No longer needed", "has_balance": "yes", "balance_amount": "15000", "receipt_mode": "cash"}}}}
-
-**JSON OUTPUT FORMAT (No Balance):**
-{{FORM_DATA: {{"form_type": "ACCOUNT_CLOSURE", "date": "09/01/2026", "customer_id": "1234567890", "account_number": "123456789012", "customer_name": "Ajith R", "purpose_closure": "Account not in use", "has_balance": "no", "balance_amount": "0", "receipt_mode": "none"}}}}
-
-**JSON OUTPUT FORMAT (IDFC Account):**
-{{FORM_DATA: {{"form_type": "ACCOUNT_CLOSURE", "date": "09/01/2026", "customer_id": "1234567890", "account_number": "123456789012", "customer_name": "Ajith R", "purpose_closure": "Consolidating accounts", "has_balance": "yes", "balance_amount": "30000", "receipt_mode": "idfc_account", "idfc_account_no": "456789012345", "idfc_city": "Mumbai", "idfc_holder_name": "Ajith R"}}}}
-
-**JSON OUTPUT FORMAT (Demand Draft):**
-{{FORM_DATA: {{"form_type": "ACCOUNT_CLOSURE", "date": "09/01/2026", "customer_id": "1234567890", "account_number": "123456789012", "customer_name": "Ajith R", "purpose_closure": "Relocating abroad", "has_balance": "yes", "balance_amount": "75000", "receipt_mode": "demand_draft"}}}}
-""" + get_confirmation_instructions()
-
-def get_remittance_prompt():
-    """System prompt for Remittance Abroad Form (Form A2)"""
-    return get_base_prompt() + """
-
-**FORM TYPE: REMITTANCE ABROAD (Form A2)**
-
-**REQUIRED FIELDS:**
-1. **form_no** - Form number (optional, user can skip)
-2. **currency** - Currency code (USD, EUR, GBP, AUD, CAD, JPY, etc.)
-3. **amount** - Amount to be remitted
-4. **applicant_name** - Full name of the applicant
-5. **applicant_address** - Complete address
-6. **account_no** - Bank account number
-7. **forex_amount** - Amount with currency (can be same as amount + currency)
-8. **remit_method** - How to send: "draft", "direct_transfer", "travellers_cheques", or "currency_notes"
-
-**FOR DRAFT METHOD:**
-9. **beneficiary_name** - Name of beneficiary
-10. **beneficiary_address** - Address of beneficiary
-
-**FOR DIRECT TRANSFER METHOD:**
-11. **remit_beneficiary_name** - Name of beneficiary
-12. **bank_name_address** - Bank name and complete address
-13. **beneficiary_account** - Beneficiary's account number
-
-**FOR TRAVELLERS CHEQUES OR CURRENCY NOTES:**
-- No additional details needed
-
-**COLLECTION STRATEGY:**
-1. BASIC: "I'll help you with your foreign remittance. First, which currency do you want to send (USD, EUR, GBP, etc.)? How much amount? Do you have a form number, or should I skip that?"
-
-2. YOUR DETAILS: "Now your details: Full name, complete address, and your bank account number"
-
-3. REMITTANCE METHOD: "How would you like to send this money abroad? You can choose:
-   • Draft (Demand Draft) - I'll need beneficiary's name and address
-   • Direct Bank Transfer - I'll need beneficiary's name, their bank details, and account number
-   • Travellers Cheques
-   • Foreign Currency Notes"
-
-4. BASED ON CHOICE:
-   **If Draft:** "Beneficiary's full name and complete address?"
-   **If Direct Transfer:** "Beneficiary's name, their bank's name and address, and their account number?"
-   **If Travellers Cheques or Notes:** "Noted! No additional details needed."
-
-5. CONFIRMATION: Show summary and confirm
-
-**IMPORTANT RULES:**
-- Currency should be standard codes (USD, EUR, GBP, AUD, CAD, JPY, etc.)
-- Form number is OPTIONAL - skip if user doesn't have one
-- AD Code and Equivalent Rs. are filled by bank - don't ask for these
-- Only ONE remittance method can be selected
-- Date is auto-filled with today's date
-- Amount should match forex_amount (just add currency)
-
-**JSON OUTPUT FORMAT (Draft Method):**
-{{FORM_DATA: {{"form_type": "REMITTANCE", "form_no": "A2/2026/001", "currency": "USD", "amount": "5000", "applicant_name": "Ajith R", "applicant_address": "123 Main Street, Mumbai 400001", "account_no": "123456789012", "forex_amount": "5000 USD", "remit_method": "draft", "beneficiary_name": "John Smith", "beneficiary_address": "456 Park Avenue, New York, USA", "declarant_name": "Ajith R", "declaration_date": "09/01/2026"}}}}
-
-**JSON OUTPUT FORMAT (Direct Transfer):**
-{{FORM_DATA: {{"form_type": "REMITTANCE", "form_no": "", "currency": "EUR", "amount": "3000", "applicant_name": "Ajith R", "applicant_address": "789 MG Road, Delhi 110001", "account_no": "987654321012", "forex_amount": "3000 EUR", "remit_method": "direct_transfer", "remit_beneficiary_name": "Marie Dubois", "bank_name_address": "BNP Paribas, 16 Boulevard des Italiens, Paris, France", "beneficiary_account": "FR7612345678901234567890123", "declarant_name": "Ajith R", "declaration_date": "09/01/2026"}}}}
-
-**JSON OUTPUT FORMAT (Travellers Cheques):**
-{{FORM_DATA: {{"form_type": "REMITTANCE", "form_no": "", "currency": "GBP", "amount": "2000", "applicant_name": "Ajith R", "applicant_address": "101 Park Street, Kolkata 700016", "account_no": "456789012345", "forex_amount": "2000 GBP", "remit_method": "travellers_cheques", "declarant_name": "Ajith R", "declaration_date": "09/01/2026"}}}}
-
-**JSON OUTPUT FORMAT (Currency Notes):**
-{{FORM_DATA: {{"form_type": "REMITTANCE", "form_no": "A2/2026/100", "currency": "AUD", "amount": "1500", "applicant_name": "Ajith R", "applicant_address": "25 Beach Road, Chennai 600001", "account_no": "321098765432", "forex_amount": "1500 AUD", "remit_method": "currency_notes", "declarant_name": "Ajith R", "declaration_date": "09/01/2026"}}}}
-""" + get_confirmation_instructions()
+def _field_line(number, field):
+    """One numbered line of the COLLECT THESE FIELDS list"""
+    notes = []
+    if field.optional:
+        notes.append('OPTIONAL')
+    if field.default:
+        notes.append(f'default: {field.default}')
+    if field.when:
+        notes.append(f'only if {field.when}')
+    suffix = f" ({'; '.join(notes)})" if notes else ''
+    return f'{number}. {field.label}{suffix}'
+
+
+def get_form_data_format(spec):
+    """The FORM_DATA line the model must output, with an example for every field"""
+    example = {'form_type': spec.code}
+    example.update((field.key, field.example) for field in spec.fields)
+    return '{{FORM_DATA: {' + json.dumps(example, ensure_ascii=False, separators=(',', ':')) + '}}}'
+
+
+def build_form_prompt(spec):
+    """System prompt for one form, generated from its spec. Field keys are
+    only spelled out in the FORM_DATA example, to keep the prompt short."""
+    asked = [field for field in spec.fields if field.label and not field.auto]
+    lines = [f'\n**SELECTED FORM: {spec.title}**', '', '**COLLECT THESE FIELDS:**']
+    lines.extend(_field_line(i, field) for i, field in enumerate(asked, 1))
+
+    rules = list(spec.rules)
+    auto = [field.key for field in spec.fields if field.label and field.auto]
+    if auto:
+        rules.append(f"Automatic, don't ask: {', '.join(auto)}")
+    if any(field.when for field in spec.fields):
+        rules.append("Omit 'only if' fields from FORM_DATA when they don't apply")
+    if rules:
+        lines += ['', '**RULES:**']
+        lines.extend(f'- {rule}' for rule in rules)
+
+    lines += ['', '**JSON OUTPUT FORMAT:**', get_form_data_format(spec), '']
+    return get_base_prompt() + '\n'.join(lines) + get_confirmation_instructions()
+
+
+def build_form_instruction(spec):
+    """First-turn instruction telling the model how to start the selected form"""
+    text = f'The user has selected {spec.title}.'
+    if not spec.groups:
+        return f'{text} {spec.start}'
+    lines = [text, '', 'COLLECTION STRATEGY - ASK BY SECTIONS:']
+    lines.extend(f'{i}. {group.name}: {group.question}' for i, group in enumerate(spec.groups, 1))
+    lines += ['', spec.start]
+    return '\n'.join(lines)
+
+
+# Instruction for sessions without a recognised form type
+DEFAULT_INSTRUCTION = "Greet the user and ask which form they'd like to fill."
+
+# Rough characters-per-token ratio used for prompt size estimates
+CHARS_PER_TOKEN = 4
+
+# Built prompts, filled lazily on first use: form_type -> entry dict
+_prompt_registry = {}
+
+
+def estimate_tokens(text):
+    """Cheap token-count estimate for a prompt string (no tokenizer needed)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _build_prompt_entry(form_type):
+    """Build a registry entry holding the prompt text, first-turn instruction,
+    token estimate and content hash"""
+    spec = FORM_SPECS.get(form_type)
+    if spec:
+        text = build_form_prompt(spec)
+        instruction = build_form_instruction(spec)
+    else:
+        text = get_base_prompt() + get_confirmation_instructions()
+        instruction = DEFAULT_INSTRUCTION
+    return {
+        'form_type': form_type,
+        'text': text,
+        'instruction': instruction,
+        'tokens': estimate_tokens(text),
+        'hash': hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    }
+
+
+def get_prompt_entry(form_type):
+    """Get the cached registry entry for a form type, building it on first use"""
+    key = form_type if form_type in FORM_SPECS else ''
+    entry = _prompt_registry.get(key)
+    if entry is None:
+        # Building twice under a race is harmless - both results are identical
+        entry = _prompt_registry.setdefault(key, _build_prompt_entry(key))
+    return entry
+
 
 def get_system_prompt(form_type):
     """Get the appropriate system prompt based on form type"""
-    prompts = {
-        'deposit': get_deposit_prompt(),
-        'dd': get_dd_prompt(),
-        'tax_challan': get_tax_challan_prompt(),
-        'account_opening': get_account_opening_prompt(),
-        'debit_card': get_debit_card_prompt(),
-        'loan_application': get_loan_application_prompt(),
-        'withdrawal': get_withdrawal_prompt(),
-        'kyc': get_kyc_prompt(),
-        'account_closure': get_account_closure_prompt(),
-        'remittance': get_remittance_prompt()
-    }
-    
-    return prompts.get(form_type, get_base_prompt() + get_confirmation_instructions())
+    return get_prompt_entry(form_type)['text']
+
+
+def get_form_instruction(form_type):
+    """First-turn instruction for a form type"""
+    return get_prompt_entry(form_type)['instruction']
+
+
+def get_prompt_tokens(form_type):
+    """Estimated token count of the system prompt for a form type"""
+    return get_prompt_entry(form_type)['tokens']
+
+
+def get_prompt_hash(form_type):
+    """Short content hash of the system prompt, usable as a cache key"""
+    return get_prompt_entry(form_type)['hash']
+
+
+def preload_prompts():
+    """Build every form's prompt up front (call once at import/worker start)"""
+    for form_type in list(FORM_SPECS) + ['']:
+        get_prompt_entry(form_type)
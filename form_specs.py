@@ -0,0 +1,447 @@
+# Declarative form specifications: the single source for each form's fields,
+# question groups, validators, defaults and FORM_DATA schema. System prompts,
+# first-turn instructions, local field extraction and FORM_DATA checks are all
+# generated from these.
+
+from collections import namedtuple
+from types import MappingProxyType
+
+# key      FORM_DATA key
+# label    how the field is described to the model; None = output-only
+#          (the model fills it in from other answers, it is never asked)
+# example  sample value used in the JSON output format
+# kind     validator for local extraction and FORM_DATA checks (see KINDS)
+# optional the user may skip it
+# auto     filled in without asking (today's date, amount in words...)
+# when     only collected in this case, e.g. "receipt_mode is cash"
+# default  value used when the user doesn't give one
+Field = namedtuple('Field', ['key', 'label', 'example', 'kind', 'optional', 'auto', 'when', 'default'],
+                   defaults=(None, False, False, None, None))
+
+# A batch of fields the assistant asks for in one question
+Group = namedtuple('Group', ['name', 'question'])
+
+FormSpec = namedtuple('FormSpec', ['form_type', 'code', 'title', 'fields', 'groups', 'rules', 'start',
+                                   'account_length'])
+
+# Validator kinds. Kinds in EXTRACTED_KINDS are also pulled out of user
+# messages locally (see field_extractors); a form may use each of those once.
+EXTRACTED_KINDS = frozenset((
+    'account_number', 'customer_id', 'aadhaar', 'pan', 'ifsc', 'mobile', 'pin', 'dob', 'date',
+    'amount', 'balance', 'currency', 'assessment_year'
+))
+KINDS = EXTRACTED_KINDS | {'money', 'count'}
+
+
+def _denominations(values, examples=None):
+    """Output-only note-count fields of a cash denomination table"""
+    examples = examples or {}
+    return tuple(
+        Field(f'denom_{value}_qty', None, examples.get(value, '0'), 'count')
+        for value in values
+    )
+
+
+_SPECS = (
+    FormSpec(
+        form_type='deposit',
+        code='DEPOSIT',
+        title='DEPOSIT SLIP',
+        fields=(
+            Field('branch_name', 'Branch name', 'Main Branch'),
+            Field('date', 'Date', 'DD/MM/YYYY', auto=True),
+            Field('account_number', 'Account number (12 digits)', '123456789012', 'account_number'),
+            Field('account_holder_name', 'Account holder name', 'Ravi Kumar'),
+            Field('telephone_mobile_number', 'Telephone/Mobile number', '9876543210', 'mobile'),
+            Field('email_id', 'Email', 'ravi@email.com', optional=True),
+            Field('deposit_type', 'Deposit type (Cash/Cheque)', 'Cash'),
+            Field('total_amount', 'Amount', '1000', 'amount'),
+            Field('amount_in_words', 'Amount in words', 'One Thousand Rupees', auto=True),
+        ) + _denominations(('2000', '500', '200', '100', '50', '20', '10', '5', 'coins'), {'500': '2'}),
+        groups=(),
+        rules=('If cash: collect the denomination breakdown (number of notes of each value)',),
+        start='Start by greeting them and asking for the branch name.',
+        account_length=12
+    ),
+    FormSpec(
+        form_type='dd',
+        code='DD',
+        title="DEMAND DRAFT / BANKER'S CHEQUE",
+        fields=(
+            Field('branch_name', 'Branch name', 'Main Branch'),
+            Field('date', 'Date', 'DD/MM/YYYY', auto=True),
+            Field('instrument_type', "Instrument type (Draft or Banker's Cheque)", 'DD'),
+            Field('in_favour_of', 'Beneficiary name ("In Favour of")', 'Suresh Menon'),
+            Field('amount', 'Amount', '5000', 'amount'),
+            Field('amount_in_words', 'Amount in words', 'Five Thousand Rupees', auto=True),
+            Field('payable_at_branch', 'Payable at (city/branch)', 'Chennai'),
+            Field('applicant_name', 'Applicant name', 'Ravi Kumar'),
+        ) + _denominations(('500', '100', '50', '20', '10', '5', '2', '1'), {'500': '10'}),
+        groups=(),
+        rules=('If paying cash: collect the denomination breakdown ONLY if they mention it',),
+        start='Start by greeting them and asking for the branch name.',
+        account_length=None
+    ),
+    FormSpec(
+        form_type='tax_challan',
+        code='TAX_CHALLAN',
+        title='TAX CHALLAN ITNS-280',
+        fields=(
+            Field('pan', 'PAN (10 characters)', 'ABCDE1234F', 'pan'),
+            Field('full_name', 'Full name (as per PAN)', 'John Doe'),
+            Field('address', 'Complete address with city & state', '123 Main Street, City, State'),
+            Field('tel_no', 'Telephone number', '9876543210', 'mobile'),
+            Field('pin_code', 'PIN code', '400001', 'pin'),
+            Field('assessment_year', 'Assessment year (e.g. 2024-25)', '2024-25', 'assessment_year'),
+            Field('tax_type', 'Tax type (0020 for Companies or 0021 for Other than Companies)', '0021'),
+            Field('tax_code', None, '0021'),
+            Field('income_tax', 'Income tax amount', '50000', 'money'),
+            Field('surcharge', 'Surcharge', '5000', 'money', optional=True),
+            Field('education_cess', 'Education cess', '1100', 'money'),
+            Field('interest', 'Interest', '0', 'money', optional=True),
+            Field('penalty', 'Penalty', '0', 'money', optional=True),
+            Field('others', 'Others', '0', 'money', optional=True),
+            Field('total_amount', 'Total amount', '56100', 'money', auto=True),
+            Field('total_words', 'Total in words', 'Fifty Six Thousand One Hundred Rupees', auto=True),
+            Field('bank_branch', 'Bank and branch name for payment', 'State Bank of India, Mumbai Main Branch'),
+            Field('payment_date', None, 'DD/MM/YYYY'),
+            Field('payment_mode', None, 'Cash'),
+            Field('debit_date', None, 'DD/MM/YYYY'),
+        ),
+        groups=(),
+        rules=(
+            'tax_code is the same as tax_type',
+            'total_amount is the sum of all payment amounts',
+        ),
+        start='Start by greeting them and asking for their PAN number.',
+        account_length=None
+    ),
+    FormSpec(
+        form_type='account_opening',
+        code='ACCOUNT_OPENING',
+        title='ACCOUNT OPENING FORM for State Bank of India',
+        fields=(
+            Field('branch', 'Branch name', 'Main Branch'),
+            Field('form_date', 'Form date', 'DD/MM/YYYY', auto=True),
+            Field('product_type', 'Account type (savings/current/salary)', 'current'),
+            Field('debit_card', 'Debit card required (yes/no)', 'required'),
+            Field('title', 'Title (Mr/Mrs/Ms)', 'Mr'),
+            Field('first_name', 'First name', 'Rajesh'),
+            Field('middle_name', 'Middle name', 'Kumar', optional=True),
+            Field('last_name', 'Last name', 'Sharma'),
+            Field('dob', 'Date of birth (DD/MM/YYYY)', '15/05/1985', 'dob'),
+            Field('place_of_birth', 'Place of birth', 'Mumbai'),
+            Field('document_type', 'ID document type (Aadhaar Card/Passport/Voter ID/Driving License)', 'aadhaar'),
+            Field('iin', 'Aadhaar number (12 digits)', '123456789012', 'aadhaar'),
+            Field('pan_number', 'PAN (like ABCDE1234F)', 'ABCDE1234F', 'pan'),
+            Field('document_number', "Selected document's number", '1234 5678 9012'),
+            Field('date_of_issuance', None, '01/01/2020'),
+            Field('expiry_date', 'Document expiry date', 'N/A', optional=True),
+            Field('issued_by', None, 'UIDAI'),
+            Field('address', 'Residential address', '12 MG Road, Andheri'),
+            Field('city', 'City', 'Mumbai'),
+            Field('state', 'State (Andhra Pradesh, Tamil Nadu, Karnataka, Kerala, Maharashtra, Gujarat, '
+                           'Rajasthan, Delhi, West Bengal, Uttar Pradesh, Other)', 'Maharashtra'),
+            Field('postal_code', 'PIN code (6 digits)', '400058', 'pin'),
+            Field('mobile_phone', 'Mobile number (with +91)', '9876543210', 'mobile'),
+            Field('email', 'Email address', 'raj@mail.com'),
+            Field('employer', 'Employer name', 'Tech Solutions'),
+            Field('position_title', 'Position/designation', 'Engineer'),
+            Field('monthly_salary', 'Monthly gross salary (₹)', '75000', 'money'),
+            Field('entrepreneur', 'Self-employed (yes/no)', 'no'),
+            Field('family_status', 'Marital status (single/married/divorced)', 'married'),
+            Field('num_children', 'Number of dependents', '2'),
+            Field('purpose', 'Purpose (one or more of salary/savings/business/investments/other)', 'salary,savings'),
+            Field('other_purpose_text', 'Other purpose', '', optional=True, when='purpose includes other'),
+            Field('card_delivery', 'Card delivery (branch/home)', 'branch'),
+            Field('signature_date', None, 'DD/MM/YYYY'),
+            Field('signature_place', None, 'Mumbai'),
+        ),
+        groups=(
+            Group('START', 'Branch, account type (Savings/Current/Salary) and whether a debit card is required'),
+            Group('PERSONAL DETAILS', 'Title (Mr/Mrs/Ms), full name (first, middle, last), date of birth '
+                                      '(DD/MM/YYYY) and place of birth'),
+            Group('DOCUMENTS', "Identity document type, Aadhaar number (12 digits), PAN (10 characters), the "
+                               "selected document's number and its expiry date if applicable"),
+            Group('CONTACT', 'Residential address, city, state, PIN code (6 digits), mobile number (with +91) '
+                             'and email'),
+            Group('EMPLOYMENT', 'Employer/company name, position/designation, monthly gross salary in rupees '
+                                'and whether they are self-employed'),
+            Group('ADDITIONAL INFO', 'Marital status, number of dependents, purpose of account opening (several '
+                                     'allowed) and card delivery preference (Collect from Branch/Home Delivery)'),
+        ),
+        rules=(
+            'Nationality (Indian) and currency (INR) are pre-filled: do not ask or mention them',
+            'signature_place is the city',
+        ),
+        start='Start by greeting and asking for branch, account type, and debit card requirement together.',
+        account_length=None
+    ),
+    FormSpec(
+        form_type='debit_card',
+        code='DEBIT_CARD',
+        title='DEBIT CARD APPLICATION for AXIS BANK (NRE account holders with POA/LOA)',
+        fields=(
+            Field('nre_account_number', 'NRE account number (up to 20 digits)', '12345678901234567890',
+                  'account_number'),
+            Field('customer_id', 'Customer ID', 'CUST123456'),
+            Field('poa_holder', 'POA/LOA holder name', 'John Smith'),
+            Field('mother_maiden_name', "Mother's maiden name", 'Johnson'),
+            Field('dob', 'Date of birth', '1985-05-15', 'dob'),
+            Field('image_card', 'Image card (yes/no)', 'yes'),
+            Field('image_code', 'Desired image code', 'IMG001', when='image_card is yes'),
+            Field('card_name', 'Name on the card (max 18 characters, not a nickname)', 'JOHN SMITH'),
+            Field('card_type', 'Card type (new/lost/damaged/others)', 'new'),
+            Field('application_type', 'Application type (first/joint)', 'first'),
+            Field('cross_self_id', 'Cross Self ID', 'CS123', optional=True),
+            Field('bin_number', 'BIN number', 'BIN456', optional=True),
+            Field('poa_signature_name', 'POA/LOA signature name', 'John Smith'),
+            Field('account_holder_name', 'Account holder name for the declaration', 'Rajesh Kumar'),
+        ),
+        groups=(
+            Group('ACCOUNT DETAILS', 'NRE account number (up to 20 digits), customer ID and the full name of the '
+                                     'POA/LOA holder (Power of Attorney or Letter of Authority holder)'),
+            Group('PERSONAL INFO', "Mother's maiden name, date of birth and the name to print on the card"),
+            Group('IMAGE CARD', 'Would they like an image card? If yes, the desired image code'),
+            Group('CARD TYPE', 'New, lost, damaged or other card, and is it a first or joint application'),
+            Group('OPTIONAL FIELDS', 'Cross Self ID and BIN number if they have them, otherwise skip'),
+            Group('DECLARATION', 'POA/LOA signature name and the account holder name'),
+        ),
+        rules=('Do NOT collect Verifying Authority Details or Office Use sections - bank staff fill those',),
+        start='Start by greeting and asking for their NRE account number, customer ID, and POA/LOA holder name.',
+        account_length=None
+    ),
+    FormSpec(
+        form_type='loan_application',
+        code='LOAN_APPLICATION',
+        title='LOAN APPLICATION FORM for State Bank of India',
+        fields=(
+            Field('account_number', 'Account number', '123456789012', 'account_number'),
+            Field('applicant_name', 'Applicant name', 'Rajesh Sharma'),
+            Field('home_address', 'Home address with PIN code', 'MG Road, Mumbai'),
+            Field('previous_address', 'Previous address (if under 3 years at the current one)', '', optional=True),
+            Field('home_number', 'Landline number', '022-12345678', optional=True),
+            Field('mobile_number', 'Mobile number (with +91)', '+91 9876543210', 'mobile'),
+            Field('personal_email', 'Personal email', 'raj@mail.com'),
+            Field('dob', 'Date of birth', '1985-05-15', 'dob'),
+            Field('marital_status', 'Marital status', 'married'),
+            Field('dependents', 'Number of dependents (excluding children)', '2'),
+            Field('employer', 'Employer name', 'Tech Solutions'),
+            Field('grade', 'Grade/designation', 'Manager'),
+            Field('employer_address', "Employer's address with PIN code", 'BKC, Mumbai'),
+            Field('employment_type', 'Employment type (temporary/permanent)', 'permanent'),
+            Field('service_length', 'Length of service', '5 years'),
+            Field('work_email', 'Work email', 'raj@tech.com'),
+            Field('work_tel', 'Work phone', '022-98765432', optional=True),
+            Field('loan_amount', 'Loan amount (₹)', '500000', 'money'),
+            Field('loan_purpose', 'Purpose (home/vehicle/personal/education/business/other)', 'home'),
+            Field('existing_loan', 'Existing CSCJ loan repayment (₹, 0 if none)', '0', 'money'),
+            Field('shares', 'Shares (₹)', '10000', 'money'),
+            Field('loan_account', 'Loan account (₹)', '0', 'money'),
+            Field('net_loan', 'Net loan (₹)', '490000', 'money'),
+            Field('salary_deduction', 'Total monthly salary deduction (₹)', '15000', 'money'),
+            Field('repayment_period', 'Repayment period (months)', '60'),
+            Field('repayment_method', 'Repayment method (weekly/fortnightly/monthly)', 'monthly'),
+            Field('signature_date', None, '2026-01-04'),
+            Field('signature_place', None, 'Mumbai'),
+        ),
+        groups=(
+            Group('BASIC', 'Account number and full name'),
+            Group('ADDRESS', 'Complete home address with PIN code'),
+            Group('PREVIOUS ADDRESS', 'Lived at the current address for less than 3 years? If yes, the previous '
+                                      'address'),
+            Group('CONTACT', 'Mobile number (with +91) and personal email; landline is optional'),
+            Group('DOB', 'Date of birth (DD/MM/YYYY)'),
+            Group('MARITAL', 'Marital status and number of dependents (excluding children)'),
+            Group('EMPLOYER', 'Employer name and designation/grade'),
+            Group('WORK LOCATION', "Employer's address and PIN code"),
+            Group('EMPLOYMENT', 'Temporary or permanent, and length of service (e.g. 5 years 3 months)'),
+            Group('WORK CONTACT', 'Work email and work phone (optional)'),
+            Group('LOAN BASICS', 'Loan amount in rupees and its purpose'),
+            Group('REPAYMENT', 'Repayment period in months and method (Weekly/Fortnightly/Monthly)'),
+            Group('FINANCIAL 1', 'Existing CSCJ loan repayment amount, or 0 if none'),
+            Group('FINANCIAL 2', 'Shares amount and loan account amount (0 if none)'),
+            Group('FINANCIAL 3', 'Net loan amount and total monthly salary deduction'),
+        ),
+        rules=(
+            'Ask ONLY 1-3 related fields per question',
+            'Do NOT list all remaining fields when the user gives partial information',
+            'Do NOT collect the Office Use Only section',
+        ),
+        start='Start by greeting and asking for account number and full name only.',
+        account_length=None
+    ),
+    FormSpec(
+        form_type='withdrawal',
+        code='WITHDRAWAL',
+        title='SAVINGS BANK WITHDRAWAL FORM for State Bank of India',
+        fields=(
+            Field('branch', 'Branch name', 'Main Branch'),
+            Field('withdrawal_date', "Withdrawal date (DD/MM/YYYY, or today's date)", '05/01/2026', 'date'),
+            Field('account_holder_name', 'Account holder name (as per bank records)', 'Ajith R'),
+            Field('account_number', 'Account number (EXACTLY 14 digits - NOT 12)', '12345678901234',
+                  'account_number'),
+            Field('amount', 'Amount to withdraw (₹)', '5000', 'amount'),
+            Field('amount_in_words', 'Amount in words', 'Five Thousand Only', auto=True),
+            Field('phone_number', 'Phone/mobile number (10 digits)', '9876543210', 'mobile'),
+        ),
+        groups=(
+            Group('ACCOUNT INFO', 'Branch name, account holder name and account number (14 digits)'),
+            Group('AMOUNT', 'How much to withdraw (in rupees)'),
+            Group('CONTACT', 'Phone or mobile number (10 digits)'),
+            Group('DATE', "Withdrawal date (DD/MM/YYYY) - or today's date"),
+        ),
+        rules=(
+            'Withdrawal forms need 14-digit account numbers; if the user gives fewer digits, ask for the '
+            'complete number',
+            'Do NOT collect the Office Use section',
+        ),
+        start='Start by greeting and asking for branch name, account holder name, and account number (14 digits) '
+              'together.',
+        account_length=14
+    ),
+    FormSpec(
+        form_type='kyc',
+        code='KYC',
+        title='KYC UPDATE FORM for existing customers',
+        fields=(
+            Field('branch', 'Branch name', 'Main Branch', optional=True, default='Main Branch'),
+            Field('customer_name', 'Full name', 'Ajith R'),
+            Field('account_no', 'Account number', '12345678901234', 'account_number'),
+            Field('dob', 'Date of birth (DD/MM/YYYY)', '15/05/1990', 'dob'),
+            Field('address', 'Complete address', '123 Main Street, Trivandrum'),
+            Field('father_husband', "Father's or husband's name", 'Rajan K'),
+            Field('mother_name', "Mother's name", 'Suma R'),
+            Field('city', 'City/village', 'Trivandrum'),
+            Field('post_office', 'Post office', 'Karamana'),
+            Field('state', 'State', 'Kerala'),
+            Field('pin_code', 'PIN code (6 digits)', '695002', 'pin'),
+            Field('mobile_no', 'Mobile number (10 digits)', '9876543210', 'mobile'),
+        ),
+        groups=(
+            Group('BASIC INFO', 'Branch name (or Main Branch), full name and account number'),
+            Group('PERSONAL', 'Date of birth (DD/MM/YYYY)'),
+            Group('ADDRESS', 'Complete address, city/village, post office, state and PIN code (6 digits)'),
+            Group('FAMILY', "Father's or husband's name and mother's name"),
+            Group('CONTACT', 'Mobile number (10 digits)'),
+        ),
+        rules=(),
+        start='Start by greeting warmly and asking for customer name and account number.',
+        account_length=None
+    ),
+    FormSpec(
+        form_type='account_closure',
+        code='ACCOUNT_CLOSURE',
+        title='ACCOUNT CLOSURE REQUEST FORM for IDFC First Bank',
+        fields=(
+            Field('date', 'Date of request', '09/01/2026', 'date', auto=True),
+            Field('customer_id', 'Customer ID (10 digits)', '1234567890', 'customer_id'),
+            Field('account_number', 'Account number to close (12 digits)', '123456789012', 'account_number'),
+            Field('customer_name', 'Full name', 'Ajith R'),
+            Field('purpose_closure', 'Reason for closing', 'Moving to another city'),
+            Field('has_balance', 'Any balance left (yes/no)', 'yes'),
+            Field('balance_amount', 'Approximate balance (₹, 0 if none)', '50000', 'balance'),
+            Field('receipt_mode', 'How to receive the balance (electronic_transfer/demand_draft/idfc_account/'
+                                  'cash, or none if no balance)', 'electronic_transfer'),
+            Field('beneficiary_acc', 'Beneficiary account number', '987654321012',
+                  when='receipt_mode is electronic_transfer'),
+            Field('other_bank_account', 'Other bank account number', '', optional=True,
+                  when='receipt_mode is electronic_transfer'),
+            Field('holder_name', 'Name of the account holder receiving the balance', 'Ajith R',
+                  when='receipt_mode is electronic_transfer'),
+            Field('account_type', 'Account type (savings/current)', 'savings',
+                  when='receipt_mode is electronic_transfer'),
+            Field('bank_name', 'Bank name', 'HDFC Bank', when='receipt_mode is electronic_transfer'),
+            Field('branch_city', 'Branch name and city', 'Mumbai Central', when='receipt_mode is electronic_transfer'),
+            Field('ifsc_code', 'IFSC code (11 characters)', 'HDFC0001234', 'ifsc',
+                  when='receipt_mode is electronic_transfer'),
+            Field('idfc_account_no', 'IDFC account number', '456789012345', when='receipt_mode is idfc_account'),
+            Field('idfc_city', 'City of the IDFC branch', 'Mumbai', when='receipt_mode is idfc_account'),
+            Field('idfc_holder_name', 'IDFC account holder name', 'Ajith R', when='receipt_mode is idfc_account'),
+        ),
+        groups=(
+            Group('ACCOUNT INFO', 'Customer ID (10 digits), account number to be closed (12 digits) and full name'),
+            Group('PURPOSE', 'Reason for closing the account'),
+            Group('BALANCE CHECK', 'Is there any balance left? If yes, approximately how much?'),
+            Group('RECEIPT MODE', 'How they want to receive the balance, offering only the options allowed for it'),
+            Group('DETAILS', 'The transfer or IDFC account details for the chosen option'),
+        ),
+        rules=(
+            'Always ask about the balance BEFORE asking how to receive it',
+            'Cash is only allowed if the balance is ₹20,000 or less; otherwise offer electronic transfer, '
+            'demand draft or IDFC account',
+            'Demand draft: the bank prepares it - just confirm',
+            'Electronic transfer: every transfer field is mandatory',
+        ),
+        start='Start by greeting professionally and asking for customer ID, account number, and customer name.',
+        account_length=12
+    ),
+    FormSpec(
+        form_type='remittance',
+        code='REMITTANCE',
+        title='REMITTANCE ABROAD FORM (Form A2)',
+        fields=(
+            Field('form_no', 'Form number', 'A2/2026/001', optional=True, default=''),
+            Field('currency', 'Currency code (USD, EUR, GBP, AUD, CAD, JPY...)', 'USD', 'currency'),
+            Field('amount', 'Amount to send', '5000', 'amount'),
+            Field('applicant_name', 'Full name', 'Ajith R'),
+            Field('applicant_address', 'Complete address', '123 Main Street, Mumbai 400001'),
+            Field('account_no', 'Bank account number', '123456789012', 'account_number'),
+            Field('forex_amount', 'Amount with currency', '5000 USD', auto=True),
+            Field('remit_method', 'Method (draft/direct_transfer/travellers_cheques/currency_notes)', 'draft'),
+            Field('beneficiary_name', 'Beneficiary name', 'John Smith', when='remit_method is draft'),
+            Field('beneficiary_address', 'Beneficiary address', '456 Park Avenue, New York, USA',
+                  when='remit_method is draft'),
+            Field('remit_beneficiary_name', 'Beneficiary name', 'Marie Dubois', when='remit_method is direct_transfer'),
+            Field('bank_name_address', "Beneficiary's bank name and address", 'BNP Paribas, Paris, France',
+                  when='remit_method is direct_transfer'),
+            Field('beneficiary_account', "Beneficiary's account number", 'FR7612345678901234567890123',
+                  when='remit_method is direct_transfer'),
+            Field('declarant_name', None, 'Ajith R'),
+            Field('declaration_date', None, '09/01/2026'),
+        ),
+        groups=(
+            Group('BASIC INFO', 'Form number (optional), currency and amount'),
+            Group('YOUR DETAILS', 'Full name, complete address and bank account number'),
+            Group('REMITTANCE METHOD', 'Draft, direct bank transfer, travellers cheques or foreign currency notes'),
+            Group('BENEFICIARY', 'For a draft: beneficiary name and address. For a direct transfer: beneficiary '
+                                 'name, bank name and address, and account number. Cheques or notes need nothing '
+                                 'more'),
+        ),
+        rules=(
+            'AD Code and Equivalent Rs. are filled by the bank - do not ask',
+            'Only ONE remittance method can be selected',
+            'forex_amount is the amount followed by the currency code',
+            "declarant_name is the applicant's name; declaration_date is today's date",
+        ),
+        start='Start by greeting and asking for the currency, amount, and form number (optional).',
+        account_length=None
+    ),
+)
+
+
+def _field_keys(spec):
+    """kind -> FORM_DATA key for the locally extracted kinds of one form"""
+    keys = {}
+    for field in spec.fields:
+        if field.kind not in KINDS and field.kind is not None:
+            raise ValueError(f"{spec.form_type}.{field.key}: unknown kind '{field.kind}'")
+        if field.kind in EXTRACTED_KINDS:
+            if field.kind in keys:
+                raise ValueError(f"{spec.form_type}: kind '{field.kind}' used by both "
+                                 f"{keys[field.kind]} and {field.key}")
+            keys[field.kind] = field.key
+    return MappingProxyType(keys)
+
+
+# Compiled once at import: form_type -> spec, and the per-form lookup tables
+FORM_SPECS = MappingProxyType({spec.form_type: spec for spec in _SPECS})
+FIELD_KEYS = MappingProxyType({spec.form_type: _field_keys(spec) for spec in _SPECS})
+FIELDS_BY_KEY = MappingProxyType({
+    spec.form_type: MappingProxyType({field.key: field for field in spec.fields}) for spec in _SPECS
+})
+
+
+def get_form_spec(form_type):
+    """Spec for a form type, or None for unknown/empty form types"""
+    return FORM_SPECS.get(form_type)
@@ -0,0 +1,23 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:app`
+
+import os
+
+# PRELOAD_APP=1 imports the app once in the master: templates, prompts and
+# (with PRELOAD_SDKS) the provider SDKs are loaded before fork and shared by
+# every worker. Clients are still built per worker, after fork.
+preload_app = os.getenv('PRELOAD_APP', '0') == '1'
+
+
+def when_ready(server):
+    """Import the provider SDKs in a preloading master, before workers fork"""
+    if preload_app and os.getenv('PRELOAD_SDKS', '1') != '0':
+        import providers
+        providers.import_sdks()
+
+
+def post_worker_init(worker):
+    """Build provider clients in each worker before it takes requests"""
+    if os.getenv('PROVIDER_WARMUP', '1') == '0':
+        return
+    import providers
+    providers.warm_up(connect=os.getenv('PROVIDER_WARMUP_CONNECT', '1') != '0')
@@ -0,0 +1,93 @@
+# Conversation history compaction so prompt size stays flat on long forms
+
+import threading
+
+from form_prompts import estimate_tokens
+
+# Longest earlier user answer carried over verbatim into the summary
+MAX_ANSWER_CHARS = 300
+
+# Running totals per form type: turns compacted and estimated tokens saved
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def history_tokens(history):
+    """Estimated token count of a list of {'role', 'parts'} messages"""
+    return sum(estimate_tokens(part) for msg in history for part in msg['parts'])
+
+
+def summarize_turns(turns, fields):
+    """Collapse older turns into one user/model message pair.
+
+    Earlier assistant messages (questions and long summaries) are dropped;
+    earlier user answers are kept in short form next to the structured
+    "fields collected so far" state, so nothing the user said is lost.
+    """
+    lines = ['[Earlier conversation, summarised]']
+    if fields:
+        lines.append('Fields collected so far:')
+        for key, value in fields.items():
+            if value not in (None, ''):
+                lines.append(f'- {key}: {value}')
+    answers = [
+        msg['parts'][0][:MAX_ANSWER_CHARS]
+        for msg in turns
+        if msg['role'] == 'user' and msg['parts'][0].strip()
+    ]
+    if answers:
+        lines.append('Earlier answers from the user, in order:')
+        lines.extend(f'- {answer}' for answer in answers)
+    return [
+        {'role': 'user', 'parts': ['\n'.join(lines)]},
+        {'role': 'model', 'parts': ["Understood. I have these details and won't ask for them again."]}
+    ]
+
+
+def compact_history(history, fields, keep_turns=6):
+    """Keep the last keep_turns exchanges verbatim and summarise the rest.
+
+    history is the stored conversation without the system prompt prefix and
+    is not modified. Returns (messages, stats) where stats holds the
+    estimated token counts before and after compaction.
+    """
+    keep = keep_turns * 2
+    if keep_turns <= 0 or len(history) <= keep + 2:
+        tokens = history_tokens(history)
+        return history, {'compacted_messages': 0, 'tokens_before': tokens, 'tokens_after': tokens}
+
+    # Start the verbatim tail on a user message so roles keep alternating
+    split = len(history) - keep
+    while split > 0 and history[split]['role'] != 'user':
+        split -= 1
+    if split == 0:
+        tokens = history_tokens(history)
+        return history, {'compacted_messages': 0, 'tokens_before': tokens, 'tokens_after': tokens}
+    older, recent = history[:split], history[split:]
+
+    compacted = summarize_turns(older, fields) + recent
+    stats = {
+        'compacted_messages': len(older),
+        'tokens_before': history_tokens(history),
+        'tokens_after': history_tokens(compacted)
+    }
+    return compacted, stats
+
+
+def record_compaction(form_type, stats):
+    """Add one compaction result to the per-form-type totals"""
+    with _stats_lock:
+        totals = _stats.setdefault(form_type or 'none', {
+            'requests': 0, 'compacted_requests': 0, 'tokens_before': 0, 'tokens_after': 0
+        })
+        totals['requests'] += 1
+        if stats['compacted_messages']:
+            totals['compacted_requests'] += 1
+        totals['tokens_before'] += stats['tokens_before']
+        totals['tokens_after'] += stats['tokens_after']
+
+
+def get_compaction_stats():
+    """Per-form-type totals of estimated tokens before and after compaction"""
+    with _stats_lock:
+        return {form_type: dict(totals) for form_type, totals in _stats.items()}
@@ -0,0 +1,206 @@
+# Local handling of tiny replies the prompts already anticipate: "yes" to the
+# confirmation summary and "skip" / "no" for an optional field. These are
+# answered from the form spec and the session state without a model call;
+# anything less clear-cut returns None and goes to the model as before.
+
+import json
+import re
+from datetime import date
+
+from amount_words import AMOUNT_WORD_FIELDS
+from field_extractors import check_form_data
+from metrics import Counter
+
+CONFIRM = 'confirm'
+SKIP = 'skip'
+
+# The reply the confirmation prompt tells the model to give
+FORM_READY_REPLY = 'Perfect! Your form is ready. Click the button above to view and print it.'
+
+# Whole (normalised) replies with a fixed meaning
+PHRASES = {
+    'n a': SKIP, 'na': SKIP, 'nil': SKIP, 'none': SKIP, 'skip': SKIP, 'skip it': SKIP, 'no': SKIP,
+    'nope': SKIP, 'not applicable': SKIP, 'not needed': SKIP, 'no thanks': SKIP, 'leave it': SKIP,
+    'leave it blank': SKIP, 'nothing': SKIP,
+    'yes': CONFIRM, 'y': CONFIRM, 'ok': CONFIRM, 'okay': CONFIRM, 'correct': CONFIRM, 'proceed': CONFIRM,
+    'confirm': CONFIRM, 'confirmed': CONFIRM, 'go ahead': CONFIRM, 'looks good': CONFIRM,
+    'all good': CONFIRM, 'perfect': CONFIRM, 'haan': CONFIRM, 'ji': CONFIRM, 'ji haan': CONFIRM
+}
+
+# Longer replies are classified word by word: every word must be one of
+# these, with at least one carrying the intent
+CONFIRM_WORDS = frozenset((
+    'yes', 'yeah', 'yep', 'yup', 'ya', 'haan', 'han', 'ji', 'ok', 'okay', 'sure', 'correct', 'right',
+    'confirm', 'confirmed', 'proceed', 'perfect', 'fine', 'good', 'great', 'accurate'
+))
+SKIP_WORDS = frozenset(('skip', 'no', 'none', 'nil', 'nope', 'nothing', 'dont', 'not', 'without', 'blank'))
+FILLER_WORDS = frozenset((
+    'all', 'the', 'details', 'are', 'is', 'its', 'it', 'this', 'that', 'everything', 'looks', 'please',
+    'go', 'ahead', 'and', 'thank', 'thanks', 'you', 'i', 'have', 'do', 'one', 'any', 'an', 'a', 'email',
+    'mail', 'address', 'id', 'landline', 'number', 'phone', 'need', 'needed', 'want', 'dear', 'sir',
+    'madam', 'these', 'they', 'them', 'fill', 'form', 'generate', 'let', 'lets', 'us'
+))
+# Words that turn a "yes" into something the model has to read
+CHANGE_WORDS = frozenset(('but', 'change', 'wrong', 'except', 'incorrect', 'update', 'edit', 'fix', 'not'))
+
+_APOSTROPHE_RE = re.compile(r"['’`]")
+_NON_WORD_RE = re.compile(r'[^\w]+')
+_PARENTHESES_RE = re.compile(r'\s*\([^)]*\)')
+_SUMMARY_LINE_RE = re.compile(r'✓\s*(.+?)\s*:\s*(.+?)\s*$', re.MULTILINE)
+_DENOMINATION_RE = re.compile(r'(?:₹|\brs\.?)\s*(\d+)|\b(coins?)\b', re.IGNORECASE)
+_DATE_EXAMPLE_RE = re.compile(r'DD/MM/YYYY|\d{2}/\d{2}/\d{4}|\d{4}-\d{2}-\d{2}')
+_MONEY_RE = re.compile(r'(?:₹|\brs\.?)?\s*(\d[\d,]*(?:\.\d{1,2})?)\s*(?:/-|rupees)?', re.IGNORECASE)
+
+# Summary values that mean "no value"
+EMPTY_VALUES = frozenset(('', '-', 'n a', 'na', 'nil', 'none', 'not provided', 'skipped', 'not applicable'))
+
+REPLIES = Counter(
+    'mrv_local_intents_total', 'Confirmations and skips recognised locally, by whether they needed the model',
+    ('form_type', 'intent', 'outcome'))
+
+
+def _words(text):
+    return _NON_WORD_RE.sub(' ', _APOSTROPHE_RE.sub('', text.casefold())).split()
+
+
+def classify(message):
+    """CONFIRM, SKIP or None for a short user reply"""
+    words = _words(message or '')
+    if not words or len(words) > 10:
+        return None
+    intent = PHRASES.get(' '.join(words))
+    if intent:
+        return intent
+    if any(w not in CONFIRM_WORDS | SKIP_WORDS | FILLER_WORDS for w in words):
+        return None
+    confirms = any(w in CONFIRM_WORDS for w in words)
+    skips = any(w in SKIP_WORDS for w in words)
+    if confirms and not skips and not any(w in CHANGE_WORDS for w in words):
+        return CONFIRM
+    if skips and not confirms:
+        return SKIP
+    return None
+
+
+def _base_label(label):
+    """'Deposit type (Cash/Cheque)' -> 'deposit type'"""
+    return ' '.join(_words(_PARENTHESES_RE.sub('', label)))
+
+
+def _askable(spec):
+    return [f for f in spec.fields if f.label and not f.auto]
+
+
+def _ask(label):
+    """A label as the object of a question: 'PAN (10...)' stays, 'Email' -> 'email'"""
+    if label[:2].isupper():
+        return label
+    return label[0].lower() + label[1:]
+
+
+def asked_field(spec, question):
+    """The one field the assistant's question is about, or None if it
+    mentions none or several"""
+    text = ' '.join(_words(question))
+    matches = [f for f in _askable(spec) if f' {_base_label(f.label)} ' in f' {text} ']
+    return matches[0] if len(matches) == 1 else None
+
+
+def skip_reply(spec, question, fields):
+    """(key, value, reply) when the question was about an optional field and
+    the next question can be templated, else None.
+
+    Only forms that ask one field at a time qualify: with grouped questions
+    a "no" can't be tied to one field.
+    """
+    if spec.groups:
+        return None
+    field = asked_field(spec, question)
+    if field is None or not field.optional:
+        return None
+    askable = _askable(spec)
+    rest = [f for f in askable[askable.index(field) + 1:] if fields.get(f.key) in (None, '')]
+    # Conditional fields and the summary need the model's judgement
+    if not rest or rest[0].when:
+        return None
+    value = '0' if field.kind == 'money' else ''
+    reply = (f"No problem! We can skip the {_base_label(field.label)}.\n\n"
+             f"Now, could you please tell me the {_ask(rest[0].label)}?")
+    return field.key, value, reply
+
+
+def _clean(text):
+    return text.replace('**', '').replace('__', '').strip()
+
+
+def _field_for_label(spec, label):
+    name = ' '.join(_words(_PARENTHESES_RE.sub('', label)))
+    exact = [f for f in spec.fields if f.label and name in (_base_label(f.label), ' '.join(_words(f.label)))]
+    exact = exact or [f for f in spec.fields if name == f.key.replace('_', ' ')]
+    return exact[0] if len(exact) == 1 else None
+
+
+def _value(field, text):
+    if ' '.join(_words(text)) in EMPTY_VALUES:
+        return ''
+    if field.kind in ('amount', 'balance', 'money'):
+        m = _MONEY_RE.fullmatch(text)
+        if m:
+            return m.group(1).replace(',', '')
+    return text
+
+
+def _today(example):
+    today = date.today()
+    return today.isoformat() if re.fullmatch(r'\d{4}-\d{2}-\d{2}', example) else today.strftime('%d/%m/%Y')
+
+
+def summary_form_data(spec, summary, fields):
+    """FORM_DATA for a confirmed summary, or None when something can't be
+    filled in locally.
+
+    Values come from the summary's "✓ Label: value" lines, with locally
+    validated fields taking precedence; every required field must be
+    present and pass check_form_data().
+    """
+    data = {'form_type': spec.code}
+    denominations = {}
+    for label, value in _SUMMARY_LINE_RE.findall(summary):
+        label, value = _clean(label), _clean(value)
+        field = _field_for_label(spec, label)
+        if field is not None:
+            data[field.key] = _value(field, value)
+            continue
+        m = _DENOMINATION_RE.search(label)
+        if m and value.isdigit():
+            denominations[f"denom_{m.group(1) or 'coins'}_qty"] = value
+    data.update((key, value) for key, value in fields.items() if value not in (None, ''))
+
+    words_keys = {words for _, words, _ in AMOUNT_WORD_FIELDS.get(spec.form_type, ())}
+    for field in spec.fields:
+        if data.get(field.key) not in (None, ''):
+            continue
+        if field.kind == 'count':
+            if field.key in denominations:
+                data[field.key] = denominations[field.key]
+        elif (field.auto or not field.label) and _DATE_EXAMPLE_RE.fullmatch(field.example or ''):
+            data[field.key] = _today(field.example)
+        elif field.key in words_keys or field.default is not None:
+            continue        # filled in by finish_turn() / check_form_data()
+        elif not field.label or field.auto:
+            return None     # derived by the model from other answers
+    # A breakdown the summary mentions but we couldn't read is the model's job
+    if any(f.kind == 'count' for f in spec.fields) and not denominations \
+            and re.search(r'denomination|\bnotes?\b', summary, re.IGNORECASE):
+        return None
+    if check_form_data(spec.form_type, data, fields):
+        return None
+    return data
+
+
+def confirmation_reply(spec, summary, fields):
+    """The FORM_DATA reply for a confirmed summary, or None"""
+    data = summary_form_data(spec, summary, fields)
+    if data is None:
+        return None
+    return f"{FORM_READY_REPLY}\n\n{{{{FORM_DATA: {json.dumps(data, ensure_ascii=False)}}}}}"
@@ -0,0 +1,278 @@
+# Rate-limit aware key scheduling: a request bucket and a token bucket per API
+# key, synced from the providers' rate-limit headers, so load is spread over
+# the keys before any of them is throttled
+#
+# Keys are ranked by how soon they can take a request: keys with room come
+# first (provider priority kept, the key with the most headroom first), then
+# keys that will have room soonest. When every key is saturated the call
+# waits for a bucket to refill (up to KEY_MAX_WAIT_SECONDS) instead of
+# spending a request on a 429. A 429 blocks the key for its Retry-After (or
+# a jittered exponential backoff when the provider doesn't say).
+
+import os
+import random
+import re
+import threading
+import time
+
+from metrics import Counter, Histogram
+
+# Free-tier limits per key; 0 means no limit is enforced locally. Groq
+# reports its tokens-per-minute limit in headers, which then takes over.
+OPENROUTER_RPM = float(os.getenv('OPENROUTER_RPM', '20'))
+OPENROUTER_TPM = float(os.getenv('OPENROUTER_TPM', '0'))
+GROQ_RPM = float(os.getenv('GROQ_RPM', '30'))
+GROQ_TPM = float(os.getenv('GROQ_TPM', '8000'))
+# Longest a call waits for a saturated key's bucket before trying anyway
+KEY_MAX_WAIT_SECONDS = float(os.getenv('KEY_MAX_WAIT_SECONDS', '5'))
+# Backoff after a 429 without Retry-After: base doubles per consecutive 429
+KEY_BACKOFF_BASE = float(os.getenv('KEY_BACKOFF_BASE', '2'))
+KEY_BACKOFF_MAX = float(os.getenv('KEY_BACKOFF_MAX', '60'))
+
+DEFAULT_LIMITS = {
+    'OpenRouter': (OPENROUTER_RPM, OPENROUTER_TPM),
+    'Groq': (GROQ_RPM, GROQ_TPM)
+}
+
+# Remaining-count headers and the headers saying when each count resets:
+# Groq sends per-kind pairs (requests per day, tokens per minute) with
+# durations like '2m59.56s'; OpenRouter sends one pair with an epoch in ms
+_RESET_HEADERS = (
+    ('x-ratelimit-remaining-requests', 'x-ratelimit-reset-requests'),
+    ('x-ratelimit-remaining-tokens', 'x-ratelimit-reset-tokens'),
+    ('x-ratelimit-remaining', 'x-ratelimit-reset')
+)
+_DURATION_RE = re.compile(r'(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?')
+
+THROTTLES = Counter(
+    'mrv_key_throttles_total', 'Times an API key was blocked: a 429, or a rate-limit header reporting nothing left',
+    ('provider', 'key_index', 'source'))
+KEY_WAIT_SECONDS = Histogram(
+    'mrv_key_wait_seconds', 'Time a call waited for a saturated key to have room',
+    ('provider',), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_reset(value):
+    """Seconds until a rate-limit reset header's moment, or None.
+
+    Accepts seconds ('7'), Groq durations ('2m59.56s', '250ms') and epoch
+    timestamps in milliseconds.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    number = _number(value)
+    if number is not None:
+        if number > 1e11:
+            return max(number / 1000 - time.time(), 0.0)
+        return max(number, 0.0)
+    m = _DURATION_RE.fullmatch(value)
+    if not m or not any(m.groups()):
+        return None
+    hours, minutes, seconds, millis = (float(g) if g else 0.0 for g in m.groups())
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+def _lower(headers):
+    if not headers:
+        return {}
+    return {str(k).lower(): v for k, v in headers.items()}
+
+
+class Bucket:
+    """Token bucket refilling at `per_minute`; the level may go negative
+    (a debt) when a reservation is taken before there is room"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity / 60.0
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until `amount` fits (amounts above capacity wait for a full bucket)"""
+        need = min(amount, self.capacity) - self.level
+        return max(need / self.rate, 0.0) if need > 0 else 0.0
+
+    def resize(self, per_minute):
+        self.level = min(self.level, per_minute)
+        self.capacity = per_minute
+
+
+class KeyState:
+    def __init__(self, rpm, tpm):
+        self.requests = Bucket(rpm) if rpm > 0 else None
+        self.tokens = Bucket(tpm) if tpm > 0 else None
+        self.blocked_until = 0.0
+        self.throttles = 0            # consecutive 429s, for the backoff
+
+    def buckets(self):
+        return [b for b in (self.requests, self.tokens) if b is not None]
+
+    def wait_for(self, tokens, now):
+        for bucket in self.buckets():
+            bucket.refill(now)
+        wait = max(self.blocked_until - now, 0.0)
+        if self.requests:
+            wait = max(wait, self.requests.wait_for(1))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_for(tokens))
+        return wait
+
+    def headroom(self):
+        """Fraction of the request bucket that is free (1.0 without a limit)"""
+        if self.requests is None:
+            return 1.0
+        return max(self.requests.level, 0.0) / self.requests.capacity
+
+
+class KeyScheduler:
+    """Per-key request/token buckets, synced from rate-limit headers and 429s.
+
+    Keys are the dispatcher's attempt keys ('OpenRouter#1'); limits default
+    to DEFAULT_LIMITS for the key's provider.
+    """
+
+    def __init__(self, limits=None, max_wait=KEY_MAX_WAIT_SECONDS,
+                 backoff_base=KEY_BACKOFF_BASE, backoff_max=KEY_BACKOFF_MAX):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key):
+        state = self._keys.get(key)
+        if state is None:
+            rpm, tpm = self.limits.get(key.split('#')[0], (0, 0))
+            state = self._keys[key] = KeyState(rpm, tpm)
+        return state
+
+    def rank(self, attempts, key_of):
+        """attempts ordered by how soon their key can take the call; among
+        keys with room, provider order is kept and the least used key goes first"""
+        now = time.monotonic()
+        providers = []
+        for attempt in attempts:
+            if attempt.provider not in providers:
+                providers.append(attempt.provider)
+        with self._lock:
+            ranked = []
+            for position, attempt in enumerate(attempts):
+                state = self._state(key_of(attempt))
+                wait = state.wait_for(attempt.tokens, now)
+                ranked.append((wait, providers.index(attempt.provider), -state.headroom(), position, attempt))
+        ranked.sort(key=lambda item: item[:4])
+        return [item[-1] for item in ranked]
+
+    def reserve(self, key, tokens=0):
+        """Take one request (and `tokens`) from a key's buckets; returns how
+        long to wait before calling, capped at max_wait"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key)
+            wait = state.wait_for(tokens, now)
+            if state.requests:
+                state.requests.level -= 1
+            if state.tokens and tokens:
+                state.tokens.level -= tokens
+        wait = min(wait, self.max_wait)
+        if wait:
+            KEY_WAIT_SECONDS.observe(wait, provider=key.split('#')[0])
+        return wait
+
+    def settle(self, key, reserved, used):
+        """Correct a reservation once the provider reports the tokens used"""
+        if used is None:
+            return
+        with self._lock:
+            state = self._state(key)
+            if state.tokens:
+                state.tokens.level = min(state.tokens.level + reserved - used, state.tokens.capacity)
+
+    def observe(self, key, headers):
+        """Sync a key's buckets from a successful response's rate-limit headers"""
+        headers = _lower(headers)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key)
+            state.throttles = 0
+            # Groq's token limit is per minute; it replaces the configured one
+            tpm = _number(headers.get('x-ratelimit-limit-tokens'))
+            if tpm:
+                if state.tokens is None:
+                    state.tokens = Bucket(tpm)
+                elif state.tokens.capacity != tpm:
+                    state.tokens.resize(tpm)
+            remaining_tokens = _number(headers.get('x-ratelimit-remaining-tokens'))
+            if state.tokens and remaining_tokens is not None:
+                state.tokens.refill(now)
+                state.tokens.level = min(state.tokens.level, remaining_tokens)
+            for remaining, reset in _RESET_HEADERS:
+                if _number(headers.get(remaining)) == 0:
+                    delay = parse_reset(headers.get(reset))
+                    if delay:
+                        state.blocked_until = max(state.blocked_until, now + delay)
+                        provider, _, index = key.partition('#')
+                        THROTTLES.inc(provider=provider, key_index=index, source='headers')
+
+    def throttle(self, key, error):
+        """Block a key after a rate-limit error and return the delay, or None
+        if the error wasn't one"""
+        response = getattr(error, 'response', None)
+        status = getattr(error, 'status_code', None) or getattr(response, 'status_code', None)
+        if status != 429:
+            return None
+        headers = _lower(getattr(response, 'headers', None))
+        retry_after = parse_reset(headers.get('retry-after'))
+        if retry_after is None:
+            retry_after = max(filter(None, (parse_reset(headers.get(reset)) for _, reset in _RESET_HEADERS)),
+                              default=None)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key)
+            state.throttles += 1
+            if retry_after is not None:
+                # Spread the retries of every caller that saw the same 429
+                delay = retry_after + random.uniform(0, min(retry_after, 1.0))
+            else:
+                ceiling = min(self.backoff_base * 2 ** (state.throttles - 1), self.backoff_max)
+                delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+            state.blocked_until = max(state.blocked_until, now + delay)
+            # The provider says the window is spent whatever our buckets think
+            for bucket in state.buckets():
+                bucket.refill(now)
+                bucket.level = min(bucket.level, 0.0)
+        provider, _, index = key.partition('#')
+        THROTTLES.inc(provider=provider, key_index=index, source='429')
+        return delay
+
+    def snapshot(self):
+        """Per-key bucket levels, for metrics"""
+        now = time.monotonic()
+        report = {}
+        with self._lock:
+            for key, state in self._keys.items():
+                for bucket in state.buckets():
+                    bucket.refill(now)
+                report[key] = {
+                    'requests_available': state.requests.level if state.requests else None,
+                    'tokens_available': state.tokens.level if state.tokens else None,
+                    'blocked_seconds': max(state.blocked_until - now, 0.0)
+                }
+        return report
@@ -0,0 +1,181 @@
+# Latency histograms and counters for the chat pipeline, rendered in the
+# Prometheus text exposition format by the /metrics endpoint
+#
+# Metrics are kept per worker process; with several gunicorn workers each
+# scrape sees the worker that answered it (label it by instance/pod, or run
+# one worker per container, when that matters).
+
+import threading
+import time
+from contextlib import contextmanager
+
+from form_specs import FORM_SPECS
+
+# Seconds; covers local work (ms) through slow free-tier model calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+_lock = threading.Lock()
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{_escape(v)}"' for n, v in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with _lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            lines.append(f'{self.name}{_label_text(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with _lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = _label_text(self.labelnames, key, [('le', _number(float(bound)))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _label_text(self.labelnames, key, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{le} {values[-1]}')
+            labels = _label_text(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_number(values[-2])}')
+            lines.append(f'{self.name}_count{labels} {values[-1]}')
+        return lines
+
+
+def gauge_lines(name, description, samples, kind='gauge'):
+    """Exposition lines for values computed at scrape time: samples is a list
+    of (labels dict, value)"""
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_label_text(labels.keys(), labels.values())} {_number(value)}')
+    return lines
+
+
+def register_collector(collect):
+    """Add a function returning exposition lines, called on every scrape"""
+    _collectors.append(collect)
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    for collect in _collectors:
+        lines += collect()
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram(
+    'mrv_request_seconds', 'Time to handle an API request',
+    ('route', 'form_type', 'outcome'))
+STAGE_SECONDS = Histogram(
+    'mrv_stage_seconds', 'Time spent in each stage of a request',
+    ('route', 'stage', 'form_type'))
+PROVIDER_ATTEMPT_SECONDS = Histogram(
+    'mrv_provider_attempt_seconds', 'Duration of each provider call attempt',
+    ('provider', 'key_index', 'outcome'))
+PROVIDER_RETRIES = Counter(
+    'mrv_provider_retries_total', 'Provider attempts beyond the first for one request (fallbacks and hedges)',
+    ('provider', 'key_index', 'reason'))
+
+
+def form_label(form_type):
+    """form_type as a label value; unknown client-supplied values are folded
+    together so they can't create unbounded series"""
+    if not form_type:
+        return 'none'
+    return form_type if form_type in FORM_SPECS else 'other'
+
+
+@contextmanager
+def stage(route, name, form_type=''):
+    """Time a block as one stage of a request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started,
+                              route=route, stage=name, form_type=form_label(form_type))
+
+
+@contextmanager
+def timed_request(route, started=None):
+    """Time a whole request (from `started`, a perf_counter() value, if given).
+
+    Yields a dict whose 'form_type' and 'outcome' the handler can fill in;
+    an exception escaping the block counts as 'error'.
+    """
+    labels = {'form_type': '', 'outcome': 'success'}
+    if started is None:
+        started = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        labels['outcome'] = 'error'
+        raise
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route,
+                                form_type=form_label(labels['form_type']), outcome=labels['outcome'])
+
+
+def observe_attempt(provider, index, outcome, seconds):
+    PROVIDER_ATTEMPT_SECONDS.observe(seconds, provider=provider, key_index=str(index), outcome=outcome)
+
+
+def count_retry(provider, index, reason):
+    PROVIDER_RETRIES.inc(provider=provider, key_index=str(index), reason=reason)
@@ -0,0 +1,108 @@
+# Cache of the assistant's opening turn: the first reply of a conversation
+# depends only on the form's fixed prompt prefix and the user's first
+# message ("hi", "start", "I want to deposit cash"), so it can be served
+# without a model call
+#
+# Entries are keyed by (form type, prompt prefix hash, normalised message)
+# and hold a few replies the model actually gave. Only OPENING_CACHE_HIT_RATIO
+# of lookups are answered from the cache; the rest go to the model and add
+# to the variants, so returning users don't always see the same words.
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+OPENING_CACHE_TTL_SECONDS = float(os.getenv('OPENING_CACHE_TTL_SECONDS', '3600'))
+OPENING_CACHE_MAX_ENTRIES = int(os.getenv('OPENING_CACHE_MAX_ENTRIES', '512'))
+# Fraction of cacheable openings answered from the cache once it has a reply
+OPENING_CACHE_HIT_RATIO = float(os.getenv('OPENING_CACHE_HIT_RATIO', '0.9'))
+# Different model replies kept per key and picked from at random
+OPENING_CACHE_VARIANTS = int(os.getenv('OPENING_CACHE_VARIANTS', '3'))
+
+# Longer first messages usually carry details (names, amounts) and are
+# answered by the model; messages with digits may be account numbers
+MAX_MESSAGE_CHARS = 80
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_SPACE_RE = re.compile(r'\s+')
+
+LOOKUPS = Counter(
+    'mrv_opening_cache_lookups_total', 'Opening-turn cache lookups by result (hit, miss, bypass, skipped)',
+    ('form_type', 'result'))
+
+
+def normalize_message(message):
+    """Case, punctuation and spacing folded, or None if the message isn't cacheable"""
+    if not message or len(message) > MAX_MESSAGE_CHARS or any(ch.isdigit() for ch in message):
+        return None
+    text = _SPACE_RE.sub(' ', _PUNCTUATION_RE.sub(' ', message.casefold())).strip()
+    return text or None
+
+
+def prefix_hash(prefix):
+    """Short digest of a session prefix (Gemini-style messages), so a prompt
+    change never serves replies written for the old one"""
+    digest = hashlib.sha256()
+    for msg in prefix:
+        digest.update(msg['role'].encode('utf-8') + b'\0' + msg['parts'][0].encode('utf-8') + b'\0')
+    return digest.hexdigest()[:16]
+
+
+class OpeningTurnCache:
+    """Bounded (TTL + LRU) map from opening-turn keys to model replies"""
+
+    def __init__(self, ttl=OPENING_CACHE_TTL_SECONDS, max_entries=OPENING_CACHE_MAX_ENTRIES,
+                 hit_ratio=OPENING_CACHE_HIT_RATIO, variants=OPENING_CACHE_VARIANTS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hit_ratio = hit_ratio
+        self.variants = max(variants, 1)
+        self._data = OrderedDict()   # key -> (expires_at, [reply, ...])
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def lookup(self, key):
+        """(reply, result): a cached reply and 'hit', or None and 'miss' /
+        'bypass' (a cached key whose lookup was sent to the model anyway)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None, 'miss'
+            expires_at, replies = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None, 'miss'
+            self._data.move_to_end(key)
+            if random.random() >= self.hit_ratio:
+                return None, 'bypass'
+            return random.choice(replies), 'hit'
+
+    def put(self, key, reply):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or item[0] <= now:
+                item = (now + self.ttl, [])
+            # The lifetime runs from the first reply, so collecting variants
+            # never keeps an entry alive past its TTL
+            expires_at, replies = item
+            if reply not in replies:
+                replies = (replies + [reply])[-self.variants:]
+            self._data[key] = (expires_at, replies)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
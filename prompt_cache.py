@@ -0,0 +1,140 @@
+# Provider-side prompt caching: Gemini context caches for the per-form
+# prefix, and cache-hit accounting for every provider
+
+import datetime
+import logging
+import os
+import threading
+import time
+
+from providers import gemini_sdk
+
+# How long a Gemini context cache lives; it is recreated shortly before expiry
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CACHE_TTL_SECONDS', '3600'))
+# Gemini refuses to cache prefixes shorter than this
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CACHE_MIN_TOKENS', '1024'))
+# After a failed cache creation, use the uncached model for this long
+GEMINI_CACHE_RETRY_SECONDS = 600
+# Recreate a cache this many seconds before Gemini would expire it
+REFRESH_MARGIN_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class GeminiContextCache:
+    """Gemini models bound to a server-side cache of a fixed prefix.
+
+    One cache is kept per key (the form type). Prefixes below the minimum
+    size, and keys whose cache could not be created recently, get None so
+    the caller falls back to sending the full prefix.
+    """
+
+    def __init__(self, model_name, ttl=GEMINI_CACHE_TTL_SECONDS,
+                 min_tokens=GEMINI_CACHE_MIN_TOKENS, retry_after=GEMINI_CACHE_RETRY_SECONDS):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self._entries = {}   # key -> (model or None, valid_until)
+        self._creating = set()   # keys whose cache is being created
+        self._lock = threading.Lock()
+
+    def model(self, key, contents, tokens):
+        """Model that already holds contents, or None to send them uncached.
+
+        The cache is created outside the lock; callers that arrive meanwhile
+        get the cache being refreshed while it is still live, else None.
+        """
+        if self.ttl <= 0 or tokens < self.min_tokens:
+            return None
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry and entry[1] > now:
+            return entry[0]
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            if key in self._creating:
+                if entry and entry[1] + REFRESH_MARGIN_SECONDS > now:
+                    return entry[0]
+                return None
+            self._creating.add(key)
+        try:
+            try:
+                genai = gemini_sdk()
+                from google.generativeai import caching
+                cache = caching.CachedContent.create(
+                    model=f'models/{self.model_name}',
+                    display_name=f'form-prefix-{key or "none"}',
+                    contents=list(contents),
+                    ttl=datetime.timedelta(seconds=self.ttl)
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cache)
+                valid_until = time.monotonic() + max(self.ttl - REFRESH_MARGIN_SECONDS, 0)
+                logger.info("Created Gemini context cache for '%s' (~%d tokens)", key, tokens)
+            except Exception as e:
+                model = None
+                valid_until = time.monotonic() + self.retry_after
+                logger.warning("Gemini context cache unavailable for '%s': %s", key, e)
+            with self._lock:
+                self._entries[key] = (model, valid_until)
+            return model
+        finally:
+            with self._lock:
+                self._creating.discard(key)
+
+
+def _field(obj, name):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def record_usage(provider, prompt_tokens, cached_tokens, completion_tokens=None):
+    """Add one response's token counts to the provider's totals"""
+    with _stats_lock:
+        totals = _stats.setdefault(provider, {
+            'requests': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0
+        })
+        totals['requests'] += 1
+        if cached_tokens:
+            totals['cache_hits'] += 1
+        totals['prompt_tokens'] += prompt_tokens or 0
+        totals['cached_tokens'] += cached_tokens or 0
+        totals['completion_tokens'] += completion_tokens or 0
+
+
+def record_openai_usage(provider, usage):
+    """record_usage() from an OpenAI-style `usage` object (OpenRouter, Groq)"""
+    if usage is None:
+        return
+    details = _field(usage, 'prompt_tokens_details')
+    record_usage(provider, _field(usage, 'prompt_tokens'), _field(details, 'cached_tokens'),
+                 _field(usage, 'completion_tokens'))
+
+
+def record_gemini_usage(usage_metadata):
+    """record_usage() from a Gemini response's usage_metadata"""
+    if usage_metadata is None:
+        return
+    record_usage('Gemini', _field(usage_metadata, 'prompt_token_count'),
+                 _field(usage_metadata, 'cached_content_token_count'),
+                 _field(usage_metadata, 'candidates_token_count'))
+
+
+def get_cache_stats():
+    """Per-provider prompt token totals and how many were served from cache"""
+    with _stats_lock:
+        report = {}
+        for provider, totals in _stats.items():
+            report[provider] = dict(totals)
+            prompt = totals['prompt_tokens']
+            report[provider]['cached_ratio'] = round(totals['cached_tokens'] / prompt, 3) if prompt else 0.0
+        return report
@@ -0,0 +1,300 @@
+# Provider dispatch: per-key timeouts, health scores, rate-limit aware key
+# order and optional hedged requests
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import observe_attempt, count_retry
+
+# One way of answering a chat turn: call(timeout) returns the response text
+# (or, for call_async, a coroutine that does); tokens is the estimated cost
+# reserved against the key's tokens-per-minute limit
+ProviderAttempt = namedtuple('ProviderAttempt', ['provider', 'index', 'timeout', 'call', 'tokens'],
+                             defaults=(0,))
+
+logger = logging.getLogger(__name__)
+
+
+def attempt_key(attempt):
+    """Stable identifier for the API key behind an attempt, e.g. 'OpenRouter#1'"""
+    return f"{attempt.provider}#{attempt.index}"
+
+
+class KeyHealth:
+    """Rolling health record for one API key"""
+
+    def __init__(self):
+        self.score = 1.0              # EWMA of successes (1.0 = always works)
+        self.latency = None           # EWMA of successful call latency in seconds
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+
+    def snapshot(self):
+        return {
+            'score': round(self.score, 3),
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'cooling_down': self.cooldown_until > time.monotonic(),
+            'last_error': self.last_error
+        }
+
+
+class ProviderDispatcher:
+    """Run provider attempts in priority order with timeouts and optional hedging.
+
+    Keys that failed recently are put on a cooldown that doubles with each
+    consecutive failure and are skipped while it lasts, so a dead key costs
+    nothing. With hedge_after set, a backup attempt is fired when the current
+    one has not answered within that many seconds; the first success wins.
+    With a scheduler (key_scheduler.KeyScheduler) keys are ordered by their
+    rate-limit headroom and a 429 blocks a key for as long as it asks.
+    """
+
+    def __init__(self, hedge_after=0, max_workers=8, cooldown_base=5.0,
+                 cooldown_max=300.0, alpha=0.3, scheduler=None):
+        self.hedge_after = hedge_after
+        self.scheduler = scheduler
+        self.max_workers = max_workers
+        self.cooldown_base = cooldown_base
+        self.cooldown_max = cooldown_max
+        self.alpha = alpha
+        self._health = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        # Created on first use so forked workers never inherit pool threads
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='provider'
+                    )
+        return self._executor
+
+    def health(self, key):
+        with self._lock:
+            return self._health.setdefault(key, KeyHealth())
+
+    def health_report(self):
+        """Per-key health snapshot, for debugging and metrics"""
+        with self._lock:
+            return {key: h.snapshot() for key, h in self._health.items()}
+
+    def record_success(self, key, latency):
+        h = self.health(key)
+        with self._lock:
+            h.score = h.score * (1 - self.alpha) + self.alpha
+            h.latency = latency if h.latency is None else h.latency * (1 - self.alpha) + latency * self.alpha
+            h.consecutive_failures = 0
+            h.cooldown_until = 0.0
+
+    def record_failure(self, key, error):
+        h = self.health(key)
+        with self._lock:
+            h.score = h.score * (1 - self.alpha)
+            h.consecutive_failures += 1
+            h.last_error = str(error)[:200]
+        # A 429 cools the key down for as long as the provider asks
+        cooldown = self.scheduler.throttle(key, error) if self.scheduler else None
+        if cooldown is None:
+            cooldown = min(self.cooldown_base * 2 ** (h.consecutive_failures - 1), self.cooldown_max)
+        with self._lock:
+            h.cooldown_until = time.monotonic() + cooldown
+
+    def order(self, attempts):
+        """Drop keys on cooldown (unless every key is); the rest keep priority
+        order, or the scheduler's order when there is one"""
+        now = time.monotonic()
+        healthy = [a for a in attempts if self.health(attempt_key(a)).cooldown_until <= now]
+        if not healthy:
+            # Everything is cooling down: try the key whose cooldown ends first
+            return sorted(attempts, key=lambda a: self.health(attempt_key(a)).cooldown_until)
+        if self.scheduler:
+            return self.scheduler.rank(healthy, attempt_key)
+        return healthy
+
+    def reserve(self, attempt):
+        """Count an attempt against its key's rate limits; returns the seconds
+        to wait first when the key has no room yet"""
+        if self.scheduler is None:
+            return 0.0
+        return self.scheduler.reserve(attempt_key(attempt), attempt.tokens)
+
+    def _run(self, attempt, delay=0.0, started_at=None):
+        key = attempt_key(attempt)
+        if delay:
+            time.sleep(delay)
+        started = time.monotonic()
+        if started_at is not None:
+            # Tells call() the attempt is running and when its timeout began
+            started_at.append(started)
+        try:
+            result = attempt.call(attempt.timeout)
+            if not result:
+                raise Exception('Empty response')
+        except Exception as e:
+            observe_attempt(attempt.provider, attempt.index, 'error', time.monotonic() - started)
+            self.record_failure(key, e)
+            raise
+        latency = time.monotonic() - started
+        observe_attempt(attempt.provider, attempt.index, 'success', latency)
+        self.record_success(key, latency)
+        return result
+
+    def call(self, attempts):
+        """Return (result, attempt) from the first attempt that succeeds"""
+        queue = self.order(attempts)
+        if not queue:
+            raise Exception("No API keys configured")
+
+        executor = self._get_executor()
+        pending = {}   # future -> (attempt, submit deadline, [start time once running])
+        last_error = None
+        launched_at = 0.0
+
+        def launch(reason=None):
+            nonlocal launched_at
+            attempt = queue.pop(0)
+            logger.debug("Attempting %s API call", attempt_key(attempt))
+            if reason:
+                count_retry(attempt.provider, attempt.index, reason)
+            delay = self.reserve(attempt)
+            started_at = []
+            # Carry the request ID into the pool thread
+            future = executor.submit(contextvars.copy_context().run, self._run, attempt, delay, started_at)
+            launched_at = time.monotonic()
+            pending[future] = (attempt, launched_at + delay + attempt.timeout, started_at)
+
+        def deadline(attempt, submit_deadline, started_at):
+            # A running attempt gets its full timeout from when it started;
+            # one still queued behind the pool is given up on (not blamed)
+            # once it could no longer have finished in time
+            return started_at[0] + attempt.timeout if started_at else submit_deadline
+
+        launch()
+        while pending:
+            now = time.monotonic()
+            wait_for = min(deadline(*entry) for entry in pending.values()) - now
+            hedging = self.hedge_after and queue
+            if hedging:
+                wait_for = min(wait_for, launched_at + self.hedge_after - now)
+            done, _ = wait(list(pending), timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                attempt, _, _ = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = str(e)
+                    logger.warning("%s failed: %s", attempt_key(attempt), last_error)
+                    continue
+                # Winner: cancel anything that has not started, abandon the rest
+                for loser in pending:
+                    loser.cancel()
+                logger.debug("%s call succeeded", attempt_key(attempt))
+                return result, attempt
+
+            if not done:
+                # Drop attempts that outlived their own timeout
+                now = time.monotonic()
+                dropped = False
+                for future, entry in list(pending.items()):
+                    attempt, _, started_at = entry
+                    if deadline(*entry) > now:
+                        continue
+                    del pending[future]
+                    dropped = True
+                    if future.cancel() or not started_at:
+                        # Never ran: the key isn't at fault
+                        last_error = f"Not started within {attempt.timeout}s"
+                        logger.warning("%s was not started in time", attempt_key(attempt))
+                        continue
+                    last_error = f"Timed out after {attempt.timeout}s"
+                    self.record_failure(attempt_key(attempt), last_error)
+                    logger.warning("%s timed out", attempt_key(attempt))
+                # Primary is slow (or timed out): fire the next backup
+                hedge_due = hedging and now >= launched_at + self.hedge_after
+                if queue and (dropped or hedge_due or not pending):
+                    launch('hedge' if pending else 'fallback')
+            elif not pending and queue:
+                launch('fallback')
+
+        raise Exception(f"All API keys failed. Last error: {last_error}")
+
+    async def _run_async(self, attempt, delay=0.0):
+        key = attempt_key(attempt)
+        if delay:
+            await asyncio.sleep(delay)
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(attempt.call(attempt.timeout), attempt.timeout)
+            if not result:
+                raise Exception('Empty response')
+        except asyncio.CancelledError:
+            # Lost a hedged race; not the key's fault
+            observe_attempt(attempt.provider, attempt.index, 'cancelled', time.monotonic() - started)
+            raise
+        except asyncio.TimeoutError:
+            observe_attempt(attempt.provider, attempt.index, 'timeout', time.monotonic() - started)
+            self.record_failure(key, f"Timed out after {attempt.timeout}s")
+            raise Exception(f"Timed out after {attempt.timeout}s")
+        except Exception as e:
+            observe_attempt(attempt.provider, attempt.index, 'error', time.monotonic() - started)
+            self.record_failure(key, e)
+            raise
+        latency = time.monotonic() - started
+        observe_attempt(attempt.provider, attempt.index, 'success', latency)
+        self.record_success(key, latency)
+        return result
+
+    async def call_async(self, attempts):
+        """Async call(): same ordering and hedging, and losers are really cancelled"""
+        queue = self.order(attempts)
+        if not queue:
+            raise Exception("No API keys configured")
+
+        pending = {}   # task -> attempt
+        last_error = None
+
+        def launch(reason=None):
+            attempt = queue.pop(0)
+            logger.debug("Attempting %s API call", attempt_key(attempt))
+            if reason:
+                count_retry(attempt.provider, attempt.index, reason)
+            pending[asyncio.ensure_future(self._run_async(attempt, self.reserve(attempt)))] = attempt
+
+        launch()
+        try:
+            while pending:
+                timeout = self.hedge_after if (self.hedge_after and queue) else None
+                done, _ = await asyncio.wait(list(pending), timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slower than the hedge budget: fire the backup
+                    launch('hedge')
+                    continue
+                for task in done:
+                    attempt = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = str(e)
+                        logger.warning("%s failed: %s", attempt_key(attempt), last_error)
+                        continue
+                    logger.debug("%s call succeeded", attempt_key(attempt))
+                    return result, attempt
+                if not pending and queue:
+                    launch('fallback')
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise Exception(f"All API keys failed. Last error: {last_error}")
@@ -0,0 +1,177 @@
+# Provider clients and Gemini models, created once per worker and reused
+#
+# The provider SDKs are imported on first use, not when this module is: a
+# worker that only serves pages never loads them, and start-up stays fast.
+# Clients hold connection pools and locks, so a forked child drops any it
+# inherited and builds its own (see reset()); with gunicorn's preload_app the
+# master imports the SDKs once and every worker shares those pages.
+
+import importlib
+import logging
+import os
+import threading
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+GEMINI_MODEL = 'gemini-2.5-flash-lite'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_openrouter_clients = None
+_groq_clients = None
+_async_openrouter_clients = None
+_async_groq_clients = None
+_gemini_configured = False
+_gemini_models = {}
+
+# Modules import_sdks() loads ahead of time
+SDK_MODULES = ('httpx', 'openai', 'groq', 'google.generativeai', 'google.generativeai.caching')
+
+
+def _api_keys(*names):
+    return [key for key in (os.getenv(name) for name in names) if key]
+
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=int(os.getenv('PROVIDER_MAX_CONNECTIONS', '20')),
+        max_keepalive_connections=int(os.getenv('PROVIDER_MAX_KEEPALIVE', '10')),
+        keepalive_expiry=float(os.getenv('PROVIDER_KEEPALIVE_SECONDS', '120'))
+    )
+
+
+def _http_client():
+    """Keep-alive pool shared by every call a client makes, so TLS handshakes
+    are paid once per worker instead of once per request"""
+    import httpx
+    return httpx.Client(limits=_http_limits(), timeout=httpx.Timeout(60.0, connect=10.0))
+
+
+def _async_http_client():
+    import httpx
+    return httpx.AsyncClient(limits=_http_limits(), timeout=httpx.Timeout(60.0, connect=10.0))
+
+
+def openrouter_clients():
+    """OpenRouter clients (primary and backup keys), in priority order"""
+    global _openrouter_clients
+    if _openrouter_clients is None:
+        with _lock:
+            if _openrouter_clients is None:
+                from openai import OpenAI
+                _openrouter_clients = [
+                    OpenAI(base_url=OPENROUTER_BASE_URL, api_key=key, http_client=_http_client())
+                    for key in _api_keys('OPENROUTER_API_KEY', 'OPENROUTER_API_KEY_2')
+                ]
+    return _openrouter_clients
+
+
+def groq_clients():
+    """Groq fallback clients, in priority order"""
+    global _groq_clients
+    if _groq_clients is None:
+        with _lock:
+            if _groq_clients is None:
+                from groq import Groq
+                _groq_clients = [
+                    Groq(api_key=key, http_client=_http_client())
+                    for key in _api_keys('GROQ_API_KEY', 'GROQ_API_KEY_2')
+                ]
+    return _groq_clients
+
+
+def async_openrouter_clients():
+    """Async OpenRouter clients for the ASGI server (see asgi.py)"""
+    global _async_openrouter_clients
+    if _async_openrouter_clients is None:
+        with _lock:
+            if _async_openrouter_clients is None:
+                from openai import AsyncOpenAI
+                _async_openrouter_clients = [
+                    AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=key, http_client=_async_http_client())
+                    for key in _api_keys('OPENROUTER_API_KEY', 'OPENROUTER_API_KEY_2')
+                ]
+    return _async_openrouter_clients
+
+
+def async_groq_clients():
+    """Async Groq fallback clients for the ASGI server"""
+    global _async_groq_clients
+    if _async_groq_clients is None:
+        with _lock:
+            if _async_groq_clients is None:
+                from groq import AsyncGroq
+                _async_groq_clients = [
+                    AsyncGroq(api_key=key, http_client=_async_http_client())
+                    for key in _api_keys('GROQ_API_KEY', 'GROQ_API_KEY_2')
+                ]
+    return _async_groq_clients
+
+
+def gemini_sdk():
+    """google.generativeai, imported and configured with the API key on first use"""
+    global _gemini_configured
+    import google.generativeai as genai
+    if not _gemini_configured:
+        with _lock:
+            if not _gemini_configured:
+                genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+                _gemini_configured = True
+    return genai
+
+
+def gemini_model(name=GEMINI_MODEL):
+    """Configured Gemini model, built on first use and then shared"""
+    model = _gemini_models.get(name)
+    if model is None:
+        genai = gemini_sdk()
+        with _lock:
+            model = _gemini_models.setdefault(name, genai.GenerativeModel(name))
+    return model
+
+
+def import_sdks():
+    """Import the provider SDKs now (in a preloading master, before fork)"""
+    for name in SDK_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Could not preload %s: %s", name, e)
+
+
+def reset():
+    """Forget every client and model, so they are rebuilt on next use.
+
+    Runs in each forked child: pools, sockets and locks must not be shared
+    with the parent.
+    """
+    global _lock, _openrouter_clients, _groq_clients, _async_openrouter_clients, _async_groq_clients
+    global _gemini_configured, _gemini_models
+    _lock = threading.Lock()
+    _openrouter_clients = _groq_clients = None
+    _async_openrouter_clients = _async_groq_clients = None
+    _gemini_configured = False
+    _gemini_models = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
+
+
+def warm_up(connect=True):
+    """Build every client and model now, optionally opening their connections.
+
+    Meant to run once per worker at start-up (see gunicorn.conf.py) so the
+    first user request doesn't pay for client setup or TLS handshakes.
+    """
+    clients = openrouter_clients() + groq_clients()
+    gemini_model()
+    if not connect:
+        return
+    for client in clients:
+        try:
+            # Any cheap request opens a pooled keep-alive connection
+            client.with_options(timeout=5, max_retries=0).models.list()
+        except Exception as e:
+            logger.warning("Warm-up request failed for %s: %s", client.base_url, e)
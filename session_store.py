@@ -0,0 +1,313 @@
+# Bounded session storage shared by every /chat worker
+
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import Counter, Histogram
+
+# How long a turn waits for an earlier turn of the same session to finish
+SESSION_LOCK_TIMEOUT_SECONDS = float(os.getenv('SESSION_LOCK_TIMEOUT_SECONDS', '90'))
+# Longest pause between two tries of a session lock by an async turn
+LOCK_POLL_SECONDS = 0.05
+# Replies kept per session for replaying retried requests (by idempotency key)
+IDEMPOTENT_REPLIES = int(os.getenv('IDEMPOTENT_REPLIES', '4'))
+
+LOCK_WAIT_SECONDS = Histogram(
+    'mrv_session_lock_wait_seconds', 'Time a turn waited for an earlier turn of its session',
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 90))
+REPLAYS = Counter(
+    'mrv_session_replays_total', 'Retried turns answered with the stored reply instead of a new model call',
+    ('route',))
+BUSY = Counter(
+    'mrv_session_busy_total', 'Turns refused because an earlier turn of the session held its lock too long',
+    ('route',))
+
+
+class SessionBusy(Exception):
+    """Another turn of the session held its lock for too long"""
+
+
+class SessionLocks:
+    """One lock per session ID, so a session's turns run one at a time.
+
+    A lock exists only while a turn holds or waits for it. Locks are per
+    process: with the sqlite backend and several workers, turns of one
+    session on different workers are not serialized (see the README).
+    """
+
+    def __init__(self, timeout=SESSION_LOCK_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._locks = {}   # session_id -> [lock, holders and waiters]
+        self._lock = threading.Lock()
+
+    def _enter(self, session_id):
+        with self._lock:
+            entry = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        return entry
+
+    def _leave(self, session_id, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    def acquire(self, session_id):
+        """Wait for the session's lock; returns a release() that is safe to
+        call more than once. Raises SessionBusy after the timeout."""
+        entry = self._enter(session_id)
+        started = time.monotonic()
+        acquired = entry[0].acquire(timeout=self.timeout)
+        LOCK_WAIT_SECONDS.observe(time.monotonic() - started)
+        if not acquired:
+            self._leave(session_id, entry)
+            raise SessionBusy(session_id)
+        return self._releaser(session_id, entry)
+
+    async def acquire_async(self, session_id):
+        """acquire() for the event loop. The lock is tried between short
+        sleeps, so a waiting turn holds no thread."""
+        entry = self._enter(session_id)
+        started = time.monotonic()
+        delay = 0.001
+        try:
+            while not entry[0].acquire(blocking=False):
+                if time.monotonic() - started >= self.timeout:
+                    raise SessionBusy(session_id)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LOCK_POLL_SECONDS)
+        except BaseException:
+            # Timed out or cancelled while waiting
+            LOCK_WAIT_SECONDS.observe(time.monotonic() - started)
+            self._leave(session_id, entry)
+            raise
+        LOCK_WAIT_SECONDS.observe(time.monotonic() - started)
+        return self._releaser(session_id, entry)
+
+    def _releaser(self, session_id, entry):
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                entry[0].release()
+                self._leave(session_id, entry)
+        return release
+
+    @contextmanager
+    def hold(self, session_id):
+        release = self.acquire(session_id)
+        try:
+            yield
+        finally:
+            release()
+
+    @asynccontextmanager
+    async def hold_async(self, session_id):
+        release = await self.acquire_async(session_id)
+        try:
+            yield
+        finally:
+            release()
+
+    def __len__(self):
+        return len(self._locks)
+
+
+def replayed_reply(state, key):
+    """The payload already returned for an idempotency key, or None"""
+    if not key:
+        return None
+    for stored_key, payload in state.get('replies', ()):
+        if stored_key == key:
+            return payload
+    return None
+
+
+def remember_reply(state, key, payload):
+    """Keep a turn's payload in the session so a retry with the same key gets it back"""
+    if key and IDEMPOTENT_REPLIES > 0:
+        state['replies'] = (state.get('replies', []) + [[key, payload]])[-IDEMPOTENT_REPLIES:]
+
+
+def serialize_state(state):
+    """Compact binary form of a session state (minified JSON, zlib level 1)"""
+    raw = json.dumps(state, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return zlib.compress(raw, 1)
+
+
+def deserialize_state(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class InMemorySessionStore:
+    """Per-process store with TTL, LRU eviction and a total size cap.
+
+    States are kept serialized so the size cap counts real bytes and idle
+    sessions stay small. Only suitable for a single worker process.
+    """
+
+    def __init__(self, ttl=7200, max_sessions=5000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()   # session_id -> (expires_at, blob)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            item = self._data.get(session_id)
+            if item is None:
+                return None
+            expires_at, blob = item
+            if expires_at <= time.monotonic():
+                self._remove(session_id)
+                return None
+            self._data.move_to_end(session_id)
+        return deserialize_state(blob)
+
+    def save(self, session_id, state):
+        blob = serialize_state(state)
+        with self._lock:
+            self._remove(session_id)
+            self._data[session_id] = (time.monotonic() + self.ttl, blob)
+            self._bytes += len(blob)
+            self._evict()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._remove(session_id)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, session_id):
+        item = self._data.pop(session_id, None)
+        if item is not None:
+            self._bytes -= len(item[1])
+
+    def _evict(self):
+        # Expired sessions first, then least recently used ones over the caps
+        now = time.monotonic()
+        for session_id in [s for s, (exp, _) in self._data.items() if exp <= now]:
+            self._remove(session_id)
+        while self._data and (len(self._data) > self.max_sessions or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._data)))
+
+
+class SQLiteSessionStore:
+    """Store shared by all workers on one host, in a WAL-mode SQLite file.
+
+    Each worker (and thread) opens its own connection; WAL lets readers and
+    the single writer proceed concurrently.
+    """
+
+    PRUNE_EVERY = 50  # saves between eviction passes
+
+    def __init__(self, path, ttl=7200, max_sessions=5000, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._saves = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'id TEXT PRIMARY KEY, data BLOB NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)')
+
+    def _connect(self):
+        # Connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT data FROM sessions WHERE id = ? AND accessed > ?',
+            (session_id, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE sessions SET accessed = ? WHERE id = ?', (now, session_id))
+        return deserialize_state(row[0])
+
+    def save(self, session_id, state):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (id, data, accessed) VALUES (?, ?, ?)',
+            (session_id, serialize_state(state), time.time())
+        )
+        self._saves += 1
+        if self._saves % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, session_id):
+        self._connect().execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def prune(self):
+        """Drop expired sessions, then the least recently used ones over the caps"""
+        conn = self._connect()
+        conn.execute('DELETE FROM sessions WHERE accessed <= ?', (time.time() - self.ttl,))
+        count, total = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions'
+        ).fetchone()
+        if count <= self.max_sessions and total <= self.max_bytes:
+            return
+        # Walk from most to least recent and keep what fits under both caps
+        kept, size, cutoff = 0, 0, None
+        for accessed, length in conn.execute(
+                'SELECT accessed, LENGTH(data) FROM sessions ORDER BY accessed DESC'):
+            if kept + 1 > self.max_sessions or size + length > self.max_bytes:
+                cutoff = accessed
+                break
+            kept += 1
+            size += length
+        if cutoff is not None:
+            conn.execute('DELETE FROM sessions WHERE accessed <= ?', (cutoff,))
+
+
+def default_backend():
+    """'sqlite' when gunicorn will run several workers (WEB_CONCURRENCY > 1),
+    since per-process memory stores would split a session's history"""
+    try:
+        workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    except ValueError:
+        workers = 1
+    return 'sqlite' if workers > 1 else 'memory'
+
+
+def create_session_store():
+    """Build the session store selected by SESSION_BACKEND ('memory' or 'sqlite')"""
+    backend = (os.getenv('SESSION_BACKEND') or default_backend()).lower()
+    ttl = int(os.getenv('SESSION_TTL_SECONDS', '7200'))
+    max_sessions = int(os.getenv('SESSION_MAX_COUNT', '5000'))
+    max_bytes = int(os.getenv('SESSION_MAX_BYTES', str(64 * 1024 * 1024)))
+
+    if backend == 'sqlite':
+        path = os.getenv('SESSION_DB_PATH', os.path.join(tempfile.gettempdir(), 'form_assistant_sessions.db'))
+        return SQLiteSessionStore(path, ttl=ttl, max_sessions=max_sessions, max_bytes=max_bytes)
+    if backend != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return InMemorySessionStore(ttl=ttl, max_sessions=max_sessions, max_bytes=max_bytes)
@@ -0,0 +1,105 @@
+# Pre-rendered pages: the form templates are rendered once per worker, kept
+# in memory with gzip (and brotli, when installed) variants, and served with
+# strong ETags so repeat visits get a 304 instead of 16-78 KB of HTML
+
+import gzip
+import hashlib
+import os
+from collections import namedtuple
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:     # optional: without it only gzip is offered
+    brotli = None
+
+# STATIC_PAGES=0 renders every hit (handy while editing templates)
+STATIC_PAGES = os.getenv('STATIC_PAGES', '1') != '0'
+# Pages live at fixed URLs, so browsers revalidate them after this long;
+# the content hash in the ETag makes that a 304 until the HTML changes
+PAGE_MAX_AGE_SECONDS = int(os.getenv('PAGE_MAX_AGE_SECONDS', '600'))
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Preferred first when the client accepts several
+ENCODINGS = ('br', 'gzip')
+
+# bodies and etags map a content coding ('identity', 'gzip', 'br') to the
+# encoded HTML and its ETag (unquoted; each representation gets its own)
+Page = namedtuple('Page', ['bodies', 'etags'])
+
+
+def build_page(html):
+    """Encode a rendered page once: identity, gzip and (if available) brotli"""
+    raw = html.encode('utf-8')
+    digest = hashlib.sha256(raw).hexdigest()[:20]
+    bodies = {'identity': raw}
+    if len(raw) >= MIN_COMPRESS_BYTES:
+        # mtime=0 keeps the gzip bytes identical across workers and restarts
+        bodies['gzip'] = gzip.compress(raw, GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(raw, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+    etags = {coding: digest if coding == 'identity' else f'{digest}-{coding}' for coding in bodies}
+    return Page(bodies, etags)
+
+
+def _coding(page):
+    accepted = request.accept_encodings
+    for coding in ENCODINGS:
+        if coding in page.bodies and accepted[coding] > 0:
+            return coding
+    return 'identity'
+
+
+def page_response(page):
+    """The page in the best encoding the client accepts, or a 304"""
+    coding = _coding(page)
+    headers = {
+        'Cache-Control': f'public, max-age={PAGE_MAX_AGE_SECONDS}, must-revalidate',
+        'Vary': 'Accept-Encoding',
+        'ETag': f'"{page.etags[coding]}"'
+    }
+    # Any representation of the same content is still fresh for this client
+    if request.if_none_match and any(request.if_none_match.contains(tag) for tag in page.etags.values()):
+        return Response(status=304, headers=headers)
+    if coding != 'identity':
+        headers['Content-Encoding'] = coding
+    return Response(page.bodies[coding], mimetype='text/html', headers=headers)
+
+
+class StaticPages:
+    """Rendered pages keyed by template and context.
+
+    render is flask.render_template. Only contexts passed to preload() are
+    cached, so a page whose variables come from the query string can't grow
+    the cache; anything else is rendered per request as before.
+    """
+
+    def __init__(self, render, enabled=STATIC_PAGES):
+        self.render = render
+        self.enabled = enabled
+        self._pages = {}
+
+    @staticmethod
+    def _key(template, context):
+        return (template,) + tuple(sorted(context.items()))
+
+    def preload(self, template, **context):
+        """Render and encode a page now (call inside an app context)"""
+        if self.enabled:
+            self._pages[self._key(template, context)] = build_page(self.render(template, **context))
+
+    def serve(self, template, **context):
+        page = self._pages.get(self._key(template, context))
+        if page is None:
+            return self.render(template, **context)
+        return page_response(page)
+
+    def stats(self):
+        return {
+            'pages': len(self._pages),
+            'bytes': sum(len(body) for page in self._pages.values() for body in page.bodies.values())
+        }
@@ -0,0 +1,221 @@
+# Structured logging: levelled JSON (or text) records tagged with a per-request
+# correlation ID, request-level sampling of DEBUG/INFO output, redaction of
+# financial identifiers, and a queue so request threads never wait on stdout
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from form_specs import FORM_SPECS
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'json' (one object per line, for log collectors) or 'text' (for terminals)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# Fraction of requests whose DEBUG and INFO records are kept; warnings and
+# errors are always kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+# Mask account numbers, Aadhaar, PAN, mobile numbers etc. (LOG_REDACT=0 turns it off)
+LOG_REDACT = os.getenv('LOG_REDACT', '1') != '0'
+# Records waiting for the writer thread; beyond this they are dropped, not waited on
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Chatty third-party loggers (one INFO line per HTTP call) are held to WARNING
+QUIET_LOGGERS = ('httpx', 'httpcore', 'openai', 'urllib3', 'google', 'werkzeug')
+
+# Field kinds whose values identify a person or an account
+SENSITIVE_KINDS = frozenset({'account_number', 'customer_id', 'aadhaar', 'pan', 'mobile', 'dob'})
+SENSITIVE_KEYS = frozenset(
+    field.key for spec in FORM_SPECS.values() for field in spec.fields
+    if field.kind in SENSITIVE_KINDS
+)
+
+# PANs, and runs of 9+ digits (account, Aadhaar, mobile, customer ID),
+# optionally grouped with spaces or dashes as people type them
+_PAN_RE = re.compile(r'\b[A-Z]{5}[0-9]{4}[A-Z]\b', re.IGNORECASE)
+_LONG_NUMBER_RE = re.compile(r'(?<![\d])\d(?:[ -]?\d){8,}(?![\d])')
+_REQUEST_ID_RE = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_sampled = contextvars.ContextVar('log_sampled', default=True)
+
+_listener = None
+_queue = None
+_dropped = 0
+_lock = threading.Lock()
+
+
+def mask(value):
+    """Keep only the last four characters of an identifier"""
+    text = str(value)
+    return '*' * max(len(text) - 4, 0) + text[-4:]
+
+
+def _mask_digits(match):
+    return mask(re.sub(r'[ -]', '', match.group()))
+
+
+def redact(text):
+    """text with PANs and long digit runs masked"""
+    if not LOG_REDACT:
+        return text
+    text = _PAN_RE.sub(lambda m: mask(m.group()), text)
+    return _LONG_NUMBER_RE.sub(_mask_digits, text)
+
+
+def redact_fields(fields):
+    """Copy of a structured-fields dict with sensitive values masked"""
+    if not LOG_REDACT:
+        return fields
+    clean = {}
+    for key, value in fields.items():
+        if key in SENSITIVE_KEYS and value not in (None, ''):
+            clean[key] = mask(value)
+        elif isinstance(value, dict):
+            clean[key] = redact_fields(value)
+        elif isinstance(value, str):
+            clean[key] = redact(value)
+        else:
+            clean[key] = value
+    return clean
+
+
+def start_request(request_id=None):
+    """Tag the current request's records with an ID and decide its sampling.
+
+    A well-formed incoming ID (e.g. an X-Request-ID header) is kept so logs
+    can be joined with the caller's; otherwise a fresh one is generated.
+    Returns the ID in use.
+    """
+    if not request_id or not _REQUEST_ID_RE.fullmatch(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _sampled.set(LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE)
+    return request_id
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds request_id to every record and drops unsampled low-level records"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks and leaves formatting to the writer thread.
+
+    Only the %-style message is rendered here (its arguments may change once
+    the request moves on); redaction and JSON encoding happen on the
+    listener thread. When the queue is full the record is dropped and counted.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        fields = getattr(record, 'fields', None)
+        if fields:
+            record.fields = dict(fields)
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', None),
+            'msg': redact(record.getMessage())
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(redact_fields(fields))
+        if record.exc_text:
+            entry['exc'] = redact(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = (f"{self.formatTime(record)} {record.levelname:7s} "
+                f"[{getattr(record, 'request_id', None) or '-'}] {record.name}: "
+                f"{redact(record.getMessage())}")
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in redact_fields(fields).items())
+        if record.exc_text:
+            line += '\n' + redact(record.exc_text)
+        return line
+
+
+def _start_listener():
+    global _listener, _queue
+    _queue = queue.Queue(LOG_QUEUE_SIZE)
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+    _listener = logging.handlers.QueueListener(_queue, writer)
+    _listener.start()
+    return _queue
+
+
+def _restart_after_fork():
+    # The writer thread doesn't survive fork(); give the child its own
+    if _listener is not None:
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, QueueingHandler):
+                handler.queue = _start_listener()
+
+
+def configure_logging():
+    """Route all logging through the queue to stdout; safe to call repeatedly"""
+    with _lock:
+        if _listener is not None:
+            return
+        handler = QueueingHandler(_start_listener())
+        handler.addFilter(RequestContextFilter())
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(LOG_LEVEL)
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(max(root.level, logging.WARNING))
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records (called at interpreter exit)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_log_stats():
+    return {'queued': _queue.qsize() if _queue else 0, 'dropped': _dropped}
@@ -0,0 +1,108 @@
+# Tests for amount_words: a hand-checked reference table and a round-trip
+# property against an independent words-to-number parser
+#
+# Run from the project root:  python -m pytest tests
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amount_words import (amount_to_words, amounts_to_words, denomination_rows,  # noqa: E402
+                          fill_amount_words, number_to_words)
+
+# Hand-checked reference values
+REFERENCE = {
+    0: 'Zero',
+    7: 'Seven',
+    15: 'Fifteen',
+    40: 'Forty',
+    99: 'Ninety Nine',
+    100: 'One Hundred',
+    105: 'One Hundred Five',
+    1000: 'One Thousand',
+    5000: 'Five Thousand',
+    56100: 'Fifty Six Thousand One Hundred',
+    99999: 'Ninety Nine Thousand Nine Hundred Ninety Nine',
+    100000: 'One Lakh',
+    250000: 'Two Lakh Fifty Thousand',
+    490000: 'Four Lakh Ninety Thousand',
+    1234567: 'Twelve Lakh Thirty Four Thousand Five Hundred Sixty Seven',
+    10000000: 'One Crore',
+    123456789: 'Twelve Crore Thirty Four Lakh Fifty Six Thousand Seven Hundred Eighty Nine',
+    10000000000: 'One Thousand Crore',
+}
+
+_UNITS = {'Hundred': 100, 'Thousand': 1000, 'Lakh': 100000, 'Crore': 10000000}
+_SMALL = {}
+for _i, _w in enumerate(('Zero One Two Three Four Five Six Seven Eight Nine Ten Eleven Twelve Thirteen '
+                         'Fourteen Fifteen Sixteen Seventeen Eighteen Nineteen').split()):
+    _SMALL[_w] = _i
+for _i, _w in enumerate('Twenty Thirty Forty Fifty Sixty Seventy Eighty Ninety'.split(), 2):
+    _SMALL[_w] = _i * 10
+
+
+def words_to_number(words):
+    """Independent inverse of number_to_words, used as the property oracle"""
+    total, group = 0, 0
+    for word in words.split():
+        if word in _SMALL:
+            group += _SMALL[word]
+        elif word == 'Hundred':
+            group *= 100
+        elif word == 'Crore':
+            # Everything so far (including thousands/lakhs) counts in crores
+            total = (total + group) * _UNITS[word]
+            group = 0
+        else:
+            total += group * _UNITS[word]
+            group = 0
+    return total + group
+
+
+@pytest.mark.parametrize('number, expected', sorted(REFERENCE.items()))
+def test_reference_table(number, expected):
+    assert number_to_words(number) == expected
+
+
+@pytest.mark.parametrize('amount, suffix, expected', [
+    ('5,000', 'Rupees', 'Five Thousand Rupees'),
+    ('5000', 'Only', 'Five Thousand Only'),
+    ('1500.5', 'Rupees', 'One Thousand Five Hundred Rupees and Fifty Paise'),
+    ('1500.50', 'Only', 'One Thousand Five Hundred Rupees and Fifty Paise Only'),
+    ('₹ 2,50,000', 'Rupees', 'Two Lakh Fifty Thousand Rupees'),
+    ('Rs. 100', 'Rupees', 'One Hundred Rupees'),
+    ('abc', 'Rupees', None),
+    ('', 'Rupees', None),
+])
+def test_amount_to_words(amount, suffix, expected):
+    assert amount_to_words(amount, suffix) == expected
+
+
+def test_round_trip_property():
+    rng = random.Random(1234)
+    for _ in range(20000):
+        n = rng.randrange(0, 10 ** rng.randint(1, 12))
+        words = number_to_words(n)
+        assert words_to_number(words) == n, f'{n} -> {words!r}'
+        assert '  ' not in words and words == words.strip()
+
+
+def test_amounts_to_words_matches_amount_to_words():
+    amounts = ['1000', '1000', '2,500.75', 'x', 7]
+    assert amounts_to_words(amounts, 'Only') == [amount_to_words(a, 'Only') for a in amounts]
+
+
+def test_denomination_rows():
+    rows, total = denomination_rows({'500': '2', '100': '', '10': 'x', 'coins': '7'})
+    assert rows == [('500', 2, 1000), ('coins', 7, 7)]
+    assert total == 1007
+
+
+def test_fill_amount_words():
+    data = {'total_amount': '1000'}
+    assert fill_amount_words('deposit', data) == ['amount_in_words']
+    assert data['amount_in_words'] == 'One Thousand Rupees'
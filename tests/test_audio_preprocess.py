@@ -0,0 +1,39 @@
+# Tests for audio_preprocess' voice activity detection (needs numpy)
+#
+# Run from the project root:  python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_preprocess import SAMPLE_RATE, speech_frames, trim_silence  # noqa: E402
+
+
+def clip(speech_seconds, silence_seconds, seed=0):
+    """A 220 Hz tone standing in for speech, then quiet noise"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(speech_seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t)
+    samples = np.concatenate([tone, np.zeros(int(silence_seconds * SAMPLE_RATE))])
+    return (samples + rng.normal(0, 0.001, len(samples))).astype(np.float32)
+
+
+def test_mostly_speech_clip_is_not_silent():
+    speech = speech_frames(clip(3.0, 0.1))
+    assert speech.mean() > 0.9
+    assert trim_silence(clip(3.0, 0.1)) is not None
+
+
+def test_noise_after_speech_is_not_speech():
+    speech = speech_frames(clip(1.0, 2.0))
+    assert speech[:30].all()
+    assert not speech[40:].any()
+
+
+def test_noise_alone_is_silent():
+    assert trim_silence(clip(0.0, 2.0)) is None
@@ -0,0 +1,85 @@
+# Tests for field_extractors' local validation of digit runs
+#
+# Run from the project root:  python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from field_extractors import extract_fields, is_valid_aadhaar  # noqa: E402
+
+VALID_AADHAAR = '234123412346'
+INVALID_AADHAAR = '234123412345'
+
+
+def test_landline_for_work_phone_is_left_to_the_model():
+    assert extract_fields('022-98765432', 'loan_application', 'What is your work phone number?') == ({}, [])
+
+
+def test_landline_variants_are_one_token():
+    for message in ('(022) 98765432', '0124 2345678', 'office: 080-23456789'):
+        assert extract_fields(message, 'loan_application', 'Your landline number?') == ({}, []), message
+
+
+def test_landline_next_to_mobile_keeps_the_mobile():
+    fields, problems = extract_fields('0124 2345678 and 9876543210', 'loan_application',
+                                      'Your landline and mobile numbers?')
+    assert fields == {'mobile_number': '9876543210'}
+    assert problems == []
+
+
+def test_document_number_is_not_checked_as_aadhaar():
+    assert extract_fields('1234 5678 9012', 'account_opening', "What is your selected document's number?") == ({}, [])
+
+
+def test_twelve_digits_without_aadhaar_cue_are_not_refused():
+    assert extract_fields(INVALID_AADHAAR, 'account_opening', 'What is the number on it?') == ({}, [])
+
+
+def test_invalid_aadhaar_is_refused_when_asked_for():
+    fields, problems = extract_fields(INVALID_AADHAAR, 'account_opening', 'Please share your Aadhaar number.')
+    assert fields == {}
+    assert len(problems) == 1 and 'Aadhaar' in problems[0]
+
+
+def test_valid_aadhaar_is_extracted():
+    assert is_valid_aadhaar(VALID_AADHAAR)
+    fields, problems = extract_fields(VALID_AADHAAR, 'account_opening', 'Please share your Aadhaar number.')
+    assert fields == {'iin': VALID_AADHAAR}
+    assert problems == []
+
+
+def test_short_mobile_is_refused_when_asked_for():
+    fields, problems = extract_fields('98765432', 'loan_application', 'What is your mobile number?')
+    assert fields == {}
+    assert len(problems) == 1 and '8 digits' in problems[0]
+
+
+def test_mobile_formats():
+    for message in ('9876543210', '+91 98765 43210', '98765-43210'):
+        fields, problems = extract_fields(message, 'loan_application', 'What is your mobile number?')
+        assert fields == {'mobile_number': '9876543210'}, message
+        assert problems == []
+
+
+def test_account_number_length_is_checked():
+    fields, problems = extract_fields('account 12345678901234', 'deposit', 'Your account number?')
+    assert fields == {}
+    assert len(problems) == 1 and '12 digits' in problems[0]
+    fields, problems = extract_fields('123456789012', 'deposit', 'Your account number?')
+    assert fields == {'account_number': '123456789012'}
+    assert problems == []
+
+
+def test_mobile_with_leading_zero_is_normalized():
+    fields, problems = extract_fields('My mobile is 09876543210', 'loan_application', 'What is your mobile number?')
+    assert fields == {'mobile_number': '9876543210'}
+    assert problems == []
+
+
+def test_mobile_like_number_is_not_taken_unless_asked_for():
+    fields, problems = extract_fields('9876543210', 'loan_application', 'What is your account number?')
+    assert fields == {'account_number': '9876543210'}
+    assert problems == []
+    assert extract_fields('9876543210', 'loan_application', 'What is your name?') == ({}, [])
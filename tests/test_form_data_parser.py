@@ -0,0 +1,145 @@
+# Tests for form_data_parser and the streaming parser built on it
+#
+# Run from the project root:  python -m pytest tests
+
+import json
+import os
+import random
+import re
+import string
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from form_data_parser import BLOCK_MARKERS, BraceScanner, parse_response  # noqa: E402
+from form_data_stream import FormDataStreamParser  # noqa: E402
+
+SAMPLE = {
+    'form_type': 'DEPOSIT', 'branch_name': 'Main {Branch}', 'account_number': '123456789012',
+    'note': 'quote " and backslash \\ and }} braces', 'total_amount': '1000',
+    'denomination_breakdown': {'500': 2, 'coins': 0}
+}
+
+
+def escape_braces(text):
+    """Prompt-style {{ }} escaping, as models copy it from the prompt"""
+    out = []
+    for token in re.findall(r'"(?:\\.|[^"\\])*"|.', text, re.DOTALL):
+        out.append(token * 2 if token in '{}' else token)
+    return ''.join(out)
+
+
+def wrappings(data):
+    payload = json.dumps(data, ensure_ascii=False)
+    yield '{{FORM_DATA: ' + escape_braces(payload) + '}}'
+    yield '{FORM_DATA: ' + payload + '}'
+    yield '{{FORM_DATA: ' + payload + '}}'
+    yield '```json\n' + payload + '\n```'
+    yield '```json\n{{FORM_DATA: ' + escape_braces(payload) + '}}\n```'
+
+
+def random_value(rng, depth=0):
+    if depth < 2 and rng.random() < 0.2:
+        return {random_text(rng, 6): random_value(rng, depth + 1) for _ in range(rng.randint(1, 3))}
+    if rng.random() < 0.2:
+        return rng.randint(0, 10 ** 6)
+    return random_text(rng, rng.randint(0, 20))
+
+
+def random_text(rng, length):
+    alphabet = string.ascii_letters + string.digits + ' {}"\\:,₹\n'
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def chunks(text, rng, longest=40):
+    """text in random pieces of up to longest characters, as a model streams it"""
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, longest)
+        yield text[i:i + size]
+        i += size
+
+
+@pytest.mark.parametrize('wrapped', list(wrappings(SAMPLE)))
+def test_every_wrapping_of_the_sample_decodes(wrapped):
+    before, after = 'Perfect! Your form is ready.\n', '\nAnything else?'
+    parsed = parse_response(before + wrapped + after)
+    assert parsed.form_data == SAMPLE
+    assert parsed.text == (before + after).strip()
+
+
+def test_bare_object_with_branch_name():
+    assert parse_response('Here: {"branch_name": "X", "amount": "5"}').form_data == {'branch_name': 'X', 'amount': '5'}
+
+
+def test_no_block():
+    assert parse_response('no data here').form_data is None
+
+
+def test_trailing_comma_is_repaired():
+    assert parse_response('```json\n{"a": 1,}\n```').form_data == {'a': 1}
+
+
+def test_array_payload_is_refused():
+    assert parse_response('{FORM_DATA: [1, 2]}').form_data is None
+
+
+def test_truncated_block_is_dropped():
+    truncated = parse_response('Done. {{FORM_DATA: {{"a": "b"')
+    assert truncated.form_data is None
+    assert truncated.error
+    assert truncated.text == 'Done.'
+
+
+def test_any_object_survives_every_wrapping_whole_or_streamed():
+    rng = random.Random(7)
+    for _ in range(500):
+        data = {random_text(rng, 8): random_value(rng) for _ in range(rng.randint(1, 6))}
+        prefix = random_text(rng, 30).replace('{', '').replace('`', '')
+        for wrapped in wrappings(data):
+            text = prefix + wrapped + ' end'
+            parsed = parse_response(text)
+            assert parsed.form_data == data, (wrapped, parsed)
+
+            stream = FormDataStreamParser()
+            events = [event for chunk in chunks(text, rng) for event in stream.feed(chunk)]
+            events += stream.close()
+            blocks = [t for kind, t in events if kind == 'form_data']
+            assert blocks == [wrapped], (blocks, wrapped)
+
+
+def test_scanner_gives_the_same_close_whole_or_streamed():
+    rng = random.Random(5)
+    for _ in range(5000):
+        text = '{' + ''.join(rng.choice('{}"\\ a,:') for _ in range(rng.randint(1, 40)))
+        whole = BraceScanner().feed(text)
+        scanner, offset, streamed = BraceScanner(), 0, -1
+        for chunk in chunks(text, rng, longest=5):
+            close = scanner.feed(chunk)
+            if close != -1:
+                streamed = offset + close
+                break
+            offset += len(chunk)
+        assert whole == streamed, text
+
+
+def test_malformed_output_never_raises_or_leaks_a_marker():
+    rng = random.Random(99)
+    base = list(wrappings(SAMPLE))
+    for _ in range(5000):
+        text = list('Summary ✓\n' + rng.choice(base) + '\nThanks')
+        for _ in range(rng.randint(1, 6)):
+            op = rng.random()
+            pos = rng.randrange(len(text) + 1)
+            if op < 0.4 and text:
+                del text[min(pos, len(text) - 1)]
+            elif op < 0.8:
+                text.insert(pos, rng.choice('{}"\\:,` '))
+            else:
+                text = text[:pos]
+        text = ''.join(text)
+        parsed = parse_response(text)
+        assert parsed.form_data is None or isinstance(parsed.form_data, dict)
+        assert not any(marker in parsed.text for marker in BLOCK_MARKERS), text
@@ -0,0 +1,44 @@
+# Tests for the prompts generated from form_specs
+#
+# Run from the project root:  python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from form_prompts import get_system_prompt  # noqa: E402
+from form_specs import FORM_SPECS  # noqa: E402
+
+# Characters in each form's hand-written system prompt before the prompts
+# were generated from specs; a generated prompt must not be longer
+HAND_WRITTEN_PROMPT_CHARS = {
+    'deposit': 2769,
+    'dd': 2732,
+    'tax_challan': 3069,
+    'account_opening': 3868,
+    'debit_card': 3102,
+    'loan_application': 3540,
+    'withdrawal': 2819,
+    'kyc': 3271,
+    'account_closure': 6962,
+    'remittance': 5978,
+}
+
+
+def test_every_form_has_a_baseline():
+    assert set(HAND_WRITTEN_PROMPT_CHARS) == set(FORM_SPECS)
+
+
+@pytest.mark.parametrize('form_type', sorted(HAND_WRITTEN_PROMPT_CHARS))
+def test_prompt_is_no_larger_than_the_hand_written_one(form_type):
+    assert len(get_system_prompt(form_type)) <= HAND_WRITTEN_PROMPT_CHARS[form_type]
+
+
+@pytest.mark.parametrize('form_type', sorted(FORM_SPECS))
+def test_prompt_names_every_form_data_key(form_type):
+    prompt = get_system_prompt(form_type)
+    for field in FORM_SPECS[form_type].fields:
+        assert f'"{field.key}":' in prompt, field.key
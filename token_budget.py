@@ -0,0 +1,167 @@
+# Per-turn token budgets: the phase of the conversation decides how many
+# tokens the model may generate and how hard it may reason
+#
+#   question  asking for the next field(s): a short reply, low reasoning
+#   summary   all fields collected, listing them for confirmation
+#   final     the user was just asked to confirm: the reply carries the
+#             FORM_DATA JSON, so it gets the most room and more reasoning
+
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from form_prompts import estimate_tokens, get_form_data_format
+from form_specs import FORM_SPECS
+from metrics import Counter, Histogram
+
+# Output caps (reasoning tokens included); summary and final grow with the
+# size of the form's FORM_DATA so long forms are never cut off
+QUESTION_MAX_TOKENS = int(os.getenv('QUESTION_MAX_TOKENS', '1024'))
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', '1024'))
+FINAL_MAX_TOKENS = int(os.getenv('FINAL_MAX_TOKENS', '2048'))
+# Reasoning effort for the FORM_DATA turn; the other phases always use 'low'
+FINAL_REASONING_EFFORT = os.getenv('FINAL_REASONING_EFFORT', 'medium')
+# Context window of the chat model (gpt-oss-120b); caps shrink to fit
+MODEL_CONTEXT_TOKENS = int(os.getenv('MODEL_CONTEXT_TOKENS', '131072'))
+# Role/formatting tokens added per message by the chat template
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# The question the prompt tells the model to end its summary with
+CONFIRMATION_QUESTION = 'Are all these details correct'
+
+PHASES = ('question', 'summary', 'final')
+
+# phase: one of PHASES; input_tokens: estimated prompt size;
+# max_output_tokens: cap for the reply; reasoning_effort: 'low' or higher
+Budget = namedtuple('Budget', ['phase', 'form_type', 'input_tokens', 'max_output_tokens', 'reasoning_effort'])
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+TURN_TOKENS = Histogram(
+    'mrv_turn_tokens', 'Tokens per model reply, by conversation phase',
+    ('provider', 'phase', 'kind'), buckets=TOKEN_BUCKETS)
+TRUNCATIONS = Counter(
+    'mrv_budget_truncations_total', 'Replies that hit their output cap and were retried with a larger one',
+    ('provider', 'phase'))
+
+
+def estimate_messages_tokens(messages):
+    """Estimated prompt tokens of OpenAI-style chat messages"""
+    return sum(estimate_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+@lru_cache(maxsize=64)
+def _form_tokens(form_type):
+    spec = FORM_SPECS.get(form_type)
+    return estimate_tokens(get_form_data_format(spec)) if spec else 0
+
+
+def _expected_questions(spec):
+    """How many answers the user gives before the summary, at the least"""
+    if spec.groups:
+        return len(spec.groups)
+    return sum(1 for f in spec.fields if f.label and not (f.auto or f.optional or f.when))
+
+
+def conversation_phase(form_type, history):
+    """Phase of the reply about to be generated; history ends with the user's message"""
+    user_turns = 0
+    last_model = ''
+    for msg in history:
+        if msg['role'] == 'user':
+            user_turns += 1
+        else:
+            last_model = msg['parts'][0]
+    if CONFIRMATION_QUESTION in last_model:
+        return 'final'
+    spec = FORM_SPECS.get(form_type)
+    if spec is not None and user_turns > _expected_questions(spec):
+        return 'summary'
+    return 'question'
+
+
+def _budget(phase, form_type, input_tokens):
+    form_tokens = _form_tokens(form_type)
+    if phase == 'final':
+        cap, effort = FINAL_MAX_TOKENS + 3 * form_tokens, FINAL_REASONING_EFFORT
+    elif phase == 'summary':
+        cap, effort = SUMMARY_MAX_TOKENS + 2 * form_tokens, 'low'
+    else:
+        cap, effort = QUESTION_MAX_TOKENS, 'low'
+    cap = max(min(cap, MODEL_CONTEXT_TOKENS - input_tokens), 1)
+    return Budget(phase, form_type, input_tokens, cap, effort)
+
+
+def plan_budget(form_type, history, messages=None, input_tokens=None):
+    """Budget for the next reply. Pass the chat messages about to be sent,
+    or an input_tokens estimate when the prompt is in another format."""
+    if input_tokens is None:
+        input_tokens = estimate_messages_tokens(messages or [])
+    return _budget(conversation_phase(form_type, history), form_type, input_tokens)
+
+
+def escalate(budget):
+    """The next larger budget after a reply hit its cap, or None at the top"""
+    index = PHASES.index(budget.phase)
+    if index + 1 >= len(PHASES):
+        return None
+    return _budget(PHASES[index + 1], budget.form_type, budget.input_tokens)
+
+
+def openrouter_params(budget):
+    """Request arguments that apply a budget to an OpenRouter call"""
+    return {
+        'max_tokens': budget.max_output_tokens,
+        # The reasoning text itself is never shown, so don't send it back
+        'extra_body': {'reasoning': {'effort': budget.reasoning_effort, 'exclude': True}}
+    }
+
+
+def groq_params(budget):
+    """Request arguments that apply a budget to a Groq call"""
+    return {
+        'max_completion_tokens': budget.max_output_tokens,
+        # Sent as extra_body so older SDK versions without these arguments still work
+        'extra_body': {'reasoning_effort': budget.reasoning_effort, 'include_reasoning': False}
+    }
+
+
+def gemini_params(budget):
+    """generation_config entries that apply a budget to a Gemini call"""
+    return {'max_output_tokens': budget.max_output_tokens}
+
+
+def _field(obj, name):
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def record_turn_usage(provider, budget, usage):
+    """Observe a reply's token counts and return them for the /chat payload.
+
+    usage is an OpenAI-style usage object (or a Gemini usage_metadata), or
+    None when the provider didn't report one.
+    """
+    prompt = _field(usage, 'prompt_tokens') or _field(usage, 'prompt_token_count')
+    completion = _field(usage, 'completion_tokens') or _field(usage, 'candidates_token_count')
+    reasoning = _field(_field(usage, 'completion_tokens_details'), 'reasoning_tokens') \
+        or _field(usage, 'thoughts_token_count')
+    report = {
+        'phase': budget.phase,
+        'estimated_input_tokens': budget.input_tokens,
+        'max_output_tokens': budget.max_output_tokens,
+        'prompt_tokens': prompt,
+        'completion_tokens': completion,
+        'reasoning_tokens': reasoning
+    }
+    TURN_TOKENS.observe(budget.input_tokens, provider=provider, phase=budget.phase, kind='estimated_input')
+    for kind in ('prompt', 'completion', 'reasoning'):
+        if report[f'{kind}_tokens'] is not None:
+            TURN_TOKENS.observe(report[f'{kind}_tokens'], provider=provider, phase=budget.phase, kind=kind)
+    return report
+
+
+def count_truncation(provider, budget):
+    TRUNCATIONS.inc(provider=provider, phase=budget.phase)